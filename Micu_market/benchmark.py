@@ -0,0 +1,335 @@
+"""Time the hot views through the test client on the benchmark data (Micu_market/benchmark_data.py).
+
+Each case is requested a few times to warm the process caches, then `repeat`
+times measured: wall time per request (p50/p95) and the number of SQL
+queries. Results are written as JSON, one file per run, and can be compared
+with an earlier run.
+
+run_connection_benchmark() times the database side of a request on its own
+(connect if needed, the queries, release) with a new connection per request,
+persistent connections and the psycopg 3 pool.
+"""
+import json
+import platform
+import statistics
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from urllib.parse import urlencode
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, connections
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from categories.models import Category
+from chat.models import Conversation
+from listings.models import Listing
+from .benchmark_data import VIEWER_USERNAME
+from .query_budget import count_queries
+
+User = get_user_model()
+
+
+@dataclass
+class Case:
+    name: str
+    url: str
+    logged_in: bool = False
+
+
+@dataclass
+class CaseResult:
+    name: str
+    url: str
+    logged_in: bool
+    status: int
+    p50_ms: float
+    p95_ms: float
+    mean_ms: float
+    max_ms: float
+    queries: int
+    # more than one value means the count depends on the request, e.g. a cache refill
+    query_counts: list = field(default_factory=list)
+
+
+def benchmark_cases(viewer):
+    """The requests to time, with parameters picked from the data (same data, same URLs)."""
+    listing_url = reverse('listings:list')
+
+    def listings(**params):
+        return f'{listing_url}?{urlencode(params)}' if params else listing_url
+
+    active = Listing.objects.filter(status='active')
+    root = Category.objects.filter(parent=None, is_active=True).order_by('order', 'id').first()
+    leaf = Category.objects.filter(is_active=True, subcategories__isnull=True).order_by('id').first()
+    city = active.order_by().values('city').annotate(n=Count('id')).order_by('-n', 'city').values_list('city', flat=True).first()
+    listing = active.exclude(owner=viewer).exclude(cover_image='').order_by('id').first()
+    conversation = (
+        Conversation.objects.filter(participants=viewer).annotate(n=Count('messages')).order_by('-n', 'id').first()
+    )
+
+    cases = [
+        Case('home', reverse('listings:home')),
+        Case('home_logged_in', reverse('listings:home'), logged_in=True),
+        Case('list', listings()),
+        Case('list_logged_in', listings(), logged_in=True),
+        Case('list_sort_oldest', listings(sort='created_at')),
+        Case('list_sort_price', listings(sort='price')),
+        Case('list_sort_price_desc', listings(sort='-price')),
+        Case('list_sort_title', listings(sort='title')),
+        Case('list_sort_title_page_50', listings(sort='title', page=50)),
+        Case('list_price_range', listings(min_price=100, max_price=1000)),
+        Case('list_condition', listings(condition='like_new')),
+        Case('list_seller', listings(seller=viewer.username)),
+        Case('list_search', listings(search='bicicleta')),
+        Case('list_search_sort_price', listings(search='bicicleta', sort='price')),
+    ]
+    if root is not None:
+        cases.append(Case('list_category', listings(category=root.slug)))
+    if leaf is not None:
+        cases.append(Case('list_subcategory', listings(category=leaf.slug)))
+    if city:
+        cases.append(Case('list_city', listings(city=city)))
+        cases.append(Case('list_city_radius', listings(city=city, radius=25)))
+    if listing is not None:
+        cases.append(Case('detail', reverse('listings:detail', args=[listing.slug])))
+        cases.append(Case('detail_logged_in', reverse('listings:detail', args=[listing.slug]), logged_in=True))
+    cases.append(Case('inbox', reverse('chat:inbox'), logged_in=True))
+    if conversation is not None:
+        cases.append(Case('conversation', reverse('chat:conversation', args=[conversation.pk]), logged_in=True))
+    cases.append(Case('user_reviews', reverse('reviews:user_reviews', args=[viewer.username])))
+    cases.append(Case('favorites', reverse('favorites:list'), logged_in=True))
+    return cases
+
+
+def percentile(values, p):
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method='inclusive')[p - 1]
+
+
+def time_case(client, case, repeat, warmup):
+    for _ in range(warmup):
+        client.get(case.url)
+    durations, query_counts = [], []
+    for _ in range(repeat):
+        with count_queries() as counter:
+            started = time.perf_counter()
+            response = client.get(case.url)
+            durations.append((time.perf_counter() - started) * 1000)
+        query_counts.append(len(counter))
+    return CaseResult(
+        name=case.name, url=case.url, logged_in=case.logged_in, status=response.status_code,
+        p50_ms=round(percentile(durations, 50), 2), p95_ms=round(percentile(durations, 95), 2),
+        mean_ms=round(statistics.fmean(durations), 2), max_ms=round(max(durations), 2),
+        queries=max(query_counts), query_counts=sorted(set(query_counts)),
+    )
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(repeat=20, warmup=3, page_cache=False, only=None, log=print):
+    """Time every case (or the ones named in `only`) and return the run as a dict."""
+    viewer = User.objects.get(username=VIEWER_USERNAME)
+    cases = [case for case in benchmark_cases(viewer) if not only or case.name in only]
+    anonymous, logged_in = Client(), Client()
+    logged_in.force_login(viewer)
+
+    overrides = {
+        'ALLOWED_HOSTS': [*settings.ALLOWED_HOSTS, 'testserver'],
+        # the budget middleware's own counting stays out of the timings
+        'QUERY_BUDGET': {'MODE': 'off'},
+    }
+    if not page_cache:
+        # the cached anonymous pages would time the cache, not the view
+        overrides['PAGE_CACHE'] = {'TIMEOUT': 0}
+
+    results = []
+    with override_settings(**overrides):
+        for case in cases:
+            result = time_case(logged_in if case.logged_in else anonymous, case, repeat, warmup)
+            log(f'{result.name:<28} {result.status}  p50 {result.p50_ms:8.1f} ms  p95 {result.p95_ms:8.1f} ms  {result.queries:3} queries')
+            results.append(result)
+
+    return {
+        'commit': git_commit(),
+        'created_at': timezone.now().isoformat(),
+        'database': connection.vendor,
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'repeat': repeat,
+        'warmup': warmup,
+        'page_cache': page_cache,
+        'rows': {
+            'users': User.objects.count(),
+            'listings': Listing.objects.count(),
+            'conversations': Conversation.objects.count(),
+        },
+        'cases': [asdict(result) for result in results],
+    }
+
+
+def write_results(run, path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(run, indent=2, ensure_ascii=False) + '\n', encoding='utf-8')
+
+
+def compare_runs(previous, current):
+    """Lines of per-case changes from `previous` to `current` (both run dicts)."""
+    before = {case['name']: case for case in previous['cases']}
+    lines = [f"{previous.get('commit') or '?'} -> {current.get('commit') or '?'}"]
+    for case in current['cases']:
+        old = before.get(case['name'])
+        if old is None:
+            lines.append(f"{case['name']:<28} new")
+            continue
+        change = (case['p50_ms'] - old['p50_ms']) / old['p50_ms'] * 100 if old['p50_ms'] else 0.0
+        queries = case['queries'] - old['queries']
+        lines.append(
+            f"{case['name']:<28} p50 {old['p50_ms']:8.1f} -> {case['p50_ms']:8.1f} ms ({change:+.0f}%)"
+            f"  p95 {old['p95_ms']:8.1f} -> {case['p95_ms']:8.1f} ms"
+            f"  queries {old['queries']} -> {case['queries']}{f' ({queries:+d})' if queries else ''}"
+        )
+    return lines
+
+
+@dataclass
+class ConnectionResult:
+    mode: str
+    requests: int
+    threads: int
+    p50_ms: float
+    p95_ms: float
+    mean_ms: float
+    max_ms: float
+    # distinct server processes (pg_backend_pid()) that answered, i.e. the connections opened
+    backends: int
+
+
+def connection_modes(settings_dict):
+    """The settings of a database for each way of connecting, derived from its configured ones."""
+    options = {name: value for name, value in settings_dict['OPTIONS'].items() if name != 'pool'}
+    max_age = settings_dict['CONN_MAX_AGE']
+    health_checks = settings_dict['CONN_HEALTH_CHECKS']
+    return {
+        # what every request did before CONN_MAX_AGE was set
+        'new': {**settings_dict, 'OPTIONS': options, 'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False},
+        'persistent': {
+            **settings_dict, 'OPTIONS': options,
+            'CONN_MAX_AGE': max_age if max_age != 0 else 600, 'CONN_HEALTH_CHECKS': health_checks,
+        },
+        'pool': {
+            **settings_dict, 'OPTIONS': {**options, 'pool': settings_dict['OPTIONS'].get('pool') or True},
+            'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': health_checks,
+        },
+    }
+
+
+def pool_available():
+    from django.db.backends.postgresql.psycopg_any import is_psycopg3
+
+    try:
+        import psycopg_pool  # noqa: F401
+    except ImportError:
+        return False
+    return is_psycopg3
+
+
+@contextmanager
+def extra_database(alias, settings_dict):
+    """`alias` in django.db.connections for the block, so connection_created handlers can look it up."""
+    connections.settings[alias] = settings_dict
+    try:
+        yield
+    finally:
+        if settings_dict['OPTIONS'].get('pool'):
+            connections[alias].close_pool()
+            del connections[alias]
+        del connections.settings[alias]
+
+
+def time_request_cycles(alias, requests, warmup, queries):
+    """Durations of `requests` database request cycles on this thread's connection to `alias`.
+
+    A cycle is what a request does with the database: close_old_connections()
+    (on request_started), `queries` queries, close_old_connections() again (on
+    request_finished), which closes the connection or returns it to the pool.
+    """
+    db = connections[alias]
+    durations, backends = [], set()
+    try:
+        for i in range(warmup + requests):
+            started = time.perf_counter()
+            db.close_if_unusable_or_obsolete()
+            with db.cursor() as cursor:
+                for _ in range(queries):
+                    cursor.execute('SELECT pg_backend_pid()')
+                    backends.add(cursor.fetchone()[0])
+            db.close_if_unusable_or_obsolete()
+            if i >= warmup:
+                durations.append((time.perf_counter() - started) * 1000)
+    finally:
+        db.close()
+        del connections[alias]
+    return durations, backends
+
+
+def run_connection_benchmark(requests=200, warmup=5, queries=1, threads=1, only=None, log=print):
+    """Time the request cycles of each connection mode on the default (PostgreSQL) database; the run as a dict."""
+    settings_dict = connections['default'].settings_dict
+    # the requests split over the threads, each with its own connection like a threaded server
+    per_thread = [requests // threads + (i < requests % threads) for i in range(threads)]
+    results = []
+    for mode, mode_settings in connection_modes(settings_dict).items():
+        if only and mode not in only:
+            continue
+        if mode == 'pool' and not pool_available():
+            log(f'{mode:<12} skipped: needs psycopg 3 and psycopg-pool')
+            continue
+        alias = f'benchmark_{mode}'
+        with extra_database(alias, mode_settings), ThreadPoolExecutor(max_workers=threads) as executor:
+            outcomes = list(executor.map(lambda count: time_request_cycles(alias, count, warmup, queries), per_thread))
+        durations = [duration for thread_durations, _ in outcomes for duration in thread_durations]
+        result = ConnectionResult(
+            mode=mode, requests=len(durations), threads=threads,
+            p50_ms=round(percentile(durations, 50), 3), p95_ms=round(percentile(durations, 95), 3),
+            mean_ms=round(statistics.fmean(durations), 3), max_ms=round(max(durations), 3),
+            backends=len(set().union(*(backends for _, backends in outcomes))),
+        )
+        log(f'{result.mode:<12} p50 {result.p50_ms:7.2f} ms  p95 {result.p95_ms:7.2f} ms  {result.backends:4} connections opened')
+        results.append(result)
+
+    baseline = next((result for result in results if result.mode == 'new'), None)
+    if baseline is not None:
+        for result in results:
+            if result is not baseline:
+                log(f'{result.mode:<12} saves {baseline.p50_ms - result.p50_ms:.2f} ms per request (p50) over a new connection')
+
+    return {
+        'commit': git_commit(),
+        'created_at': timezone.now().isoformat(),
+        'database': connections['default'].vendor,
+        'host': settings_dict['HOST'] or 'localhost',
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'requests': requests,
+        'warmup': warmup,
+        'queries': queries,
+        'threads': threads,
+        'modes': [asdict(result) for result in results],
+    }
@@ -0,0 +1,373 @@
+"""Deterministic synthetic data for the view benchmarks (Micu_market/benchmark.py).
+
+Everything is derived from one seed: the same seed and counts give the same
+rows, timestamps included, so runs on different commits see the same data.
+Rows are bulk-inserted; the side effects of the model signals that matter to
+the pages (profiles, category counters, cover images, profile statistics)
+are applied in bulk afterwards.
+"""
+import random
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.db.models import Avg, Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils.text import slugify
+
+from accounts.models import UserProfile
+from categories.counters import apply_listing_deltas
+from categories.models import Category
+from chat.models import Conversation, Message, MessageAttachment
+from favorites.models import Favorite
+from listings.models import Listing, ListingImage
+from listings.page_cache import bump_generation
+from locations.models import Locality
+from notifications.models import NotificationPreference
+from reviews.models import Review, ReviewResponse
+
+User = get_user_model()
+
+# full size, about what a national marketplace holds; --scale shrinks it for quick runs
+DEFAULT_COUNTS = {
+    'users': 50_000,
+    'listings': 200_000,
+    'messages': 2_000_000,
+    'favorites': 500_000,
+    'reviews': 500_000,
+}
+USERNAME_PREFIX = 'bench_'
+# the user the logged-in pages are measured as; picks are skewed towards low user numbers,
+# so this one has the most listings, conversations, favorites and reviews
+VIEWER_USERNAME = f'{USERNAME_PREFIX}0'
+PASSWORD = 'bench-parola-123'
+BASE_TIME = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+SPAN_DAYS = 365
+MESSAGES_PER_CONVERSATION = 20
+BATCH_SIZE = 5000
+
+FIRST_NAMES = ['Andrei', 'Maria', 'Ioana', 'Alexandru', 'Elena', 'Mihai', 'Ana', 'Cristian', 'Gabriela', 'Radu', 'Diana', 'Vlad', 'Irina', 'Bogdan', 'Simona']
+LAST_NAMES = ['Popescu', 'Ionescu', 'Popa', 'Dumitru', 'Stan', 'Stoica', 'Gheorghe', 'Matei', 'Ciobanu', 'Constantin', 'Mocanu', 'Barbu', 'Lungu', 'Munteanu']
+ITEMS = [
+    'Bicicletă', 'Telefon', 'Laptop', 'Canapea', 'Masă extensibilă', 'Scaun de birou', 'Frigider',
+    'Mașină de spălat', 'Geacă de iarnă', 'Cărucior', 'Televizor', 'Aparat foto', 'Chitară',
+    'Consolă', 'Bibliotecă', 'Trotinetă electrică', 'Cort', 'Set scule', 'Cuptor cu microunde', 'Pătuț',
+]
+DETAILS = ['nou', 'ca nou', 'puțin folosit', 'impecabil', 'cu garanție', 'vintage', 'pentru piese', 'la cutie', 'urgent', 'negociabil']
+SENTENCES = [
+    'Produsul este în stare foarte bună și funcționează perfect.',
+    'Se vinde din cauza mutării.',
+    'Prețul este ușor negociabil la fața locului.',
+    'Predare personală sau livrare prin curier pe cheltuiala cumpărătorului.',
+    'Are mici urme de utilizare, vizibile în poze.',
+    'Cumpărat acum un an, folosit foarte rar.',
+    'Accept schimburi doar pentru produse similare.',
+    'Pentru detalii suplimentare mă puteți contacta telefonic.',
+]
+MESSAGES = [
+    'Bună ziua, mai este disponibil?', 'Da, este disponibil.', 'Care este prețul final?',
+    'Pot să vin să îl văd mâine?', 'Sigur, după ora 17.', 'Faceți livrare?', 'Mulțumesc, revin.',
+    'Accept oferta.', 'Se poate plăti la livrare?', 'Îmi trimiteți mai multe poze?',
+]
+REVIEW_COMMENTS = [
+    'Tranzacție rapidă, recomand.', 'Produs conform descrierii.', 'Vânzător de încredere.',
+    'Comunicare bună, livrare la timp.', 'A durat mai mult decât mă așteptam.', 'Totul a fost în regulă.',
+]
+# used when the database has no categories yet
+CATEGORY_TREE = {
+    'Electronice': ['Telefoane', 'Laptopuri', 'Televizoare', 'Foto'],
+    'Casă și grădină': ['Mobilă', 'Electrocasnice', 'Unelte'],
+    'Sport și timp liber': ['Biciclete', 'Camping', 'Instrumente muzicale'],
+    'Modă': ['Haine', 'Încălțăminte'],
+    'Copii': ['Cărucioare', 'Jucării'],
+}
+# weighted like a real marketplace: most listings are active
+STATUSES = [('active', 85), ('sold', 8), ('reserved', 2), ('inactive', 5)]
+FALLBACK_CITIES = [('București', 'București'), ('Cluj-Napoca', 'Cluj'), ('Iași', 'Iași'), ('Timișoara', 'Timiș'), ('Constanța', 'Constanța'), ('Brașov', 'Brașov')]
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """Let bulk_create keep the created_at/updated_at values it is given.
+
+    auto_now and auto_now_add would stamp every row with the insert time,
+    which would make the data depend on when it was generated.
+    """
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def scaled_counts(scale=1.0, **overrides):
+    counts = {name: max(1, int(value * scale)) for name, value in DEFAULT_COUNTS.items()}
+    counts.update({name: value for name, value in overrides.items() if value is not None})
+    return counts
+
+
+def benchmark_data_exists():
+    return User.objects.filter(username=VIEWER_USERNAME).exists()
+
+
+def delete_benchmark_data():
+    """Remove the generated users and, by cascade, everything they own."""
+    return User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+
+
+def batched(rows, size=BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class BenchmarkData:
+    """Generate the benchmark rows with random.Random(seed).
+
+    generate() inserts users, listings with images, conversations with
+    messages, favorites and reviews, in that order; `log` gets a line per table.
+    """
+
+    def __init__(self, counts=None, seed=1, log=print):
+        self.counts = counts or dict(DEFAULT_COUNTS)
+        self.rng = random.Random(seed)
+        self.log = log
+        self.user_ids = []
+        self.listings = []  # (id, owner_id, created_at)
+        self.attachment_count = 0
+
+    # picks
+    def moment(self, after=BASE_TIME, span_days=SPAN_DAYS):
+        return after + timedelta(seconds=self.rng.randrange(span_days * 86400))
+
+    def skewed_user(self):
+        # squared uniform: user 0 is picked in ~1/sqrt(n) of the draws, the tail rarely
+        return self.user_ids[int(len(self.user_ids) * self.rng.random() ** 2)]
+
+    def other_user(self, user_id):
+        while True:
+            other = self.skewed_user()
+            if other != user_id or len(self.user_ids) == 1:
+                return other
+
+    # tables
+    def generate(self):
+        with explicit_timestamps(User, UserProfile, Listing, ListingImage, Conversation, Message, MessageAttachment, Favorite, Review, ReviewResponse):
+            self.create_users()
+            self.create_listings()
+            self.create_conversations()
+            self.create_favorites()
+            self.create_reviews()
+        self.update_profiles()
+        bump_generation('listings')
+
+    def create_users(self):
+        password = make_password(PASSWORD)
+        joined = BASE_TIME - timedelta(days=SPAN_DAYS)
+        rows = (
+            User(
+                username=f'{USERNAME_PREFIX}{i}', email=f'{USERNAME_PREFIX}{i}@example.com', password=password,
+                first_name=self.rng.choice(FIRST_NAMES), last_name=self.rng.choice(LAST_NAMES),
+                date_joined=self.moment(joined),
+            )
+            for i in range(self.counts['users'])
+        )
+        for batch in batched(rows):
+            with transaction.atomic():
+                users = User.objects.bulk_create(batch)
+                # what the post_save signals of accounts and notifications create
+                UserProfile.objects.bulk_create([
+                    UserProfile(user=user, city=self.rng.choice(FALLBACK_CITIES)[0], created_at=user.date_joined, updated_at=user.date_joined)
+                    for user in users
+                ])
+                NotificationPreference.objects.bulk_create([NotificationPreference(user=user) for user in users])
+            self.user_ids.extend(user.pk for user in users)
+        self.log(f'users: {len(self.user_ids)}')
+
+    def categories(self):
+        leaves = list(Category.objects.filter(is_active=True, subcategories__isnull=True).order_by('id').values_list('id', flat=True))
+        if leaves:
+            return leaves
+        for order, (parent_name, children) in enumerate(CATEGORY_TREE.items()):
+            parent, _ = Category.objects.get_or_create(slug=slugify(parent_name), defaults={'name': parent_name, 'order': order})
+            for child_order, name in enumerate(children):
+                child, _ = Category.objects.get_or_create(slug=slugify(name), defaults={'name': name, 'parent': parent, 'order': child_order})
+                leaves.append(child.id)
+        return leaves
+
+    def places(self):
+        # weighted by population, so a few cities hold most listings, like on the live site
+        localities = list(Locality.objects.order_by('id').values_list('name', 'county__name', 'latitude', 'longitude', 'population'))
+        if not localities:
+            return [(city, county, None, None) for city, county in FALLBACK_CITIES], None
+        return [row[:4] for row in localities], [row[4] or 1 for row in localities]
+
+    def create_listings(self):
+        categories = self.categories()
+        places, weights = self.places()
+        statuses, status_weights = zip(*STATUSES)
+        conditions = [value for value, _ in Listing.CONDITION_CHOICES]
+
+        def rows():
+            for i in range(self.counts['listings']):
+                item, detail = self.rng.choice(ITEMS), self.rng.choice(DETAILS)
+                city, county, latitude, longitude = self.rng.choices(places, weights)[0]
+                created_at = self.moment()
+                title = f'{item} {detail}'
+                yield Listing(
+                    title=title, slug=f'{slugify(title)}-{USERNAME_PREFIX.rstrip("_")}-{i}',
+                    description=' '.join(self.rng.sample(SENTENCES, 3)),
+                    price=Decimal(self.rng.randrange(10, 5000) * 5), negotiable=self.rng.random() < 0.6,
+                    condition=self.rng.choice(conditions), owner_id=self.skewed_user(), category_id=self.rng.choice(categories),
+                    city=city, county=county, latitude=latitude, longitude=longitude,
+                    status=self.rng.choices(statuses, status_weights)[0], is_featured=self.rng.random() < 0.03,
+                    views_count=self.rng.randrange(500), created_at=created_at, updated_at=created_at,
+                )
+
+        for batch in batched(rows()):
+            with transaction.atomic():
+                listings = Listing.objects.bulk_create(batch)
+                images = []
+                for listing in listings:
+                    # no files: the pages only build URLs, and 'ready' keeps the image pipeline away
+                    names = [f'listings/bench/{listing.slug}-{order}.jpg' for order in range(self.rng.randrange(5))]
+                    images.extend(
+                        ListingImage(
+                            listing=listing, image=name, order=order, width=1200, height=900, variants_status='ready',
+                            created_at=listing.created_at, updated_at=listing.created_at,
+                        )
+                        for order, name in enumerate(names)
+                    )
+                    if names:
+                        listing.cover_image, listing.cover_width, listing.cover_height = names[0], 1200, 900
+                ListingImage.objects.bulk_create(images)
+                # what refresh_cover_image and the counter signals do per save
+                Listing.objects.bulk_update([listing for listing in listings if listing.cover_image], ['cover_image', 'cover_width', 'cover_height'])
+                apply_listing_deltas(Counter(listing.category_id for listing in listings if listing.status == 'active'))
+            self.listings.extend((listing.pk, listing.owner_id, listing.created_at) for listing in listings)
+        self.log(f'listings: {len(self.listings)}')
+
+    def create_conversations(self):
+        # threads of 2 to 2 * MESSAGES_PER_CONVERSATION messages, until the message count is reached
+        total = self.counts['messages']
+        created = conversations = 0
+        while created < total:
+            plans, planned = [], 0
+            while created < total and planned < BATCH_SIZE:
+                listing_id, owner_id, listed_at = self.rng.choice(self.listings)
+                length = min(self.rng.randrange(2, 2 * MESSAGES_PER_CONVERSATION), total - created)
+                plans.append((listing_id, owner_id, self.other_user(owner_id), self.moment(listed_at, 30), length))
+                created += length
+                planned += length
+            self.insert_conversations(plans)
+            conversations += len(plans)
+        self.log(f'messages: {created} in {conversations} conversations')
+
+    def insert_conversations(self, plans):
+        with transaction.atomic():
+            conversations = []
+            messages = []
+            for listing_id, owner_id, buyer_id, started_at, length in plans:
+                sent_at, sender, receiver = started_at, buyer_id, owner_id
+                thread = []
+                for n in range(length):
+                    thread.append(Message(
+                        sender_id=sender, receiver_id=receiver, content=self.rng.choice(MESSAGES),
+                        # the last replies of a thread are still unread
+                        is_read=n < length - self.rng.randrange(3), created_at=sent_at,
+                    ))
+                    sent_at += timedelta(minutes=self.rng.randrange(1, 600))
+                    if self.rng.random() < 0.7:
+                        sender, receiver = receiver, sender
+                conversations.append(Conversation(listing_id=listing_id, created_at=started_at, updated_at=thread[-1].created_at))
+                messages.append(thread)
+            conversations = Conversation.objects.bulk_create(conversations)
+            Conversation.participants.through.objects.bulk_create([
+                Conversation.participants.through(conversation_id=conversation.pk, user_id=user_id)
+                for conversation, (_, owner_id, buyer_id, _, _) in zip(conversations, plans)
+                for user_id in (buyer_id, owner_id)
+            ])
+            for conversation, thread in zip(conversations, messages):
+                for message in thread:
+                    message.conversation = conversation
+            messages = Message.objects.bulk_create([message for thread in messages for message in thread], batch_size=BATCH_SIZE)
+            attachments = []
+            for message in messages:
+                if self.rng.random() < 0.02:
+                    self.attachment_count += 1
+                    name = f'{self.attachment_count}.jpg'
+                    attachments.append(MessageAttachment(
+                        message=message, file=f'chat/attachments/bench/{name}', filename=name,
+                        file_type='image', file_size=self.rng.randrange(20_000, 2_000_000), created_at=message.created_at,
+                    ))
+            MessageAttachment.objects.bulk_create(attachments)
+
+    def create_favorites(self):
+        seen = set()
+        rows = []
+        for _ in range(self.counts['favorites']):
+            listing_id, owner_id, listed_at = self.rng.choice(self.listings)
+            user_id = self.other_user(owner_id)
+            if (user_id, listing_id) in seen:
+                continue
+            seen.add((user_id, listing_id))
+            rows.append(Favorite(user_id=user_id, listing_id=listing_id, created_at=self.moment(listed_at, 30)))
+        for batch in batched(rows):
+            Favorite.objects.bulk_create(batch)
+        self.log(f'favorites: {len(rows)}')
+
+    def create_reviews(self):
+        seen = set()
+        reviews = []
+        for _ in range(self.counts['reviews']):
+            listing_id, owner_id, listed_at = self.rng.choice(self.listings)
+            reviewer_id = self.other_user(owner_id)
+            if (reviewer_id, owner_id, listing_id) in seen:
+                continue
+            seen.add((reviewer_id, owner_id, listing_id))
+            created_at = self.moment(listed_at, 60)
+            reviews.append(Review(
+                reviewer_id=reviewer_id, reviewed_user_id=owner_id, listing_id=listing_id,
+                rating=self.rng.choices([5, 4, 3, 2, 1], [50, 25, 12, 8, 5])[0], comment=self.rng.choice(REVIEW_COMMENTS),
+                transaction_type='purchase', created_at=created_at, updated_at=created_at,
+            ))
+        for batch in batched(reviews):
+            with transaction.atomic():
+                batch = Review.objects.bulk_create(batch)
+                ReviewResponse.objects.bulk_create([
+                    ReviewResponse(review=review, response_text='Mulțumesc!', created_at=review.created_at, updated_at=review.created_at)
+                    for review in batch if self.rng.random() < 0.3
+                ])
+        self.log(f'reviews: {len(reviews)}')
+
+    def update_profiles(self):
+        # UserProfile.update_statistics for every generated user, as three UPDATE statements
+        def listing_count(status):
+            listings = Listing.objects.filter(owner=OuterRef('user'), status=status).order_by().values('owner')
+            return Coalesce(Subquery(listings.annotate(n=Count('id')).values('n')[:1]), Value(0))
+
+        reviews = Review.objects.filter(reviewed_user=OuterRef('user')).order_by().values('reviewed_user')
+        UserProfile.objects.filter(user__username__startswith=USERNAME_PREFIX).update(
+            total_listings=listing_count('active'),
+            total_sales=listing_count('sold'),
+            average_rating=Coalesce(
+                Subquery(reviews.annotate(avg=Avg('rating')).values('avg')[:1]), Value(Decimal('0.00')),
+                output_field=UserProfile._meta.get_field('average_rating'),
+            ),
+        )
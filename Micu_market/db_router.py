@@ -0,0 +1,175 @@
+"""Read replicas: the browsing pages read from a replica, everything else uses the primary.
+
+A view opts in with @read_from_replica (other code with `reading_from_replica()`,
+or `.using(read_database())` for a single queryset); its reads then go to one
+of READ_REPLICAS['DATABASES'], picked once per request. Writes always go to
+the primary ('default'), including those made during a replica view, like the
+view counter's flush.
+
+A replica lags behind the primary, so after a request with an unsafe method
+(POST, PUT, ...) writes, ReplicaMiddleware sets a cookie that keeps that
+client's reads on the primary for READ_REPLICAS['STICKY_SECONDS']: a new
+listing shows up for its owner at once. Reads after a write in the same
+request, and inside a transaction on the primary, stay on the primary too.
+
+Whatever fills a shared cache (the page cache, the template fragments, the
+facet counts, the category tree) reads inside `reading_from_primary()`: the
+entries are keyed by the generation a write has just bumped, and rows from a
+lagging replica would be served from them until they expire.
+"""
+import random
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+STICKY_COOKIE = 'read_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE')
+# read from the primary even in replica views: a session must not outlive a logout on a lagging replica
+PRIMARY_ONLY_APPS = {'sessions'}
+
+
+def replica_settings():
+    config = getattr(settings, 'READ_REPLICAS', {})
+    return {
+        'DATABASES': config.get('DATABASES', []),
+        'STICKY_SECONDS': config.get('STICKY_SECONDS', 15),
+    }
+
+
+@dataclass
+class ReadState:
+    # the client wrote within STICKY_SECONDS (the cookie)
+    sticky: bool = False
+    # writes only count in requests with an unsafe method; GETs that flush the view counter do not
+    track_writes: bool = False
+    # set by WriteTracker once a write statement runs on the primary
+    wrote: bool = False
+    # depth of reading_from_replica() and reading_from_primary() blocks
+    replica_reads: int = 0
+    primary_reads: int = 0
+    replica: str = None
+
+
+_state = ContextVar('read_replica_state', default=None)
+
+
+def read_from_replica(view):
+    """Send the view's reads to a replica; checked by ReplicaMiddleware."""
+    # an attribute, not a wrapper; functools.wraps in outer decorators copies it along
+    view.read_from_replica = True
+    return view
+
+
+@contextmanager
+def _reading(counter):
+    state = _state.get()
+    token = None
+    if state is None:
+        state = ReadState()
+        token = _state.set(state)
+    setattr(state, counter, getattr(state, counter) + 1)
+    try:
+        yield
+    finally:
+        setattr(state, counter, getattr(state, counter) - 1)
+        if token is not None:
+            _state.reset(token)
+
+
+def reading_from_replica():
+    """Reads in the block go to a replica, unless the client or the request has just written."""
+    return _reading('replica_reads')
+
+
+def reading_from_primary():
+    """Reads in the block go to the primary, also inside a replica view or block."""
+    return _reading('primary_reads')
+
+
+def read_database():
+    """The alias reads should use right now: a replica inside a replica view or block, else 'default'."""
+    state = _state.get()
+    replicas = replica_settings()['DATABASES']
+    if (
+        state is None or not state.replica_reads or state.primary_reads or not replicas
+        or state.sticky or state.wrote
+        # the reads of a transaction have to see its writes
+        or connections[DEFAULT_DB_ALIAS].in_atomic_block
+    ):
+        return DEFAULT_DB_ALIAS
+    if state.replica not in replicas:
+        state.replica = random.choice(replicas)
+    return state.replica
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label in PRIMARY_ONLY_APPS:
+            return DEFAULT_DB_ALIAS
+        state = _state.get()
+        if state is None or not (state.replica_reads or state.primary_reads):
+            # no opinion: Django uses the database the related instance came from, else 'default'
+            return None
+        return read_database()
+
+    def db_for_write(self, model, **hints):
+        # also for instances read from a replica. Not where writes are tracked: Django asks
+        # here for reads too, e.g. the constraint checks of every ModelForm validation
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *replica_settings()['DATABASES']}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        # replicas get the schema from the primary
+        if db in replica_settings()['DATABASES']:
+            return False
+        return None
+
+
+class WriteTracker:
+    """connection.execute_wrapper that marks the request once it writes to the primary."""
+
+    def __init__(self, state):
+        self.state = state
+
+    def __call__(self, execute, sql, params, many, context):
+        if not self.state.wrote and sql.lstrip()[:6].upper() in WRITE_STATEMENTS:
+            self.state.wrote = True
+        return execute(sql, params, many, context)
+
+
+class ReplicaMiddleware:
+    """Route the reads of @read_from_replica views to a replica, and keep writers on the primary.
+
+    Goes before SessionMiddleware, so the session saved at login counts as a write.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = ReadState(sticky=STICKY_COOKIE in request.COOKIES, track_writes=request.method not in SAFE_METHODS)
+        token = _state.set(state)
+        tracking = connections[DEFAULT_DB_ALIAS].execute_wrapper(WriteTracker(state)) if state.track_writes else nullcontext()
+        try:
+            with tracking:
+                response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        config = replica_settings()
+        if state.wrote and config['DATABASES']:
+            response.set_cookie(STICKY_COOKIE, '1', max_age=config['STICKY_SECONDS'], httponly=True, samesite='Lax')
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if getattr(view_func, 'read_from_replica', False):
+            # until the response leaves this middleware, so the template's lazy querysets are included
+            _state.get().replica_reads += 1
@@ -0,0 +1,292 @@
+"""Sampling request profiler: a share of the requests is timed in detail.
+
+For a sampled request RequestProfilerMiddleware records the wall time, the
+SQL time and count, the template render time and the cache hits and misses,
+and runs it under cProfile. Samples go to a ring buffer of fixed size in the
+cache (shared by the web processes when the cache is Redis); the dashboard
+app shows the slowest endpoints and serves the profiles to staff.
+"""
+import cProfile
+import marshal
+import random
+import statistics
+import sys
+import time
+import uuid
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.template.backends.django import Template
+from django.utils import timezone
+
+_MISSING = object()
+
+
+def profiler_settings():
+    config = getattr(settings, 'REQUEST_PROFILER', {})
+    return {
+        'SAMPLE_RATE': config.get('SAMPLE_RATE', 0),
+        'BUFFER_SIZE': config.get('BUFFER_SIZE', 200),
+        'CPROFILE': config.get('CPROFILE', True),
+        'CACHE': config.get('CACHE', 'default'),
+    }
+
+
+@dataclass
+class RequestSample:
+    id: str
+    started_at: object
+    method: str
+    path: str
+    view_name: str
+    status: int
+    wall_ms: float
+    sql_ms: float
+    sql_count: int
+    template_ms: float
+    cache_hits: int
+    cache_misses: int
+    has_profile: bool
+    slot: int = None
+
+
+# ======================
+# measuring
+# ======================
+class QueryTimer:
+    """connection.execute_wrapper that adds up the time spent in the database."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.count += 1
+
+
+class CacheCounter:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+
+@contextmanager
+def counting_cache_hits(counter):
+    """Count the hits and misses of get/get_many (and get_or_set) on every configured cache.
+
+    The backends are per thread, so their methods are wrapped on the instance
+    for the duration of the block only.
+    """
+    backends = [caches[alias] for alias in settings.CACHES]
+    for backend in backends:
+        get, get_many = backend.get, backend.get_many
+
+        def counted_get(key, default=None, version=None, get=get):
+            value = get(key, _MISSING, version=version)
+            if value is _MISSING:
+                counter.misses += 1
+                return default
+            counter.hits += 1
+            return value
+
+        def counted_get_many(keys, version=None, get_many=get_many):
+            keys = list(keys)
+            values = get_many(keys, version=version)
+            counter.hits += len(values)
+            counter.misses += len(keys) - len(values)
+            return values
+
+        backend.get, backend.get_many = counted_get, counted_get_many
+    try:
+        yield counter
+    finally:
+        for backend in backends:
+            del backend.get, backend.get_many
+
+
+class TemplateTimer:
+    def __init__(self):
+        self.seconds = 0.0
+        self.depth = 0
+
+
+_template_timer = ContextVar('request_profiler_template_timer', default=None)
+
+
+def _timed_render(render):
+    @wraps(render)
+    def timed_render(self, context=None, request=None):
+        timer = _template_timer.get()
+        # only the outermost render is timed, render_to_string inside a template is part of it
+        if timer is None or timer.depth:
+            return render(self, context, request)
+        timer.depth += 1
+        started = time.perf_counter()
+        try:
+            return render(self, context, request)
+        finally:
+            timer.depth -= 1
+            timer.seconds += time.perf_counter() - started
+    timed_render.request_profiler = True
+    return timed_render
+
+
+def install_template_timer():
+    # Django only signals template renders under the test runner, so the backend's render is wrapped;
+    # outside a sampled request it costs one ContextVar lookup
+    if not getattr(Template.render, 'request_profiler', False):
+        Template.render = _timed_render(Template.render)
+
+
+# ======================
+# ring buffer
+# ======================
+class SampleBuffer:
+    """The last `size` samples, in cache slots reused round-robin.
+
+    A profile is stored in its sample's slot, so it is dropped with the sample.
+    """
+
+    key_prefix = 'request-profiler'
+
+    def __init__(self, cache, size):
+        self.cache = cache
+        self.size = size
+
+    def key(self, kind, slot):
+        return f'{self.key_prefix}:{kind}:{slot}'
+
+    def next_slot(self):
+        counter_key = f'{self.key_prefix}:counter'
+        self.cache.add(counter_key, 0, None)
+        try:
+            return self.cache.incr(counter_key) % self.size
+        except ValueError:
+            # evicted between add and incr
+            self.cache.set(counter_key, 0, None)
+            return 0
+
+    def append(self, sample, profile_data=None):
+        sample.slot = self.next_slot()
+        self.cache.set_many({
+            self.key('sample', sample.slot): sample,
+            self.key('profile', sample.slot): (sample.id, profile_data),
+        }, None)
+
+    def samples(self):
+        values = self.cache.get_many([self.key('sample', slot) for slot in range(self.size)])
+        return sorted(values.values(), key=lambda sample: sample.started_at, reverse=True)
+
+    def profile(self, sample_id):
+        """(sample, marshalled pstats data) for a sample still in the buffer, else (None, None)."""
+        sample = next((sample for sample in self.samples() if sample.id == sample_id), None)
+        if sample is None:
+            return None, None
+        stored = self.cache.get(self.key('profile', sample.slot))
+        if not stored or stored[0] != sample_id or stored[1] is None:
+            return sample, None
+        return sample, stored[1]
+
+    def clear(self):
+        self.cache.delete_many([self.key(kind, slot) for kind in ('sample', 'profile') for slot in range(self.size)])
+
+
+def get_sample_buffer():
+    config = profiler_settings()
+    return SampleBuffer(caches[config['CACHE']], config['BUFFER_SIZE'])
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def endpoint_summary(samples):
+    """Per view: request count, p50/p95/max wall time and mean SQL, template and cache figures; slowest p95 first."""
+    by_view = defaultdict(list)
+    for sample in samples:
+        by_view[sample.view_name].append(sample)
+    rows = []
+    for view_name, view_samples in by_view.items():
+        wall = [sample.wall_ms for sample in view_samples]
+        lookups = sum(sample.cache_hits + sample.cache_misses for sample in view_samples)
+        rows.append({
+            'view_name': view_name,
+            'count': len(view_samples),
+            'p50_ms': percentile(wall, 50),
+            'p95_ms': percentile(wall, 95),
+            'max_ms': max(wall),
+            'sql_ms': statistics.fmean(sample.sql_ms for sample in view_samples),
+            'sql_count': statistics.fmean(sample.sql_count for sample in view_samples),
+            'template_ms': statistics.fmean(sample.template_ms for sample in view_samples),
+            'cache_hit_rate': sum(sample.cache_hits for sample in view_samples) / lookups if lookups else None,
+        })
+    return sorted(rows, key=lambda row: row['p95_ms'], reverse=True)
+
+
+# ======================
+# middleware
+# ======================
+class RequestProfilerMiddleware:
+    """Profile REQUEST_PROFILER['SAMPLE_RATE'] of the requests (0 turns it off).
+
+    Goes first in MIDDLEWARE, so the wall time covers the whole stack. The
+    body of a streaming response is produced after the middleware returns and
+    is not part of the timings.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        install_template_timer()
+
+    def __call__(self, request):
+        config = profiler_settings()
+        if not config['SAMPLE_RATE'] or random.random() >= config['SAMPLE_RATE']:
+            return self.get_response(request)
+        return self.profile(request, config)
+
+    def profile(self, request, config):
+        queries, cache_counter, template_timer = QueryTimer(), CacheCounter(), TemplateTimer()
+        # another profiler (a debugger, coverage) would be replaced by cProfile
+        profiler = cProfile.Profile() if config['CPROFILE'] and sys.getprofile() is None else None
+        token = _template_timer.set(template_timer)
+        started_at, started = timezone.now(), time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(queries))
+                stack.enter_context(counting_cache_hits(cache_counter))
+                if profiler is not None:
+                    profiler.enable()
+                    stack.callback(profiler.disable)
+                response = self.get_response(request)
+            wall = time.perf_counter() - started
+        finally:
+            _template_timer.reset(token)
+
+        profile_data = None
+        if profiler is not None:
+            profiler.create_stats()
+            # the format of pstats.Stats.dump_stats, readable by pstats and snakeviz
+            profile_data = marshal.dumps(profiler.stats)
+        match = request.resolver_match
+        sample = RequestSample(
+            id=uuid.uuid4().hex, started_at=started_at, method=request.method, path=request.path,
+            view_name=match.view_name if match else request.path, status=response.status_code,
+            wall_ms=round(wall * 1000, 2), sql_ms=round(queries.seconds * 1000, 2), sql_count=queries.count,
+            template_ms=round(template_timer.seconds * 1000, 2),
+            cache_hits=cache_counter.hits, cache_misses=cache_counter.misses, has_profile=profile_data is not None,
+        )
+        get_sample_buffer().append(sample, profile_data)
+        return response
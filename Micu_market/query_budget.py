@@ -0,0 +1,95 @@
+import logging
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def query_budget(max_queries):
+    """Declare the most SQL queries a view may run per request, middleware included.
+
+    Checked by QueryBudgetMiddleware; QUERY_BUDGET['VIEWS'] can override it by URL name.
+    """
+    def decorator(view):
+        # an attribute, not a wrapper; functools.wraps in outer decorators copies it along
+        view.query_budget = max_queries
+        return view
+    return decorator
+
+
+def budget_settings():
+    config = getattr(settings, 'QUERY_BUDGET', {})
+    return {
+        'MODE': config.get('MODE', 'off'),
+        'DEFAULT': config.get('DEFAULT'),
+        'VIEWS': config.get('VIEWS', {}),
+    }
+
+
+class QueryCounter:
+    """connection.execute_wrapper that counts queries, and keeps them for the error message."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append(sql)
+        return execute(sql, params, many, context)
+
+    def __len__(self):
+        return len(self.queries)
+
+
+@contextmanager
+def count_queries():
+    """Yield a QueryCounter that sees the queries of every database connection in the block."""
+    counter = QueryCounter()
+    with ExitStack() as stack:
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(counter))
+        yield counter
+
+
+class QueryBudgetMiddleware:
+    """Count the queries of each request against the view's budget.
+
+    Goes first in MIDDLEWARE, so session and auth queries count too. With
+    MODE "log" an overrun is logged, with "raise" it raises QueryBudgetExceeded
+    (for DEBUG and the test suite); "off" adds nothing to the request.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        config = budget_settings()
+        if config['MODE'] == 'off':
+            return self.get_response(request)
+
+        with count_queries() as counter:
+            response = self.get_response(request)
+
+        budget = self.budget(request, config)
+        if budget is not None and len(counter) > budget:
+            view_name = request.resolver_match.view_name if request.resolver_match else request.path
+            message = f'{view_name} ran {len(counter)} queries, its budget is {budget}'
+            if config['MODE'] == 'raise':
+                raise QueryBudgetExceeded(message + ':\n' + '\n'.join(counter.queries))
+            logger.warning(message)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = getattr(view_func, 'query_budget', None)
+
+    def budget(self, request, config):
+        match = request.resolver_match
+        if match is not None and match.view_name in config['VIEWS']:
+            return config['VIEWS'][match.view_name]
+        budget = getattr(request, 'query_budget', None)
+        return budget if budget is not None else config['DEFAULT']
@@ -33,6 +33,10 @@ INSTALLED_APPS = [
     "django.contrib.messages",
     "django.contrib.staticfiles",
     "django.contrib.sites",  #allauth
+    "django.contrib.postgres",
+
+    # api
+    "rest_framework",
 
     # allauth
     "allauth",
@@ -46,6 +50,7 @@ INSTALLED_APPS = [
     "accounts",
     "listings",
     "categories",
+    "locations",
     "search",
     "chat",
     "reviews",
@@ -57,6 +62,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # first, so the timings of the sampled requests cover the whole stack
+    "Micu_market.profiling.RequestProfilerMiddleware",
+    # next, so the queries of the other middleware count too
+    "Micu_market.query_budget.QueryBudgetMiddleware",
+    "Micu_market.slow_queries.SlowQueryMiddleware",
+    # before the session middleware, so the session saved at login counts as a write
+    "Micu_market.db_router.ReplicaMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -91,6 +103,12 @@ ASGI_APPLICATION = "Micu_market.asgi.application"
 # ======================
 # DATABASE (PostgreSQL)
 # ======================
+# connections are kept open across requests for DB_CONN_MAX_AGE seconds ("None" = no limit, 0 = one
+# per request) and checked before reuse when DB_CONN_HEALTH_CHECKS; DB_POOL=True uses a psycopg 3
+# pool per process instead (needs psycopg-pool, and CONN_MAX_AGE 0), which also suits ASGI
+DB_CONN_MAX_AGE = os.getenv("DB_CONN_MAX_AGE", "60")
+DB_POOL = os.getenv("DB_POOL", "False") == "True"
+
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.postgresql",
@@ -99,9 +117,133 @@ DATABASES = {
         "PASSWORD": os.getenv("DB_PASS", ""),
         "HOST": os.getenv("DB_HOST", "127.0.0.1"),
         "PORT": os.getenv("DB_PORT", "5432"),
+        "CONN_MAX_AGE": 0 if DB_POOL else None if DB_CONN_MAX_AGE == "None" else int(DB_CONN_MAX_AGE),
+        "CONN_HEALTH_CHECKS": os.getenv("DB_CONN_HEALTH_CHECKS", "True") == "True",
+        "OPTIONS": {
+            # min_size connections are opened up front; a request waits up to timeout seconds when all max_size are busy
+            "pool": {
+                "min_size": int(os.getenv("DB_POOL_MIN_SIZE", "2")),
+                "max_size": int(os.getenv("DB_POOL_MAX_SIZE", "10")),
+                "timeout": float(os.getenv("DB_POOL_TIMEOUT", "10")),
+            },
+        } if DB_POOL else {},
+    }
+}
+
+# read replicas (Micu_market/db_router.py): DB_REPLICA_HOSTS, comma-separated host[:port], are streaming
+# replicas of the primary with its name and credentials; the @read_from_replica views read from them,
+# except for a client that wrote in the last DB_REPLICA_STICKY_SECONDS
+DB_REPLICA_HOSTS = [host.strip() for host in os.getenv("DB_REPLICA_HOSTS", "").split(",") if host.strip()]
+
+
+def replica_databases(default, hosts):
+    """replicaN entries copying `default` (settings_production calls it again after its overrides)."""
+    replicas = {}
+    for number, replica in enumerate(hosts, 1):
+        host, _, port = replica.partition(":")
+        replicas[f"replica{number}"] = {
+            **default,
+            "HOST": host,
+            "PORT": port or default["PORT"],
+            # the tests read the test database through the replica aliases
+            "TEST": {"MIRROR": "default"},
+        }
+    return replicas
+
+
+DATABASES.update(replica_databases(DATABASES["default"], DB_REPLICA_HOSTS))
+
+DATABASE_ROUTERS = ["Micu_market.db_router.ReplicaRouter"]
+
+READ_REPLICAS = {
+    "DATABASES": [alias for alias in DATABASES if alias != "default"],
+    "STICKY_SECONDS": int(os.getenv("DB_REPLICA_STICKY_SECONDS", "15")),
+}
+
+# ======================
+# CACHE / REDIS
+# ======================
+REDIS_URL = os.getenv("REDIS_URL", "")
+
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
     }
+
+# listing views are buffered and flushed in batches (see listings/view_counter.py)
+VIEW_COUNTER = {
+    "BACKEND": "listings.view_counter.RedisViewCounter" if REDIS_URL else "listings.view_counter.LocMemViewCounter",
+    "OPTIONS": {
+        "flush_interval": int(os.getenv("VIEW_COUNTER_FLUSH_INTERVAL", "30")),
+        "batch_size": 500,
+    },
+}
+
+# anonymous home/list pages and listing fragments, invalidated by generation counters
+# bumped from the Listing/ListingImage/Category signals (listings/page_cache.py); 0 disables
+PAGE_CACHE = {
+    "TIMEOUT": int(os.getenv("PAGE_CACHE_TIMEOUT", "300")),
+}
+
+# per-view SQL query budgets (Micu_market/query_budget.py), declared with @query_budget
+# or here by URL name; "log" warns, "raise" fails the request (the tests use it), "off"
+QUERY_BUDGET = {
+    "MODE": os.getenv("QUERY_BUDGET_MODE", "log" if DEBUG else "off"),
+    "DEFAULT": None,
+    "VIEWS": {},
+}
+
+# sampling request profiler (Micu_market/profiling.py): SAMPLE_RATE of the requests (0.01 = 1%)
+# are timed and run under cProfile; the last BUFFER_SIZE samples are kept in the cache for /dashboard/
+REQUEST_PROFILER = {
+    "SAMPLE_RATE": float(os.getenv("REQUEST_PROFILER_SAMPLE_RATE", "0")),
+    "BUFFER_SIZE": int(os.getenv("REQUEST_PROFILER_BUFFER_SIZE", "200")),
+    "CPROFILE": os.getenv("REQUEST_PROFILER_CPROFILE", "True") == "True",
+    "CACHE": "default",
+}
+
+# slow query log (Micu_market/slow_queries.py): queries over THRESHOLD_MS are grouped by SQL
+# fingerprint with their call sites and an EXPLAIN plan, for /dashboard/slow_queries; 0 turns it off
+SLOW_QUERY_LOG = {
+    "THRESHOLD_MS": float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "200")),
+    "EXPLAIN": os.getenv("SLOW_QUERY_EXPLAIN", "True") == "True",
+    "MAX_FINGERPRINTS": 500,
+    "CACHE": "default",
+}
+
+# ======================
+# API
+# ======================
+# JSON only: the listing endpoints compute ETags over the JSON representation
+REST_FRAMEWORK = {
+    "DEFAULT_AUTHENTICATION_CLASSES": [
+        # first, so anonymous API requests get 401 with a WWW-Authenticate header
+        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "rest_framework.authentication.SessionAuthentication",
+    ],
+    "DEFAULT_PERMISSION_CLASSES": ["rest_framework.permissions.IsAuthenticatedOrReadOnly"],
+    "DEFAULT_RENDERER_CLASSES": ["rest_framework.renderers.JSONRenderer"],
+    "DEFAULT_PAGINATION_CLASS": "api.pagination.KeysetPagination",
+    "PAGE_SIZE": 24,
 }
 
+# ======================
+# SEARCH
+# ======================
+# PostgreSQL text search configuration created after migrate (romanian + unaccent)
+SEARCH_CONFIG = "ro_unaccent"
+# engine class path; empty = PostgreSQL full-text search on PostgreSQL, substring search elsewhere
+SEARCH_ENGINE = os.getenv("SEARCH_ENGINE", "")
+
 
 # ======================
 # AUTH / SECURITY
@@ -135,6 +277,26 @@ STATIC_ROOT = BASE_DIR / "staticfiles"
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+# resized listing image variants: "thread" (background pool in the web process),
+# "queue" (left pending for `manage.py process_listing_images`) or "sync"
+IMAGE_PIPELINE = {
+    "MODE": os.getenv("IMAGE_PIPELINE_MODE", "thread"),
+    "WORKERS": int(os.getenv("IMAGE_PIPELINE_WORKERS", "2")),
+}
+
+# similar listings after a save: "thread" (one background worker in the web process),
+# "queue" (left to the nightly `manage.py rebuild_similar_listings`) or "sync"
+SIMILAR_LISTINGS = {
+    "MODE": os.getenv("SIMILAR_LISTINGS_MODE", "thread"),
+}
+
+# on-demand thumbnails (/thumb/...), kept in a size-bounded LRU directory
+THUMBNAILS = {
+    "DIR": os.getenv("THUMBNAIL_CACHE_DIR", str(MEDIA_ROOT / "cache" / "thumbnails")),
+    "MAX_BYTES": int(os.getenv("THUMBNAIL_CACHE_MAX_MB", "512")) * 1024 * 1024,
+    "SIZES": [64, 96, 200, 400, 800, 1200],
+}
+
 # Security settings
 if not DEBUG:
     SECURE_SSL_REDIRECT = os.getenv("SECURE_SSL_REDIRECT", "True") == "True"
@@ -0,0 +1,297 @@
+"""Slow query log: queries over a threshold, grouped by SQL fingerprint.
+
+SlowQueryMiddleware puts a QueryLogger on every connection for the request
+(log_slow_queries() does the same around any other code). A query slower than
+SLOW_QUERY_LOG['THRESHOLD_MS'] is added to its fingerprint's aggregate in the
+cache: count, total and max time, recent durations for the p95, the call
+sites (first project frame, with the view) and, captured once in a
+background thread, the EXPLAIN plan. The dashboard app shows the aggregates
+and exports them as JSON.
+
+Aggregates are updated read-modify-write under a process lock; with several
+processes sharing Redis an occasional concurrent update can be lost, which
+is fine for finding the queries worth fixing.
+"""
+import hashlib
+import logging
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import close_old_connections, connections
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# recent durations kept per fingerprint for the p95, and call sites/views listed per fingerprint
+DURATIONS_KEPT = 200
+CALL_SITES_KEPT = 20
+SQL_KEPT = 4000
+
+_current_view = ContextVar('slow_query_view', default=None)
+
+
+def slow_query_settings():
+    config = getattr(settings, 'SLOW_QUERY_LOG', {})
+    return {
+        'THRESHOLD_MS': config.get('THRESHOLD_MS', 0),
+        'EXPLAIN': config.get('EXPLAIN', True),
+        'MAX_FINGERPRINTS': config.get('MAX_FINGERPRINTS', 500),
+        'CACHE': config.get('CACHE', 'default'),
+    }
+
+
+# ======================
+# fingerprints and call sites
+# ======================
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_LIST = re.compile(r'\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)')
+_SPACE = re.compile(r'\s+')
+
+
+def normalize_sql(sql):
+    """SQL with literals replaced by ? and IN lists collapsed, so one ORM call gives one fingerprint."""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _PLACEHOLDER_LIST.sub('(...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+def fingerprint(normalized_sql):
+    return hashlib.md5(normalized_sql.encode()).hexdigest()[:16]
+
+
+_SKIPPED_DIRS = ('site-packages', 'dist-packages')
+# the execute_wrappers of the profiler and the query budget sit between the ORM call and this one
+_INSTRUMENTATION = {Path(__file__).resolve().with_name(name) for name in ('slow_queries.py', 'query_budget.py', 'profiling.py')}
+
+
+def call_site():
+    """'listings/views.py:87 in listing_list_view' for the innermost frame in the project's code."""
+    base_dir = Path(settings.BASE_DIR).resolve()
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if not any(part in filename for part in _SKIPPED_DIRS):
+            path = Path(filename).resolve()
+            if path not in _INSTRUMENTATION and path.is_relative_to(base_dir):
+                return f'{path.relative_to(base_dir).as_posix()}:{frame.f_lineno} in {frame.f_code.co_name}'
+        frame = frame.f_back
+    return '?'
+
+
+# ======================
+# EXPLAIN, in the background
+# ======================
+_executor = None
+_executor_lock = threading.Lock()
+_explaining = set()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='slow-query-explain')
+    return _executor
+
+
+def explain(alias, sql, params):
+    """The plan of a SELECT without running it (no ANALYZE), as text."""
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}', params)
+        # PostgreSQL gives one line per row, SQLite (EXPLAIN QUERY PLAN) the detail in the last column
+        return '\n'.join(str(row[-1]) for row in cursor.fetchall())
+
+
+def _explain_in_background(log, key, alias, sql, params):
+    try:
+        log.set_plan(key, explain(alias, sql, params))
+    except Exception as e:
+        log.set_plan(key, f'EXPLAIN failed: {e}')
+    finally:
+        _explaining.discard(key)
+        # the worker thread has its own DB connection
+        close_old_connections()
+
+
+# ======================
+# aggregates
+# ======================
+class SlowQueryLog:
+    """Per-fingerprint aggregates of the slow queries, in the cache."""
+
+    key_prefix = 'slow-queries'
+    _lock = threading.Lock()
+
+    def __init__(self, cache, max_fingerprints):
+        self.cache = cache
+        self.max_fingerprints = max_fingerprints
+
+    def key(self, name):
+        return f'{self.key_prefix}:{name}'
+
+    def record(self, sql, duration_ms, site, view_name, vendor):
+        """Add one slow query; returns True when its fingerprint has no plan yet."""
+        normalized = normalize_sql(sql)
+        key = fingerprint(normalized)
+        now = timezone.now()
+        with self._lock:
+            entry = self.cache.get(self.key(key)) or {
+                'fingerprint': key, 'sql': normalized[:SQL_KEPT], 'vendor': vendor,
+                'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'durations': [],
+                'call_sites': {}, 'views': {}, 'first_seen': now, 'last_seen': now, 'plan': None,
+            }
+            entry['count'] += 1
+            entry['total_ms'] += duration_ms
+            entry['max_ms'] = max(entry['max_ms'], duration_ms)
+            entry['durations'] = (entry['durations'] + [duration_ms])[-DURATIONS_KEPT:]
+            entry['last_seen'] = now
+            for counts, name in ((entry['call_sites'], site), (entry['views'], view_name or '-')):
+                counts[name] = counts.get(name, 0) + 1
+                if len(counts) > CALL_SITES_KEPT:
+                    del counts[min(counts, key=counts.get)]
+            self.cache.set(self.key(key), entry, None)
+            self._add_to_index(key)
+        return entry['plan'] is None
+
+    def _add_to_index(self, key):
+        index = self.cache.get(self.key('index')) or []
+        if key in index:
+            return
+        index.append(key)
+        if len(index) > self.max_fingerprints:
+            # full: drop the fingerprint that cost the least time overall
+            entries = self.cache.get_many([self.key(other) for other in index])
+            cheapest = min(index, key=lambda other: entries.get(self.key(other), {}).get('total_ms', 0))
+            index.remove(cheapest)
+            self.cache.delete(self.key(cheapest))
+        self.cache.set(self.key('index'), index, None)
+
+    def set_plan(self, key, plan):
+        with self._lock:
+            entry = self.cache.get(self.key(key))
+            if entry is not None:
+                entry['plan'] = plan
+                self.cache.set(self.key(key), entry, None)
+
+    def entries(self):
+        index = self.cache.get(self.key('index')) or []
+        return list(self.cache.get_many([self.key(key) for key in index]).values())
+
+    def clear(self):
+        with self._lock:
+            index = self.cache.get(self.key('index')) or []
+            self.cache.delete_many([self.key(key) for key in index] + [self.key('index')])
+
+
+def get_slow_query_log():
+    config = slow_query_settings()
+    return SlowQueryLog(caches[config['CACHE']], config['MAX_FINGERPRINTS'])
+
+
+def summarize(entry):
+    durations = sorted(entry['durations'])
+    call_sites = sorted(entry['call_sites'].items(), key=lambda item: item[1], reverse=True)
+    views = sorted(entry['views'].items(), key=lambda item: item[1], reverse=True)
+    return {
+        'fingerprint': entry['fingerprint'],
+        'sql': entry['sql'],
+        'vendor': entry['vendor'],
+        'count': entry['count'],
+        'total_ms': round(entry['total_ms'], 2),
+        'mean_ms': round(entry['total_ms'] / entry['count'], 2),
+        # over the last DURATIONS_KEPT occurrences
+        'p95_ms': round(durations[min(len(durations) - 1, int(len(durations) * 0.95))], 2),
+        'max_ms': round(entry['max_ms'], 2),
+        'call_sites': [{'call_site': site, 'count': count} for site, count in call_sites],
+        'views': [{'view': view, 'count': count} for view, count in views],
+        'first_seen': entry['first_seen'].isoformat(),
+        'last_seen': entry['last_seen'].isoformat(),
+        'plan': entry['plan'],
+    }
+
+
+def slow_query_summary():
+    """Summaries of all fingerprints, the most total time first."""
+    return sorted((summarize(entry) for entry in get_slow_query_log().entries()), key=lambda row: row['total_ms'], reverse=True)
+
+
+# ======================
+# instrumentation
+# ======================
+class QueryLogger:
+    """connection.execute_wrapper that records the queries slower than the threshold."""
+
+    def __init__(self, alias, config):
+        self.alias = alias
+        self.threshold = config['THRESHOLD_MS']
+        self.explain = config['EXPLAIN']
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration_ms = (time.perf_counter() - started) * 1000
+            if duration_ms >= self.threshold:
+                self.record(sql, params, many, duration_ms, context['connection'].vendor)
+
+    def record(self, sql, params, many, duration_ms, vendor):
+        try:
+            log = get_slow_query_log()
+            needs_plan = log.record(sql, duration_ms, call_site(), _current_view.get(), vendor)
+        except Exception:
+            # the log must never break the query it is looking at
+            logger.exception('Could not record a slow query')
+            return
+        key = fingerprint(normalize_sql(sql))
+        statement = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else ''
+        if needs_plan and self.explain and not many and statement in ('SELECT', 'WITH') and key not in _explaining:
+            _explaining.add(key)
+            _get_executor().submit(_explain_in_background, log, key, self.alias, sql, params)
+
+
+@contextmanager
+def log_slow_queries():
+    """Record slow queries on every connection inside the block, e.g. in a management command."""
+    config = slow_query_settings()
+    if not config['THRESHOLD_MS']:
+        yield
+        return
+    with ExitStack() as stack:
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(QueryLogger(alias, config)))
+        yield
+
+
+class SlowQueryMiddleware:
+    """Log the slow queries of each request, with the view they came from.
+
+    Off when SLOW_QUERY_LOG['THRESHOLD_MS'] is 0.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _current_view.set(None)
+        try:
+            with log_slow_queries():
+                return self.get_response(request)
+        finally:
+            _current_view.reset(token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = request.resolver_match
+        _current_view.set(match.view_name if match else request.path)
@@ -0,0 +1,145 @@
+import itertools
+from contextlib import ExitStack
+
+from django.contrib.auth import get_user_model
+from django.db import connection, connections
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+
+from accounts.models import UserProfile
+from categories.models import Category
+from chat.models import Conversation, Message, MessageAttachment
+from favorites.models import Favorite
+from listings.models import Listing, ListingImage
+from reviews.models import Review, ReviewResponse
+
+User = get_user_model()
+
+_sequence = itertools.count(1)
+
+# what the page tests run with: budgets enforced, no page/fragment cache hiding the queries,
+# image variants and similar listings left pending instead of computed in a background thread
+query_budget_test_settings = override_settings(
+    QUERY_BUDGET={'MODE': 'raise', 'DEFAULT': None, 'VIEWS': {}},
+    PAGE_CACHE={'TIMEOUT': 0},
+    IMAGE_PIPELINE={'MODE': 'queue', 'WORKERS': 1},
+    SIMILAR_LISTINGS={'MODE': 'queue'},
+)
+
+
+class MarketplaceRows:
+    """Seeded rows around one `viewer`, grown with add().
+
+    Every add() brings its own sellers, categories, listings with images,
+    conversations with messages and attachments, favorites and reviews in both
+    directions, so any related object loaded per row shows up as an extra query.
+    """
+
+    def __init__(self, viewer):
+        self.viewer = viewer
+        self.parent = Category.objects.create(name=f'Categorie {next(_sequence)}', slug=f'categorie-{next(_sequence)}')
+        self.conversation = self.partner = None
+
+    def user(self):
+        n = next(_sequence)
+        user = User.objects.create_user(f'user{n}', f'user{n}@example.com', 'parola-test-123', first_name=f'Nume{n}')
+        # QuerySet.update: UserProfile.save would resize the (missing) avatar file
+        UserProfile.objects.filter(user=user).update(avatar=f'avatars/user{n}.jpg', city='Cluj-Napoca')
+        return user
+
+    def listing(self, owner, category, **fields):
+        n = next(_sequence)
+        listing = Listing.objects.create(
+            title=f'Bicicletă {n}', description='Bicicletă de oraș, puțin folosită.', price=100 + n,
+            city='Cluj-Napoca', owner=owner, category=category, **fields,
+        )
+        # bulk_create: no file is read and nothing is scheduled for the image pipeline
+        ListingImage.objects.bulk_create([
+            ListingImage(listing=listing, image=f'listings/{n}-{i}.jpg', width=800, height=600, order=i)
+            for i in range(2)
+        ])
+        listing.refresh_cover_image()
+        return listing
+
+    def message(self, conversation, sender, receiver, attachments=1):
+        message = Message.objects.create(conversation=conversation, sender=sender, receiver=receiver, content='Mai este disponibil?')
+        MessageAttachment.objects.bulk_create([
+            MessageAttachment(message=message, file=f'chat/attachments/{message.pk}-{i}.jpg', filename=f'{i}.jpg', file_type='image', file_size=1)
+            for i in range(attachments)
+        ])
+        return message
+
+    def add(self, count=3):
+        for _ in range(count):
+            seller = self.user()
+            category = Category.objects.create(name=f'Subcategorie {next(_sequence)}', slug=f'subcategorie-{next(_sequence)}', parent=self.parent)
+            listing = self.listing(seller, category, is_featured=True)
+            own_listing = self.listing(self.viewer, category)
+
+            conversation = Conversation.objects.create(listing=listing)
+            conversation.participants.add(self.viewer, seller)
+            self.message(conversation, self.viewer, seller)
+            self.message(conversation, seller, self.viewer)
+            # the first conversation keeps growing, for the conversation page
+            if self.conversation is None:
+                self.conversation, self.partner = conversation, seller
+            else:
+                self.message(self.conversation, self.viewer, self.partner)
+                self.message(self.conversation, self.partner, self.viewer)
+
+            Favorite.objects.create(user=self.viewer, listing=listing)
+            received = Review.objects.create(reviewer=seller, reviewed_user=self.viewer, listing=own_listing, rating=5, comment='Totul a fost în regulă.', transaction_type='sale')
+            ReviewResponse.objects.create(review=received, response_text='Mulțumesc!')
+            given = Review.objects.create(reviewer=self.viewer, reviewed_user=seller, listing=listing, rating=4, comment='Vânzător de încredere.', transaction_type='purchase')
+            ReviewResponse.objects.create(review=given, response_text='Mulțumesc!')
+
+
+class QueryCountTestMixin:
+    """Assertions that a page runs a fixed number of queries, however many rows it shows."""
+
+    def count_queries(self, url):
+        # the first request fills the process caches (category tree, gazetteer, favorites)
+        self.assertEqual(self.client.get(url).status_code, 200, url)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return len(ctx)
+
+    def assertQueryCountStable(self, url, grow):
+        before = self.count_queries(url)
+        grow()
+        after = self.count_queries(url)
+        self.assertEqual(before, after, f'{url} ran {before} queries, then {after} with more rows')
+
+
+class ReplicaTestMixin:
+    """For a TransactionTestCase: a read replica 'replica', as a second connection to the test database.
+
+    The replica sees the committed rows at once (set READ_REPLICAS to route to
+    it), so the tests check which connection ran the queries, not what they found.
+    """
+    replica = 'replica'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # added after the test runner's checks and the test case's guards on the databases it does
+        # not use, and removed before; as a mirror it is not flushed
+        default = connections['default'].settings_dict
+        connections.settings[cls.replica] = {**default, 'TEST': {**default['TEST'], 'MIRROR': 'default'}}
+        cls.databases = {*cls.databases, cls.replica}
+
+    @classmethod
+    def tearDownClass(cls):
+        connections[cls.replica].close()
+        del connections[cls.replica]
+        del connections.settings[cls.replica]
+        cls.databases = cls.databases - {cls.replica}
+        super().tearDownClass()
+
+    def queries_by_database(self, request, *args, **kwargs):
+        """Call `request` (e.g. self.client.get) and return (its response, {alias: [sql, ...]})."""
+        with ExitStack() as stack:
+            captured = {alias: stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in ('default', self.replica)}
+            response = request(*args, **kwargs)
+        return response, {alias: [query['sql'] for query in ctx.captured_queries] for alias, ctx in captured.items()}
@@ -3,6 +3,10 @@ from allauth.account.adapter import DefaultAccountAdapter
 from django.contrib.auth.models import User
 import re
 
+from listings.slugs import next_free_value, random_value, save_unique
+
+USERNAME_MAX_LENGTH = 30
+
 
 class CustomAccountAdapter(DefaultAccountAdapter):
     def generate_unique_username(self, txts, regex=None):
@@ -12,22 +16,27 @@ class CustomAccountAdapter(DefaultAccountAdapter):
             email_part = txts[0].split('@')[0]
             # get rid of special characters
             username = re.sub(r'[^a-zA-Z0-9._-]', '', email_part)
-            username = username[:30]  # limit --> 30ch
+            username = username[:USERNAME_MAX_LENGTH] or 'user'  # limit --> 30ch
             
-            # check if allready exists
-            counter = 1
-            original_username = username
-            while User.objects.filter(username=username).exists():
-                username = f"{original_username}{counter}"
-                counter += 1
-                if len(username) > 30:
-                    username = f"{original_username[:25]}{counter}"
-            
-            return username
+            # next free numeric suffix (ion, ion1, ion2, ...) in one query
+            return next_free_value(User.objects.all(), 'username', username, separator='', max_length=USERNAME_MAX_LENGTH)
         
-        # Fallback 
+        # Fallback
         return super().generate_unique_username(txts, regex)
     
+    def save_user(self, request, user, form, commit=True):
+        user = super().save_user(request, user, form, commit=False)
+        if commit:
+            # two signups with the same email prefix can race for the same username
+            save_unique(
+                user, 'username',
+                allocate=lambda attempt: (
+                    self.generate_unique_username([user.email])
+                    if attempt == 1 else random_value(user.username, separator='', max_length=USERNAME_MAX_LENGTH)
+                ),
+            )
+        return user
+    
     def populate_username(self, request, user):
         if hasattr(user, 'email') and user.email:
             username = self.generate_unique_username([user.email])
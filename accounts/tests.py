@@ -1,3 +1,65 @@
-from django.test import TestCase
+from datetime import timedelta
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import parse_http_date
+
+from listings.models import Listing
+from Micu_market.testing import MarketplaceRows, QueryCountTestMixin, query_budget_test_settings
+from .models import UserProfile
+
+User = get_user_model()
+
+
+@query_budget_test_settings
+class ProfilePageQueryTests(QueryCountTestMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create_user('viewer', 'viewer@example.com', 'parola-test-123')
+        cls.rows = MarketplaceRows(cls.viewer)
+        cls.rows.add()
+
+    def test_public_profile(self):
+        self.assertQueryCountStable(reverse('accounts:public_profile', args=[self.viewer.username]), self.rows.add)
+
+    def test_own_profile(self):
+        self.client.force_login(self.viewer)
+        self.assertQueryCountStable(reverse('accounts:profile'), self.rows.add)
+        self.assertQueryCountStable(reverse('accounts:my_listings'), self.rows.add)
+
+
+@override_settings(PAGE_CACHE={'TIMEOUT': 0})
+class PublicProfileValidatorTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('seller', 'seller@example.com', 'parola-test-123')
+        now = timezone.now()
+        User.objects.filter(pk=self.owner.pk).update(date_joined=now - timedelta(days=5))
+        UserProfile.objects.filter(user=self.owner).update(updated_at=now - timedelta(days=5))
+        self.listings = []
+        for days in (3, 2):
+            listing = Listing.objects.create(title=f'Bicicletă {days}', description='Puțin folosită.', price=100, city='Cluj-Napoca', owner=self.owner)
+            Listing.objects.filter(pk=listing.pk).update(updated_at=now - timedelta(days=days))
+            self.listings.append(listing)
+        self.url = reverse('accounts:public_profile', args=[self.owner.username])
+
+    def assertChangedSince(self, last_modified):
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(parse_http_date(response.headers['Last-Modified']), parse_http_date(last_modified))
+
+    def test_unchanged_profile_is_not_modified(self):
+        last_modified = self.client.get(self.url).headers['Last-Modified']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+    def test_deleting_the_newest_listing_moves_last_modified_forward(self):
+        last_modified = self.client.get(self.url).headers['Last-Modified']
+        self.listings[-1].delete()
+        self.assertChangedSince(last_modified)
+
+    def test_deactivating_the_newest_listing_moves_last_modified_forward(self):
+        last_modified = self.client.get(self.url).headers['Last-Modified']
+        Listing.objects.filter(pk=self.listings[-1].pk).update(status='inactive', updated_at=timezone.now())
+        self.assertChangedSince(last_modified)
@@ -5,9 +5,14 @@ from django.contrib.auth.models import User
 from django.contrib import messages
 from django.urls import reverse
 from django.core.paginator import Paginator
+from django.db.models import Count, Max, Q
+from django.http import Http404
 from .forms import CustomUserCreationForm, CustomAuthenticationForm, UserProfileForm
 from .models import UserProfile
 from listings.models import Listing
+from listings.conditional import make_etag, page_not_modified, set_page_validators, viewer_key
+from Micu_market.db_router import read_from_replica
+from Micu_market.query_budget import query_budget
 
 def register_view(request):
     if request.user.is_authenticated:
@@ -51,6 +56,7 @@ def logout_view(request):
     return redirect('listings:home')
 
 @login_required
+@query_budget(9)
 def profile_view(request):
     # check if user has a profile
     profile, created = UserProfile.objects.get_or_create(user=request.user)
@@ -88,16 +94,40 @@ def profile_edit_view(request):
     }
     return render(request, 'accounts/profile_edit.html', context)
 
+@query_budget(10)
+@read_from_replica
 def public_profile_view(request, username):
+    # validators first: the profile (saved with the user, on new ratings and when one of
+    # the user's listings is deleted) and the listings. The dates only move forward:
+    # updated_at covers every status, so a deactivated listing still counts with its change
+    owner = User.objects.filter(username=username).values('id', 'date_joined', 'profile__updated_at').first()
+    if owner is None:
+        raise Http404("Utilizatorul nu există")
+    active = Q(status='active')
+    listing_stats = Listing.objects.filter(owner_id=owner['id']).aggregate(
+        count=Count('id', filter=active, distinct=True),
+        updated_at=Max('updated_at'),
+        image_count=Count('images', filter=active, distinct=True),
+        images_updated_at=Max('images__updated_at'),
+    )
+    etag = make_etag(owner['id'], owner['profile__updated_at'], *listing_stats.values(), viewer_key(request))
+    last_modified = max(filter(None, [
+        owner['date_joined'], owner['profile__updated_at'], listing_stats['updated_at'], listing_stats['images_updated_at'],
+    ]))
+    response = page_not_modified(request, etag, last_modified)
+    if response is not None:
+        return response
+    
     user = get_object_or_404(User, username=username)
-    profile, created = UserProfile.objects.get_or_create(user=user)
+    # a plain read, so it goes to the replica; get_or_create runs on the primary, only for a missing profile
+    profile = UserProfile.objects.filter(user=user).first() or UserProfile.objects.get_or_create(user=user)[0]
     
     # active listings of user
-    listings = Listing.objects.filter(owner=user, status='active').order_by('-created_at')[:6]
+    listings = Listing.objects.filter(owner=user, status='active').select_related('category').order_by('-created_at')[:6]
     
     # public stats
     user_stats = {
-        'total_listings': Listing.objects.filter(owner=user, status='active').count(),
+        'total_listings': listing_stats['count'],
         'member_since': user.date_joined,
         'average_rating': profile.average_rating,
     }
@@ -108,11 +138,12 @@ def public_profile_view(request, username):
         'listings': listings,
         'user_stats': user_stats,
     }
-    return render(request, 'accounts/public_profile.html', context)
+    return set_page_validators(request, render(request, 'accounts/public_profile.html', context), etag, last_modified)
 
 @login_required
+@query_budget(7)
 def my_listings_view(request):
-    listings = Listing.objects.filter(owner=request.user).order_by('-created_at')
+    listings = Listing.objects.filter(owner=request.user).select_related('category').order_by('-created_at')
     
     # filter by status
     status_filter = request.GET.get('status')
@@ -0,0 +1,65 @@
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from listings.pagination import KEYSET_ORDERINGS, KeysetPaginator
+
+
+class KeysetPagination(BasePagination):
+    """listings.pagination.KeysetPaginator for DRF views.
+
+    Query parameters: `ordering` (one of KEYSET_ORDERINGS), `page_size` and
+    the opaque `cursor` from the `next`/`previous` links. The count is computed
+    (or estimated) on the first page only and carried in the cursor.
+    """
+
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'ordering'
+    page_size_query_param = 'page_size'
+    page_size = api_settings.PAGE_SIZE or 24
+    max_page_size = 100
+    default_ordering = '-created_at'
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def get_ordering(self, request):
+        ordering = request.query_params.get(self.ordering_query_param)
+        return KEYSET_ORDERINGS.get(ordering, KEYSET_ORDERINGS[self.default_ordering])
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.paginator = KeysetPaginator(queryset, self.get_ordering(request), per_page=self.get_page_size(request))
+        self.page = self.paginator.get_page(request.query_params.get(self.cursor_query_param))
+        return list(self.page)
+
+    def get_link(self, cursor):
+        if cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def get_next_link(self):
+        return self.get_link(self.page.next_cursor)
+
+    def get_previous_link(self):
+        if not self.page.has_previous():
+            return None
+        # the first page is addressed without a cursor, so it carries a fresh count
+        cursor = self.page.previous_cursor
+        if cursor is None:
+            return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+        return self.get_link(cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'count': self.paginator.count,
+            'count_is_estimate': self.paginator.count_is_estimate,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
@@ -0,0 +1,113 @@
+from django.core.files.storage import default_storage
+from rest_framework import serializers
+
+from categories.tree import get_category_tree
+from listings.forms import validate_listing_price
+from listings.models import Listing
+
+
+def variant_urls(variants):
+    # {size: {format: {name, width, height}}} -> the same with public URLs instead of storage names
+    return {
+        size: {fmt: {'url': default_storage.url(v['name']), 'width': v['width'], 'height': v['height']} for fmt, v in formats.items()}
+        for size, formats in (variants or {}).items()
+    }
+
+
+class CategoryField(serializers.Field):
+    """Category as {id, slug, name, parent_id}, read from the cached category tree (no join, no query).
+
+    Accepts a slug or an id on write, like the bulk import.
+    """
+    default_error_messages = {
+        'invalid_choice': 'Selectează o categorie validă.',
+    }
+
+    def get_attribute(self, instance):
+        return instance.category_id
+
+    def to_representation(self, value):
+        category = get_category_tree().get(value)
+        if category is None:
+            return None
+        return {'id': category.id, 'slug': category.slug, 'name': category.name, 'parent_id': category.parent_id}
+
+    def to_internal_value(self, data):
+        value = str(data).strip()
+        tree = get_category_tree()
+        category = tree.get_by_slug(value)
+        if category is None and value.isdigit():
+            category = tree.get(int(value))
+        if category is None or not category.is_active:
+            self.fail('invalid_choice')
+        return category
+
+
+class SparseFieldsMixin:
+    """Keep only the fields listed in context['fields'], when the view passes one."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields = self.context.get('fields')
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class ListingSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    url = serializers.HyperlinkedIdentityField(view_name='api:listing-detail', lookup_field='slug')
+    category = CategoryField()
+    owner = serializers.CharField(source='owner.username', read_only=True, default=None)
+    cover = serializers.SerializerMethodField()
+    images = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Listing
+        fields = [
+            'id', 'url', 'slug', 'title', 'description', 'price', 'negotiable', 'condition', 'category',
+            'city', 'county', 'location', 'latitude', 'longitude', 'contact_phone', 'status',
+            'is_featured', 'views_count', 'owner', 'cover', 'images', 'created_at', 'updated_at', 'expires_at',
+        ]
+        # status is moderated like on the site (admin only): an owner reactivating an expired
+        # listing would otherwise bypass expires_at until the next sweep
+        read_only_fields = [
+            'slug', 'latitude', 'longitude', 'status', 'is_featured', 'views_count', 'created_at', 'updated_at', 'expires_at',
+        ]
+        extra_kwargs = {
+            'price': {'validators': [validate_listing_price]},
+            'county': {'required': False},
+        }
+
+    def get_cover(self, listing):
+        # the denormalized cover_* columns, no image query
+        if not listing.cover_image:
+            return None
+        return {
+            'url': listing.cover_image.url,
+            'width': listing.cover_width,
+            'height': listing.cover_height,
+            'variants': variant_urls(listing.cover_variants),
+        }
+
+    def get_images(self, listing):
+        # prefetched by the view, see api/views.py
+        return [
+            {
+                'id': image.id,
+                'url': image.image.url,
+                'width': image.width,
+                'height': image.height,
+                'alt_text': image.alt_text,
+                'variants': variant_urls(image.variants),
+            }
+            for image in listing.images.all()
+        ]
+
+
+class CategorySerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    slug = serializers.CharField()
+    name = serializers.CharField()
+    icon = serializers.CharField()
+    parent_id = serializers.IntegerField(allow_null=True)
+    order = serializers.IntegerField()
@@ -1,3 +1,100 @@
-from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
 
-# Create your tests here.
+from categories.models import Category
+from listings.models import Listing
+from .views import LIST_FIELDS
+
+User = get_user_model()
+
+
+@override_settings(SIMILAR_LISTINGS={'MODE': 'queue'}, IMAGE_PIPELINE={'MODE': 'queue', 'WORKERS': 1})
+class ListingApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user('seller', 'seller@example.com', 'parola-test-123')
+        self.other = User.objects.create_user('buyer', 'buyer@example.com', 'parola-test-123')
+        self.category = Category.objects.create(name='Biciclete', slug='biciclete')
+        self.listing = self.create(title='Bicicletă de oraș')
+        self.inactive = self.create(title='Canapea', status='inactive')
+
+    def create(self, **fields):
+        fields = {'description': 'Puțin folosită.', 'price': 300, 'city': 'Cluj-Napoca', 'owner': self.owner, 'category': self.category, **fields}
+        return Listing.objects.create(**fields)
+
+    def detail_url(self, listing):
+        return reverse('api:listing-detail', kwargs={'slug': listing.slug})
+
+    def test_list_fields(self):
+        response = self.client.get(reverse('api:listing-list'))
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([row['id'] for row in results], [self.listing.id])
+        self.assertEqual(list(results[0]), LIST_FIELDS)
+        self.assertEqual(results[0]['category'], {'id': self.category.id, 'slug': 'biciclete', 'name': 'Biciclete', 'parent_id': None})
+
+        sparse = self.client.get(reverse('api:listing-list'), {'fields': 'id,title,owner'}).json()['results']
+        self.assertEqual(sparse, [{'id': self.listing.id, 'title': 'Bicicletă de oraș', 'owner': 'seller'}])
+        self.assertEqual(self.client.get(reverse('api:listing-list'), {'fields': 'id,password'}).status_code, 400)
+
+    def test_bad_price_filter_is_ignored(self):
+        cheap = self.create(title='Lampă', price=20)
+        response = self.client.get(reverse('api:listing-list'), {'min_price': 'abc', 'max_price': '100', 'fields': 'id'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'], [{'id': cheap.id}])
+
+    def test_detail_visibility(self):
+        self.assertEqual(self.client.get(self.detail_url(self.inactive)).status_code, 404)
+        self.client.force_login(self.other)
+        self.assertEqual(self.client.get(self.detail_url(self.inactive)).status_code, 404)
+        self.client.force_login(self.owner)
+        self.assertEqual(self.client.get(self.detail_url(self.inactive)).json()['status'], 'inactive')
+
+    def test_detail_is_not_modified(self):
+        etag = self.client.get(self.detail_url(self.listing)).headers['ETag']
+        self.assertEqual(self.client.get(self.detail_url(self.listing), HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_anonymous_cannot_write(self):
+        response = self.client.post(reverse('api:listing-list'), {'title': 'Masă'})
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(self.client.delete(self.detail_url(self.listing)).status_code, 401)
+
+    def test_create_sets_the_owner_and_ignores_read_only_fields(self):
+        self.client.force_login(self.other)
+        response = self.client.post(reverse('api:listing-list'), {
+            'title': 'Masă de lemn', 'description': 'Masă extensibilă.', 'price': '250.00', 'city': 'Cluj-Napoca',
+            'category': 'biciclete', 'condition': 'good',
+            'owner': 'seller', 'status': 'sold', 'is_featured': True, 'views_count': 1000, 'slug': 'alt-slug',
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 201, response.content)
+        listing = Listing.objects.get(id=response.json()['id'])
+        self.assertEqual(
+            (listing.owner, listing.status, listing.is_featured, listing.views_count, listing.slug),
+            (self.other, 'active', False, 0, 'masa-de-lemn'),
+        )
+
+    def test_create_validates_the_category(self):
+        self.client.force_login(self.other)
+        response = self.client.post(reverse('api:listing-list'), {
+            'title': 'Masă', 'description': 'Masă.', 'price': '250.00', 'city': 'Cluj-Napoca', 'category': 'nu-exista',
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('category', response.json())
+
+    def test_only_the_owner_can_change_a_listing(self):
+        self.client.force_login(self.other)
+        self.assertEqual(self.client.patch(self.detail_url(self.listing), {'title': 'Furat'}, content_type='application/json').status_code, 403)
+        self.assertEqual(self.client.delete(self.detail_url(self.listing)).status_code, 403)
+
+        self.client.force_login(self.owner)
+        response = self.client.patch(self.detail_url(self.listing), {'title': 'Bicicletă nouă', 'status': 'sold'}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.listing.refresh_from_db()
+        # status is read-only in the API, as on the site's edit form
+        self.assertEqual((self.listing.title, self.listing.status), ('Bicicletă nouă', 'active'))
+        self.assertEqual(response.headers['ETag'], self.client.get(self.detail_url(self.listing)).headers['ETag'])
+
+        self.assertEqual(self.client.delete(self.detail_url(self.listing)).status_code, 204)
+        self.assertFalse(Listing.objects.filter(pk=self.listing.pk).exists())
@@ -1,11 +1,14 @@
 from django.urls import path
-from .views import api_create_listing_view
-from .views import api_listing_detail_view
-from .views import api_listing_list_view
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+
+from .views import CategoryListView, ListingDetailView, ListingListView
 
 urlpatterns = [
+    path("v1/listings/", ListingListView.as_view(), name="listing-list"),
+    path("v1/listings/<slug:slug>/", ListingDetailView.as_view(), name="listing-detail"),
+    path("v1/categories/", CategoryListView.as_view(), name="category-list"),
 
-	path("api_listing_list", api_listing_list_view),
-	path("api_listing_detail", api_listing_detail_view),
-	path("api_create_listing", api_create_listing_view),
+    # JWT for the mobile client; the site itself uses the session
+    path("v1/token/", TokenObtainPairView.as_view(), name="token"),
+    path("v1/token/refresh/", TokenRefreshView.as_view(), name="token-refresh"),
 ]
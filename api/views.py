@@ -1,15 +1,179 @@
-from django.shortcuts import render
+from django.db.models import Prefetch, Q
+from django.shortcuts import get_object_or_404
+from rest_framework import generics, permissions, serializers
+from rest_framework.response import Response
+from rest_framework.views import APIView
 
-# Create your views here.
+from categories.tree import get_category_tree, tree_version
+from listings.conditional import listing_version, make_etag, not_modified, set_validators
+from listings.facets import filter_listings
+from listings.models import Listing, ListingImage
+from .pagination import KeysetPagination
+from .permissions import IsOwnerOrReadOnly
+from .serializers import CategorySerializer, ListingSerializer
 
-def api_listing_list_view(request):
-	context = {}
-	return render(request, 'api/listings_list.html', context)
+# default fields of a list page; `?fields=` picks any of ListingSerializer.Meta.fields
+LIST_FIELDS = [
+    'id', 'url', 'slug', 'title', 'price', 'negotiable', 'condition', 'category',
+    'city', 'county', 'status', 'is_featured', 'cover', 'created_at', 'updated_at',
+]
+# model columns behind the fields that are not plain model fields
+FIELD_COLUMNS = {
+    'url': ['slug'],
+    'owner': ['owner__username'],
+    'cover': ['cover_image', 'cover_width', 'cover_height', 'cover_variants'],
+    'images': [],
+}
+# always loaded: keyset ordering keys and the columns that make up the ETag
+BASE_COLUMNS = ['id', 'slug', 'owner', 'created_at', 'updated_at', 'price', 'cover_image', 'cover_variants']
 
-def api_listing_detail_view(request):
-	context = {}
-	return render(request, 'api/listings_detail.html', context)
 
-def api_create_listing_view(request):
-	context = {}
-	return render(request, 'api/create_listing.html', context)
+class ListingQueryMixin:
+    """Parse `?fields=` and load only what those fields need, in a fixed number of queries."""
+
+    default_fields = None
+
+    def requested_fields(self):
+        if self.request.method not in permissions.SAFE_METHODS:
+            return None
+        value = self.request.query_params.get('fields')
+        if not value:
+            return self.default_fields
+        fields = [name.strip() for name in value.split(',') if name.strip()]
+        unknown = sorted(set(fields) - set(ListingSerializer.Meta.fields))
+        if unknown:
+            raise serializers.ValidationError({'fields': f"Câmpuri necunoscute: {', '.join(unknown)}."})
+        return fields
+
+    def shape_queryset(self, listings, fields):
+        fields = set(fields or ListingSerializer.Meta.fields)
+        columns = set(BASE_COLUMNS)
+        for name in fields:
+            columns.update(FIELD_COLUMNS.get(name, [name]))
+        if 'owner' in fields:
+            listings = listings.select_related('owner')
+        if 'images' in fields:
+            # imported images still being downloaded have no file yet
+            listings = listings.prefetch_related(Prefetch('images', queryset=ListingImage.objects.exclude(image='')))
+        return listings.only(*columns)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['fields'] = self.sparse_fields
+        return context
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.sparse_fields = self.requested_fields()
+
+
+class ListingListView(ListingQueryMixin, generics.ListCreateAPIView):
+    """Active listings with the site's filters (search, category, city, radius, price, condition, seller).
+
+    Paginated by key (`cursor`, `ordering`, `page_size`). Each page has an
+    ETag over its rows, so polling clients get 304 while nothing on it changed.
+    """
+
+    serializer_class = ListingSerializer
+    pagination_class = KeysetPagination
+    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    default_fields = LIST_FIELDS
+
+    def get_queryset(self):
+        listings, _ = filter_listings(self.request.query_params)
+        return self.shape_queryset(listings, self.sparse_fields)
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.get_queryset())
+        paginator = self.paginator.paginator
+
+        # the rows are loaded but not serialized yet; cover_* change without an updated_at bump
+        etag = make_etag(
+            ','.join(self.sparse_fields), paginator.count, paginator.count_is_estimate, tree_version(),
+            self.paginator.page.has_next(), self.paginator.page.has_previous(),
+            *(f'{listing.id}.{listing.updated_at.timestamp()}.{listing.cover_image}.{listing.cover_variants}' for listing in page),
+            *(f'{image.id}.{image.updated_at.timestamp()}' for listing in page if 'images' in self.sparse_fields for image in listing.images.all()),
+        )
+        last_modified = max((listing.updated_at for listing in page), default=None)
+        # If-Modified-Since alone cannot tell that a row left the page, so only the ETag is checked
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+
+        response = self.get_paginated_response(self.get_serializer(page, many=True).data)
+        return set_validators(response, etag, last_modified)
+
+    def perform_create(self, serializer):
+        # Listing.save allocates the slug and normalizes the location
+        serializer.save(owner=self.request.user)
+
+
+class ListingDetailView(ListingQueryMixin, generics.RetrieveUpdateDestroyAPIView):
+    """One listing: active ones for everybody, any status for its owner.
+
+    The validators come from one aggregate query (listings/conditional.py), so
+    a 304 or a failed If-Match costs no other query.
+    """
+
+    serializer_class = ListingSerializer
+    permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsOwnerOrReadOnly]
+    lookup_field = 'slug'
+
+    def get_queryset(self):
+        visible = Q(status='active')
+        if self.request.user.is_authenticated:
+            visible |= Q(owner=self.request.user)
+        return Listing.objects.filter(visible)
+
+    def validators(self):
+        version = listing_version(self.get_queryset().filter(slug=self.kwargs['slug']))
+        if version is None:
+            return None, None
+        return make_etag(version.token, ','.join(self.sparse_fields or []), tree_version()), version.last_modified
+
+    def dispatch_conditional(self, request, handler, *args, **kwargs):
+        etag, last_modified = self.validators()
+        if etag is not None:
+            response = not_modified(request, etag, last_modified)
+            if response is not None:
+                return response
+        response = handler(request, *args, **kwargs)
+        if request.method in permissions.SAFE_METHODS and etag is not None:
+            set_validators(response, etag, last_modified)
+        elif response.status_code == 200:
+            # after an update, the new version
+            etag, last_modified = self.validators()
+            if etag is not None:
+                set_validators(response, etag, last_modified)
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        def handler(request, *args, **kwargs):
+            listing = get_object_or_404(self.shape_queryset(self.get_queryset(), self.sparse_fields), slug=self.kwargs['slug'])
+            return Response(self.get_serializer(listing).data)
+        return self.dispatch_conditional(request, handler, *args, **kwargs)
+
+    def update(self, request, *args, **kwargs):
+        return self.dispatch_conditional(request, super().update, *args, **kwargs)
+
+    def destroy(self, request, *args, **kwargs):
+        return self.dispatch_conditional(request, super().destroy, *args, **kwargs)
+
+
+class CategoryListView(APIView):
+    """Active categories from the cached tree, in display order; parents come before children."""
+
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        etag = make_etag(tree_version())
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+        tree = get_category_tree()
+        categories = []
+        roots = tree.active_children(None)
+        for root in roots:
+            categories.append(root)
+            categories.extend(tree.descendants(root.id))
+        return set_validators(Response(CategorySerializer(categories, many=True).data), etag)
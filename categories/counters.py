@@ -0,0 +1,114 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F
+
+from .tree import get_category_tree
+
+
+def listing_counter_state(listing):
+    # (category_id, is counted) as last stored; read from __dict__ so that
+    # deferred fields never trigger a query
+    values = listing.__dict__
+    return values.get('category_id'), values.get('status') == 'active'
+
+
+def listing_counter_deltas(old_state, new_state):
+    deltas = defaultdict(int)
+    old_category, old_active = old_state
+    new_category, new_active = new_state
+    if old_category and old_active:
+        deltas[old_category] -= 1
+    if new_category and new_active:
+        deltas[new_category] += 1
+    return {category_id: delta for category_id, delta in deltas.items() if delta}
+
+
+def apply_listing_deltas(deltas):
+    """Apply {category_id: delta} to the own and subtree counters in one transaction."""
+    from .models import CategoryListingCount
+
+    if not deltas:
+        return
+    tree = get_category_tree()
+    own = {}
+    total = defaultdict(int)
+    for category_id, delta in deltas.items():
+        if tree.get(category_id) is None:
+            continue
+        own[category_id] = delta
+        for counted_id in tree.counted_ancestor_ids(category_id):
+            total[counted_id] += delta
+
+    with transaction.atomic():
+        CategoryListingCount.objects.bulk_create(
+            [CategoryListingCount(category_id=category_id) for category_id in total],
+            ignore_conflicts=True,
+        )
+        # one UPDATE per distinct (own, total) pair, usually one or two
+        by_change = defaultdict(list)
+        for category_id, total_delta in total.items():
+            by_change[(own.get(category_id, 0), total_delta)].append(category_id)
+        for (own_delta, total_delta), category_ids in by_change.items():
+            if not own_delta and not total_delta:
+                continue
+            CategoryListingCount.objects.filter(category_id__in=category_ids).update(
+                own_count=F('own_count') + own_delta,
+                total_count=F('total_count') + total_delta,
+            )
+
+
+def rebuild_total_counts():
+    """Recompute subtree counts from the own counts, e.g. after the tree changed."""
+    from .models import CategoryListingCount
+
+    tree = get_category_tree()
+    with transaction.atomic():
+        rows = {row.category_id: row for row in CategoryListingCount.objects.select_for_update()}
+        missing = [CategoryListingCount(category_id=category_id) for category_id in tree.by_id if category_id not in rows]
+        if missing:
+            CategoryListingCount.objects.bulk_create(missing, ignore_conflicts=True)
+            rows = {row.category_id: row for row in CategoryListingCount.objects.select_for_update()}
+
+        totals = defaultdict(int)
+        for category_id, row in rows.items():
+            if row.own_count and tree.get(category_id) is not None:
+                for counted_id in tree.counted_ancestor_ids(category_id):
+                    totals[counted_id] += row.own_count
+
+        changed = []
+        for category_id, row in rows.items():
+            if row.total_count != totals[category_id]:
+                row.total_count = totals[category_id]
+                changed.append(row)
+        CategoryListingCount.objects.bulk_update(changed, ['total_count'], batch_size=500)
+    return len(changed)
+
+
+def rebuild_category_counters():
+    """Recount every category from the listings table, repairing any drift."""
+    from listings.models import Listing
+    from .models import CategoryListingCount
+
+    tree = get_category_tree()
+    own = dict(
+        Listing.objects.filter(status='active', category__isnull=False)
+        .values_list('category_id')
+        .annotate(n=Count('id'))
+        .order_by()
+    )
+    with transaction.atomic():
+        rows = {row.category_id: row for row in CategoryListingCount.objects.select_for_update()}
+        new_rows = []
+        changed = []
+        for category_id in tree.by_id:
+            row = rows.get(category_id)
+            if row is None:
+                new_rows.append(CategoryListingCount(category_id=category_id, own_count=own.get(category_id, 0)))
+            elif row.own_count != own.get(category_id, 0):
+                row.own_count = own.get(category_id, 0)
+                changed.append(row)
+        CategoryListingCount.objects.bulk_create(new_rows, ignore_conflicts=True)
+        CategoryListingCount.objects.bulk_update(changed, ['own_count'], batch_size=500)
+    rebuild_total_counts()
+    return len(new_rows) + len(changed)
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from categories.counters import rebuild_category_counters
+
+
+class Command(BaseCommand):
+    help = "Recount active listings per category from scratch, repairing counter drift"
+
+    def handle(self, *args, **options):
+        fixed = rebuild_category_counters()
+        self.stdout.write(self.style.SUCCESS(f"Category counters rebuilt ({fixed} categories corrected)."))
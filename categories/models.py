@@ -1,6 +1,13 @@
 from django.db import models
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from django.urls import reverse
 
+from listings.page_cache import bump_generation
+from .tree import get_category_tree, invalidate_category_tree
+from .counters import rebuild_total_counts
+
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
     slug = models.SlugField(max_length=100, unique=True)
@@ -25,7 +32,56 @@ class Category(models.Model):
     
     @property
     def get_all_children(self):
-        children = list(self.subcategories.filter(is_active=True))
-        for child in self.subcategories.filter(is_active=True):
-            children.extend(child.get_all_children)
-        return children
+        # answered from the cached category tree, no queries per node
+        return get_category_tree().descendants(self.id)
+    
+    @property
+    def get_ancestors(self):
+        return get_category_tree().ancestors(self.id)
+    
+    @property
+    def get_breadcrumbs(self):
+        return get_category_tree().breadcrumbs(self.id)
+    
+    def get_descendant_ids(self, include_self=True):
+        return get_category_tree().descendant_ids(self.id, include_self=include_self)
+
+
+class CategoryListingCount(models.Model):
+    """Active listings per category, kept up to date by the listing signals"""
+    category = models.OneToOneField(Category, on_delete=models.CASCADE, primary_key=True, related_name='listing_count')
+    own_count = models.IntegerField(default=0, verbose_name="Anunțuri active proprii")
+    total_count = models.IntegerField(default=0, verbose_name="Anunțuri active cu subcategorii")
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['-total_count'], name='categories_total_count_idx'),
+        ]
+        verbose_name = 'Număr anunțuri categorie'
+        verbose_name_plural = 'Număr anunțuri categorii'
+    
+    def __str__(self):
+        return f"{self.category.name}: {self.total_count}"
+
+
+# signals to keep the cached category tree in sync
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_tree_on_change(sender, instance, **kwargs):
+    invalidate_category_tree()
+    # other processes could reload the old rows before the transaction commits
+    transaction.on_commit(invalidate_category_tree)
+
+
+# subtree counts depend on parents and is_active, recompute them from the own counts
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def rebuild_counts_on_change(sender, instance, **kwargs):
+    rebuild_total_counts()
+
+
+# category blocks and the category names on listing cards are in cached pages
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def bump_page_cache_on_change(sender, instance, **kwargs):
+    bump_generation('categories')
@@ -1,3 +1,90 @@
-from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase
 
-# Create your tests here.
+from listings.models import Listing
+from .counters import listing_counter_deltas, rebuild_category_counters
+from .models import Category, CategoryListingCount
+
+User = get_user_model()
+
+
+class ListingCounterDeltaTests(SimpleTestCase):
+    def test_deltas(self):
+        cases = [
+            ((None, False), (3, True), {3: 1}),
+            ((3, True), (None, False), {3: -1}),
+            ((3, True), (4, True), {3: -1, 4: 1}),
+            ((3, True), (3, False), {3: -1}),
+            ((3, False), (4, True), {4: 1}),
+            ((3, True), (3, True), {}),
+            ((None, True), (None, True), {}),
+        ]
+        for old_state, new_state, deltas in cases:
+            with self.subTest(old=old_state, new=new_state):
+                self.assertEqual(listing_counter_deltas(old_state, new_state), deltas)
+
+
+class CategoryCounterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user('seller', 'seller@example.com', 'parola-test-123')
+        self.parent = Category.objects.create(name='Sport', slug='sport')
+        self.bikes = Category.objects.create(name='Biciclete', slug='biciclete', parent=self.parent)
+        self.skis = Category.objects.create(name='Schiuri', slug='schiuri', parent=self.parent)
+
+    def counts(self):
+        return {
+            row.category_id: (row.own_count, row.total_count)
+            for row in CategoryListingCount.objects.all()
+            if row.own_count or row.total_count
+        }
+
+    def create(self, category, **fields):
+        return Listing.objects.create(
+            title='Bicicletă', description='Puțin folosită.', price=100, city='Cluj-Napoca',
+            owner=self.owner, category=category, **fields,
+        )
+
+    def test_saves_and_deletes_move_the_counters(self):
+        listing = self.create(self.bikes)
+        self.create(self.bikes, status='inactive')
+        self.assertEqual(self.counts(), {self.bikes.id: (1, 1), self.parent.id: (0, 1)})
+
+        listing.category = self.skis
+        listing.save()
+        self.assertEqual(self.counts(), {self.skis.id: (1, 1), self.parent.id: (0, 1)})
+
+        listing.status = 'inactive'
+        listing.save()
+        self.assertEqual(self.counts(), {})
+
+        listing.status = 'active'
+        listing.save()
+        listing.delete()
+        self.assertEqual(self.counts(), {})
+
+    def test_update_fields_without_status_or_category_leave_the_counters(self):
+        listing = self.create(self.bikes)
+        Listing.objects.filter(pk=listing.pk).update(status='inactive')
+        listing.title = 'Bicicletă de oraș'
+        listing.save(update_fields=['title'])
+        # the stale counter is only repaired by a rebuild
+        self.assertEqual(self.counts(), {self.bikes.id: (1, 1), self.parent.id: (0, 1)})
+        rebuild_category_counters()
+        self.assertEqual(self.counts(), {})
+
+    def test_inactive_category_is_left_out_of_its_parent(self):
+        self.bikes.is_active = False
+        self.bikes.save()
+        self.create(self.bikes)
+        self.assertEqual(self.counts(), {self.bikes.id: (1, 1)})
+
+    def test_rebuild_matches_the_signals(self):
+        for category in (self.bikes, self.bikes, self.skis, self.parent):
+            self.create(category)
+        self.create(self.skis, status='inactive')
+        counts = self.counts()
+        self.assertEqual(counts, {self.bikes.id: (2, 2), self.skis.id: (1, 1), self.parent.id: (1, 4)})
+        self.assertEqual(rebuild_category_counters(), 0)
+        self.assertEqual(self.counts(), counts)
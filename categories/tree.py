@@ -0,0 +1,131 @@
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+from Micu_market.db_router import reading_from_primary
+
+TREE_VERSION_KEY = 'categories:tree:version'
+
+
+class CategoryTree:
+    """In-memory index over the whole category table, built from one query."""
+
+    def __init__(self, categories):
+        self.by_id = {}
+        self.by_slug = {}
+        self.children = {}
+        for category in categories:
+            self.by_id[category.id] = category
+            self.by_slug[category.slug] = category
+            self.children.setdefault(category.parent_id, []).append(category)
+        # same ordering as Category.Meta.ordering
+        for siblings in self.children.values():
+            siblings.sort(key=lambda c: (c.order, c.name))
+
+    @classmethod
+    def load(cls):
+        from .models import Category
+        return cls(Category.objects.all())
+
+    def get(self, category_id):
+        return self.by_id.get(category_id)
+
+    def get_by_slug(self, slug):
+        return self.by_slug.get(slug)
+
+    def active_children(self, category_id):
+        return [c for c in self.children.get(category_id, []) if c.is_active]
+
+    def descendants(self, category_id):
+        # same order as the old recursive property: direct children first,
+        # then the subtree of each child in turn
+        children = self.active_children(category_id)
+        result = list(children)
+        for child in children:
+            result.extend(self.descendants(child.id))
+        return result
+
+    def descendant_ids(self, category_id, include_self=True):
+        ids = [category_id] if include_self else []
+        ids.extend(c.id for c in self.descendants(category_id))
+        return ids
+
+    def ancestors(self, category_id):
+        # closest parent first, root last
+        result = []
+        seen = {category_id}
+        category = self.by_id.get(category_id)
+        while category is not None and category.parent_id and category.parent_id not in seen:
+            seen.add(category.parent_id)
+            category = self.by_id.get(category.parent_id)
+            if category is not None:
+                result.append(category)
+        return result
+
+    def counted_ancestor_ids(self, category_id):
+        # categories whose subtree count includes a listing from category_id:
+        # itself, then each parent reached through active categories only,
+        # matching how get_all_children skips inactive branches
+        ids = [category_id]
+        category = self.by_id.get(category_id)
+        while category is not None and category.is_active and category.parent_id and category.parent_id not in ids:
+            ids.append(category.parent_id)
+            category = self.by_id.get(category.parent_id)
+        return ids
+
+    def breadcrumbs(self, category_id):
+        # root first, the category itself last
+        category = self.by_id.get(category_id)
+        if category is None:
+            return []
+        return list(reversed(self.ancestors(category_id))) + [category]
+
+
+_lock = threading.Lock()
+_state = {'version': None, 'tree': None, 'checked_at': 0.0}
+
+
+def _current_version():
+    version = cache.get(TREE_VERSION_KEY)
+    if version is None:
+        cache.add(TREE_VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(TREE_VERSION_KEY)
+    return version
+
+
+def get_category_tree():
+    """Return the process-local tree, reloading it when another process invalidated it."""
+    recheck = getattr(settings, 'CATEGORY_TREE_RECHECK_SECONDS', 5)
+    now = time.monotonic()
+    tree = _state['tree']
+    if tree is not None and now - _state['checked_at'] < recheck:
+        return tree
+
+    version = _current_version()
+    if tree is not None and version == _state['version']:
+        _state['checked_at'] = now
+        return tree
+
+    with _lock:
+        if _state['tree'] is not None and _state['version'] == version:
+            return _state['tree']
+        # kept until the next version: not from a replica that may not have the change yet
+        with reading_from_primary():
+            tree = CategoryTree.load()
+        _state.update(version=version, tree=tree, checked_at=now)
+    return tree
+
+
+def tree_version():
+    """Token that changes whenever any category changes, e.g. for ETags."""
+    return _current_version()
+
+
+def invalidate_category_tree():
+    """Drop the local copy and tell the other processes to reload theirs."""
+    cache.set(TREE_VERSION_KEY, uuid.uuid4().hex, None)
+    with _lock:
+        _state.update(version=None, tree=None, checked_at=0.0)
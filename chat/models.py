@@ -24,7 +24,11 @@ class Conversation(models.Model):
         return reverse('chat:conversation', kwargs={'pk': self.pk})
     
     def get_other_participant(self, current_user):
-        return self.participants.exclude(id=current_user.id).first()
+        # iterates participants.all() so a prefetch is used
+        for participant in self.participants.all():
+            if participant.id != current_user.id:
+                return participant
+        return None
     
     def get_last_message(self):
         return self.messages.first()
@@ -1,3 +1,27 @@
+from django.contrib.auth import get_user_model
 from django.test import TestCase
+from django.urls import reverse
 
-# Create your tests here.
+from Micu_market.testing import MarketplaceRows, QueryCountTestMixin, query_budget_test_settings
+
+User = get_user_model()
+
+
+@query_budget_test_settings
+class ChatPageQueryTests(QueryCountTestMixin, TestCase):
+    """The inbox and a conversation run a fixed number of queries, however many messages there are."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create_user('viewer', 'viewer@example.com', 'parola-test-123')
+        cls.rows = MarketplaceRows(cls.viewer)
+        cls.rows.add()
+
+    def setUp(self):
+        self.client.force_login(self.viewer)
+
+    def test_inbox(self):
+        self.assertQueryCountStable(reverse('chat:inbox'), self.rows.add)
+
+    def test_conversation(self):
+        self.assertQueryCountStable(reverse('chat:conversation', args=[self.rows.conversation.pk]), self.rows.add)
@@ -2,7 +2,7 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import get_user_model
 from django.contrib import messages
-from django.db.models import Q, Count
+from django.db.models import Q, Count, OuterRef, Prefetch, Subquery
 from django.http import JsonResponse
 from django.core.paginator import Paginator
 from django.views.decorators.http import require_POST
@@ -11,43 +11,59 @@ import json
 
 from .models import Conversation, Message, MessageAttachment
 from listings.models import Listing
+from Micu_market.query_budget import query_budget
 
 User = get_user_model()
 
 @login_required
+@query_budget(10)
 def inbox_view(request):
+    last_message = Message.objects.filter(conversation=OuterRef('pk')).order_by('-created_at').values('pk')[:1]
     conversations = Conversation.objects.filter(
         participants=request.user,
         is_active=True
-    ).select_related('listing').prefetch_related('participants', 'messages').annotate(
-        unread_count=Count('messages', filter=Q(messages__receiver=request.user, messages__is_read=False))
+    ).select_related('listing').prefetch_related(
+        Prefetch('participants', queryset=User.objects.select_related('profile'))
+    ).annotate(
+        unread_count=Count('messages', filter=Q(messages__receiver=request.user, messages__is_read=False)),
+        last_message_id=Subquery(last_message),
     ).order_by('-updated_at')
     
-    # add other participant to conversation
-    for conversation in conversations:
-        conversation.other_participant = conversation.get_other_participant(request.user)
-    
     paginator = Paginator(conversations, 10)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
     
+    # other participant and last message for the conversations on this page only
+    last_messages = Message.objects.in_bulk([conv.last_message_id for conv in page_obj if conv.last_message_id])
+    for conversation in page_obj:
+        conversation.other_participant = conversation.get_other_participant(request.user)
+        conversation.last_message = last_messages.get(conversation.last_message_id)
+    
     context = {
         'page_obj': page_obj,
-        'total_unread': sum(conv.unread_count for conv in conversations)
+        'total_unread': Message.objects.filter(
+            conversation__participants=request.user,
+            conversation__is_active=True,
+            receiver=request.user,
+            is_read=False,
+        ).count()
     }
     return render(request, 'chat/inbox.html', context)
 
 @login_required
+@query_budget(11)
 def conversation_view(request, pk):
     conversation = get_object_or_404(
-        Conversation.objects.select_related('listing').prefetch_related('participants'),
+        Conversation.objects.select_related('listing').prefetch_related(
+            Prefetch('participants', queryset=User.objects.select_related('profile'))
+        ),
         pk=pk,
         participants=request.user
     )
     
     conversation.mark_as_read(request.user)
     
-    messages_list = conversation.messages.select_related('sender', 'receiver').prefetch_related('attachments').order_by('created_at')
+    messages_list = conversation.messages.select_related('sender__profile', 'receiver').prefetch_related('attachments').order_by('created_at')
     
     paginator = Paginator(messages_list, 50)
     page_number = request.GET.get('page')
@@ -1,3 +1,79 @@
-from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
 
-# Create your tests here.
+from Micu_market.slow_queries import fingerprint, get_slow_query_log, log_slow_queries, normalize_sql
+
+User = get_user_model()
+
+
+class FingerprintTests(SimpleTestCase):
+    def same(self, *queries):
+        return len({fingerprint(normalize_sql(sql)) for sql in queries}) == 1
+
+    def test_literals_do_not_matter(self):
+        self.assertTrue(self.same(
+            "SELECT * FROM listings_listing WHERE id = 5 AND price >= 10.50",
+            "SELECT * FROM listings_listing WHERE id = 17 AND price >= 3",
+        ))
+        self.assertTrue(self.same(
+            "SELECT * FROM auth_user WHERE username = 'ana'",
+            "SELECT * FROM auth_user WHERE username = 'it''s me'",
+        ))
+        self.assertTrue(self.same(
+            "SELECT *\n  FROM auth_user   WHERE id = 1",
+            "SELECT * FROM auth_user WHERE id = 2",
+        ))
+
+    def test_in_lists_of_any_length(self):
+        self.assertTrue(self.same(
+            'SELECT * FROM listings_listing WHERE id IN (%s)',
+            'SELECT * FROM listings_listing WHERE id IN (%s, %s, %s, %s)',
+            'SELECT * FROM listings_listing WHERE id IN (1, 2, 3)',
+            'SELECT * FROM listings_listing WHERE id IN (?,?)',
+        ))
+        self.assertEqual(normalize_sql('SELECT 1 FROM t WHERE id IN (%s, %s)'), 'SELECT ? FROM t WHERE id IN (...)')
+
+    def test_different_queries_differ(self):
+        self.assertFalse(self.same(
+            'SELECT * FROM listings_listing WHERE id = 1',
+            'SELECT * FROM listings_listing WHERE owner_id = 1',
+        ))
+        # digits inside names are not literals
+        self.assertFalse(self.same('SELECT * FROM t1', 'SELECT * FROM t2'))
+
+
+class SlowQueryLogTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        User.objects.create_user('ana', 'ana@example.com', 'parola-test-123')
+
+    def run_queries(self):
+        for ids in ([1], [1, 2, 3]):
+            list(User.objects.filter(pk__in=ids))
+
+    @override_settings(SLOW_QUERY_LOG={'THRESHOLD_MS': 60 * 1000, 'EXPLAIN': False})
+    def test_queries_under_the_threshold_are_not_logged(self):
+        with log_slow_queries():
+            self.run_queries()
+        self.assertEqual(get_slow_query_log().entries(), [])
+
+    @override_settings(SLOW_QUERY_LOG={'THRESHOLD_MS': 0.000001, 'EXPLAIN': False})
+    def test_queries_over_the_threshold_are_grouped(self):
+        with log_slow_queries():
+            self.run_queries()
+        entries = get_slow_query_log().entries()
+        self.assertEqual(len(entries), 1)
+        entry, = entries
+        self.assertEqual(entry['count'], 2)
+        self.assertIn('IN (...)', entry['sql'])
+        self.assertEqual(len(entry['durations']), 2)
+        call_site, = entry['call_sites']
+        self.assertTrue(call_site.startswith('dashboard/tests.py:'))
+        self.assertTrue(call_site.endswith(' in run_queries'))
+
+    @override_settings(SLOW_QUERY_LOG={'THRESHOLD_MS': 0, 'EXPLAIN': False})
+    def test_off_without_a_threshold(self):
+        with log_slow_queries():
+            self.run_queries()
+        self.assertEqual(get_slow_query_log().entries(), [])
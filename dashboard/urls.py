@@ -2,10 +2,17 @@ from django.urls import path
 from .views import verify_listings_view
 from .views import reports_list_view
 from .views import dashboard_home_view
+from .views import profile_download_view
+from .views import slow_queries_view, slow_queries_export_view, slow_queries_clear_view
 
 urlpatterns = [
 
+	path("", dashboard_home_view, name="home"),
 	path("dashboard_home", dashboard_home_view),
-	path("reports_list", reports_list_view),
+	path("reports_list", reports_list_view, name="reports"),
+	path("reports_list/<str:sample_id>.prof", profile_download_view, name="profile_download"),
+	path("slow_queries", slow_queries_view, name="slow_queries"),
+	path("slow_queries.json", slow_queries_export_view, name="slow_queries_export"),
+	path("slow_queries/clear", slow_queries_clear_view, name="slow_queries_clear"),
 	path("verify_listings", verify_listings_view),
 ]
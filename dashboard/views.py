@@ -1,15 +1,79 @@
-from django.shortcuts import render
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.paginator import Paginator
+from django.http import Http404, HttpResponse, JsonResponse
+from django.shortcuts import redirect, render
+from django.utils import timezone
+from django.utils.text import slugify
+from django.views.decorators.http import require_POST
+
+from Micu_market.profiling import endpoint_summary, get_sample_buffer, profiler_settings
+from Micu_market.slow_queries import get_slow_query_log, slow_query_settings, slow_query_summary
 
 # Create your views here.
 
+@staff_member_required
 def dashboard_home_view(request):
-	context = {}
+	# the slowest endpoints among the sampled requests (Micu_market/profiling.py)
+	samples = get_sample_buffer().samples()
+	context = {
+		'endpoints': endpoint_summary(samples),
+		'slowest': sorted(samples, key=lambda sample: sample.wall_ms, reverse=True)[:10],
+		'sample_count': len(samples),
+		'profiler': profiler_settings(),
+	}
 	return render(request, 'dashboard/home.html', context)
 
+@staff_member_required
 def reports_list_view(request):
-	context = {}
+	# every sampled request still in the buffer, slowest first, optionally for one view
+	all_samples = get_sample_buffer().samples()
+	view_name = request.GET.get('view')
+	samples = [sample for sample in all_samples if not view_name or sample.view_name == view_name]
+	samples.sort(key=lambda sample: sample.wall_ms, reverse=True)
+
+	paginator = Paginator(samples, 50)
+	context = {
+		'page_obj': paginator.get_page(request.GET.get('page')),
+		'view_name': view_name,
+		'view_names': sorted({sample.view_name for sample in all_samples}),
+	}
 	return render(request, 'dashboard/reports.html', context)
 
+@staff_member_required
+def profile_download_view(request, sample_id):
+	sample, data = get_sample_buffer().profile(sample_id)
+	if data is None:
+		raise Http404("Profilul nu mai este disponibil")
+	response = HttpResponse(data, content_type='application/octet-stream')
+	filename = f"{slugify(sample.view_name.replace(':', '-'))}-{sample.started_at:%Y%m%d-%H%M%S}.prof"
+	response['Content-Disposition'] = f'attachment; filename="{filename}"'
+	return response
+
+@staff_member_required
+def slow_queries_view(request):
+	# queries over the threshold grouped by fingerprint, the most total time first (Micu_market/slow_queries.py)
+	context = {
+		'queries': slow_query_summary(),
+		'slow_query_log': slow_query_settings(),
+	}
+	return render(request, 'dashboard/slow_queries.html', context)
+
+@staff_member_required
+def slow_queries_export_view(request):
+	response = JsonResponse({
+		'exported_at': timezone.now().isoformat(),
+		'threshold_ms': slow_query_settings()['THRESHOLD_MS'],
+		'queries': slow_query_summary(),
+	}, json_dumps_params={'indent': 2, 'ensure_ascii': False})
+	response['Content-Disposition'] = f'attachment; filename="slow-queries-{timezone.now():%Y%m%d-%H%M%S}.json"'
+	return response
+
+@staff_member_required
+@require_POST
+def slow_queries_clear_view(request):
+	get_slow_query_log().clear()
+	return redirect('dashboard:slow_queries')
+
 def verify_listings_view(request):
 	context = {}
 	return render(request, 'dashboard/verify_listings.html', context)
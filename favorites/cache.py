@@ -0,0 +1,40 @@
+from django.core.cache import cache
+from django.db import transaction
+
+from Micu_market.db_router import reading_from_primary
+
+# membership only changes through the favorites views, which drop the cached set;
+# the timeout just bounds how long a missed invalidation can live
+FAVORITES_TIMEOUT = 60 * 60 * 24
+
+
+def favorites_key(user_id):
+    return f'favorites:user:{user_id}'
+
+
+def get_favorite_ids(user):
+    """Ids of the listings `user` has favorited, from the cache or one query on a miss."""
+    from .models import Favorite
+
+    if not user.is_authenticated:
+        return frozenset()
+    key = favorites_key(user.pk)
+    ids = cache.get(key)
+    if ids is None:
+        # the set is shared by the user's later requests: a lagging replica must not fill it
+        with reading_from_primary():
+            ids = frozenset(Favorite.objects.filter(user_id=user.pk).values_list('listing_id', flat=True))
+        cache.set(key, ids, FAVORITES_TIMEOUT)
+    return ids
+
+
+def forget_favorite_ids(user):
+    """Drop the cached set after a change; the next read loads it from the database.
+
+    Not updated in place: two concurrent toggles would each write back their
+    own copy of the set and lose the other's change.
+    """
+    key = favorites_key(user.pk)
+    cache.delete(key)
+    # again once the change commits: a read that ran before may have cached the old set
+    transaction.on_commit(lambda: cache.delete(key))
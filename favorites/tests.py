@@ -1,3 +1,55 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.test import TestCase
+from django.urls import reverse
 
-# Create your tests here.
+from listings.models import Listing
+from Micu_market.testing import MarketplaceRows, QueryCountTestMixin, query_budget_test_settings
+from .cache import favorites_key, get_favorite_ids
+
+User = get_user_model()
+
+
+@query_budget_test_settings
+class FavoritesPageQueryTests(QueryCountTestMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create_user('viewer', 'viewer@example.com', 'parola-test-123')
+        cls.rows = MarketplaceRows(cls.viewer)
+        cls.rows.add()
+
+    def test_favorites_list(self):
+        self.client.force_login(self.viewer)
+        self.assertQueryCountStable(reverse('favorites:list'), self.rows.add)
+
+
+class FavoriteIdsCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'parola-test-123')
+        seller = User.objects.create_user('seller', 'seller@example.com', 'parola-test-123')
+        self.listings = [
+            Listing.objects.create(title=f'Bicicletă {n}', description='Puțin folosită.', price=100, city='Cluj-Napoca', owner=seller)
+            for n in range(2)
+        ]
+        self.client.force_login(self.user)
+
+    def toggle(self, listing):
+        return self.client.post(reverse('favorites:toggle'), {'listing_id': listing.id}).json()
+
+    def test_toggle_reloads_the_cached_set(self):
+        self.assertEqual(get_favorite_ids(self.user), frozenset())
+        self.assertEqual(self.toggle(self.listings[0])['favorites_count'], 1)
+        self.assertEqual(self.toggle(self.listings[1])['favorites_count'], 2)
+        self.assertEqual(get_favorite_ids(self.user), {listing.id for listing in self.listings})
+
+        response = self.toggle(self.listings[0])
+        self.assertFalse(response['is_favorited'])
+        self.assertEqual(get_favorite_ids(self.user), {self.listings[1].id})
+
+    def test_change_drops_a_stale_set(self):
+        # a set written back by a concurrent request that missed this change
+        cache.set(favorites_key(self.user.pk), frozenset({self.listings[1].id}))
+        self.toggle(self.listings[0])
+        self.assertEqual(get_favorite_ids(self.user), {self.listings[0].id})
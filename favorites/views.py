@@ -5,11 +5,14 @@ from django.views.decorators.http import require_POST
 from django.core.paginator import Paginator
 from django.contrib import messages
 from .models import Favorite
+from .cache import forget_favorite_ids, get_favorite_ids
 from listings.models import Listing
+from Micu_market.query_budget import query_budget
 
 @login_required
+@query_budget(8)
 def favorites_list_view(request):
-    favorites = Favorite.objects.filter(user=request.user).select_related('listing', 'listing__category', 'listing__owner').prefetch_related('listing__images')
+    favorites = Favorite.objects.filter(user=request.user).select_related('listing', 'listing__category', 'listing__owner')
     
     paginator = Paginator(favorites, 12)
     page_number = request.GET.get('page')
@@ -33,7 +36,7 @@ def toggle_favorite_view(request):
         listing = get_object_or_404(Listing, id=listing_id, status='active')
         
         # check if user wants to add to favorites his own listings
-        if listing.owner == request.user:
+        if listing.owner_id == request.user.id:
             return JsonResponse({'error': 'Nu poți adăuga propriile anunțuri la favorite'}, status=400)
         
         favorite, created = Favorite.objects.get_or_create(
@@ -50,11 +53,14 @@ def toggle_favorite_view(request):
             is_favorited = True
             message = 'Anunțul a fost adăugat la favorite'
         
+        forget_favorite_ids(request.user)
+        favorite_ids = get_favorite_ids(request.user)
+        
         response_data = {
             'success': True,
             'is_favorited': is_favorited,
             'message': message,
-            'favorites_count': Favorite.objects.filter(user=request.user).count()
+            'favorites_count': len(favorite_ids)
         }
         
         return JsonResponse(response_data)
@@ -69,6 +75,7 @@ def remove_favorite_view(request, favorite_id):
     favorite = get_object_or_404(Favorite, id=favorite_id, user=request.user)
     listing_title = favorite.listing.title
     favorite.delete()
+    forget_favorite_ids(request.user)
     
     messages.success(request, f'Anunțul "{listing_title}" a fost eliminat din favorite.')
     return redirect('favorites:list')
@@ -60,8 +60,8 @@ class ListingAdmin(admin.ModelAdmin):
 
 @admin.register(ListingImage)
 class ListingImageAdmin(admin.ModelAdmin):
-    list_display = ("anunt", "ordine", "data_creare")
-    list_filter = ("created_at",)
+    list_display = ("anunt", "ordine", "variants_status", "data_creare")
+    list_filter = ("variants_status", "created_at")
     search_fields = ("listing__title", "alt_text")
     
     def anunt(self, obj):
@@ -0,0 +1,295 @@
+import csv
+import io
+import json
+import os
+from collections import Counter
+from itertools import islice
+
+from django.core.files import File
+from django.core.files.images import get_image_dimensions
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch
+from django.utils.text import slugify
+
+from categories.counters import apply_listing_deltas
+from locations.gazetteer import apply_locality
+from .forms import ImportListingForm
+from .image_pipeline import SOURCE_EXTENSIONS, SOURCE_MAX_BYTES, schedule_variants
+from .page_cache import bump_generation
+from .slugs import allocate_values, random_value
+
+# columns of an import row; `images` holds URLs (or, for the command, local paths)
+IMPORT_FIELDS = ['title', 'description', 'category', 'price', 'city', 'county', 'location',
+                 'contact_phone', 'condition', 'negotiable', 'images']
+EXPORT_FIELDS = ['slug', 'status', 'created_at'] + IMPORT_FIELDS
+MAX_IMAGES = 10
+# rows read from an upload in one request; larger files go through the import_listings command
+UPLOAD_MAX_ROWS = 2000
+FALSE_VALUES = {'0', 'false', 'nu', 'no', 'off'}
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.images = 0
+        self.errors = []  # (line, message)
+
+    def add_error(self, line, message):
+        self.errors.append((line, message))
+
+
+# ======================
+# reading
+# ======================
+def read_rows(stream, fmt):
+    """Yield (line, row dict) from a text stream, one row at a time."""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == 'jsonl':
+        for line, text in enumerate(stream, start=1):
+            if not text.strip():
+                continue
+            try:
+                row = json.loads(text)
+            except ValueError as e:
+                yield line, ValueError(f'JSON invalid: {e}')
+                continue
+            yield line, row if isinstance(row, dict) else ValueError('Fiecare linie trebuie să fie un obiect JSON.')
+    else:
+        raise ValueError(f'Unknown import format: {fmt}')
+
+
+def detect_format(name):
+    return 'jsonl' if name.lower().endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+
+
+def text_stream(binary):
+    # uploads and files opened in binary mode; utf-8-sig drops the BOM Excel adds
+    return io.TextIOWrapper(binary, encoding='utf-8-sig', newline='')
+
+
+def form_data(row):
+    # empty cells are left out, so the model defaults apply (county, condition, negotiable)
+    data = {
+        field: row[field] for field in IMPORT_FIELDS
+        if field != 'images' and row.get(field) not in (None, '')
+    }
+    # a missing checkbox reads as unchecked and any non-empty string as checked
+    negotiable = data.get('negotiable', True)
+    data['negotiable'] = negotiable.strip().lower() not in FALSE_VALUES if isinstance(negotiable, str) else negotiable
+    return data
+
+
+def image_sources(row):
+    images = row.get('images') or []
+    if isinstance(images, str):
+        images = images.replace('|', ' ').split()
+    return [str(source).strip() for source in images if str(source).strip()]
+
+
+# ======================
+# images
+# ======================
+def image_for(listing, source, images_dir=None):
+    """Unsaved ListingImage for one source: a URL left for the pipeline, or a checked local file.
+
+    Local files are only copied to storage by store_image_files, once the whole row is valid.
+    """
+    from .models import ListingImage
+
+    image = ListingImage(listing=listing, alt_text=f"Imagine pentru {listing.title}")
+    image._import_path = None
+    ext = source.rsplit('.', 1)[-1].lower().split('?')[0]
+    if ext not in SOURCE_EXTENSIONS:
+        raise ValueError(f'{source}: doar fișierele JPG, PNG și WebP sunt acceptate.')
+    if source.startswith(('http://', 'https://')):
+        image.source_url = source
+        return image
+    if images_dir is None:
+        raise ValueError(f'{source}: imaginile trebuie date ca adrese http(s).')
+
+    path = os.path.realpath(os.path.join(images_dir, source))
+    if os.path.commonpath([path, os.path.realpath(images_dir)]) != os.path.realpath(images_dir):
+        raise ValueError(f'{source}: fișierul nu este în directorul de imagini.')
+    if os.path.getsize(path) > SOURCE_MAX_BYTES:
+        raise ValueError(f'{source}: imaginea nu poate fi mai mare de 5MB.')
+    # only the header is read; variants come from the pipeline
+    with open(path, 'rb') as f:
+        image.width, image.height = get_image_dimensions(f)
+    if image.width is None:
+        raise ValueError(f'{source}: fișierul nu este o imagine.')
+    image._import_path = path
+    return image
+
+
+def store_image_files(images):
+    """Copy the local files of a valid row's images to storage, as is; all or none of them."""
+    stored = []
+    try:
+        for image in images:
+            if image._import_path:
+                with open(image._import_path, 'rb') as f:
+                    image.image = default_storage.save(f"listings/{os.path.basename(image._import_path)}", File(f))
+                stored.append(image.image.name)
+    except OSError:
+        delete_image_files(stored)
+        raise
+    return stored
+
+
+def delete_image_files(names):
+    for name in names:
+        default_storage.delete(name)
+
+
+# ======================
+# writing
+# ======================
+def insert_batch(listings, images):
+    """bulk_create one batch of validated listings and their images.
+
+    bulk_create sends no signals, so the category counters and the page cache
+    are updated here; similar listings catch up with the next
+    rebuild_similar_listings run.
+    """
+    from .models import Listing, ListingImage
+
+    max_length = Listing._meta.get_field('slug').max_length
+    bases = [slugify(listing.title) or 'anunt' for listing in listings]
+    with transaction.atomic():
+        for attempt in range(1, 4):
+            # one aggregate query for the whole batch, rows sharing a title get successive suffixes
+            if attempt < 3:
+                slugs = allocate_values(Listing.objects.all(), 'slug', bases, max_length=max_length)
+            else:
+                slugs = [random_value(base, max_length=max_length) for base in bases]
+            for listing, slug in zip(listings, slugs):
+                listing.slug = slug
+            try:
+                with transaction.atomic():
+                    Listing.objects.bulk_create(listings)
+                break
+            except IntegrityError:
+                # a concurrent insert took one of the slugs
+                if attempt == 3:
+                    raise
+
+        ListingImage.objects.bulk_create(images)
+        apply_listing_deltas(Counter(listing.category_id for listing in listings if listing.status == 'active'))
+        bump_generation('listings')
+        for image in images:
+            schedule_variants(image.pk)
+
+
+def import_listings(stream, fmt, owner, images_dir=None, batch_size=200, max_rows=None):
+    """Validate and create listings from a CSV or JSONL text stream.
+
+    Rows are validated with the ListingForm rules and inserted in batches;
+    invalid rows are reported and skipped. Images are only recorded here and
+    rendered (downloaded first, for URLs) by the image pipeline.
+    """
+    result = ImportResult()
+    rows = read_rows(stream, fmt)
+    if max_rows is not None:
+        rows = islice(rows, max_rows)
+
+    listings, images, stored = [], [], []
+
+    def flush():
+        nonlocal listings, images, stored
+        try:
+            insert_batch(listings, images)
+        except Exception:
+            # the batch was rolled back, its files have no rows
+            delete_image_files(stored)
+            raise
+        result.created += len(listings)
+        result.images += len(images)
+        listings, images, stored = [], [], []
+
+    for line, row in rows:
+        if isinstance(row, Exception):
+            result.add_error(line, str(row))
+            continue
+        form = ImportListingForm(form_data(row))
+        if not form.is_valid():
+            result.add_error(line, '; '.join(
+                f"{field}: {' '.join(errors)}" if field != '__all__' else ' '.join(errors)
+                for field, errors in form.errors.items()
+            ))
+            continue
+        listing = form.save(commit=False)
+        listing.owner = owner
+        # what Listing.save does, bulk_create skips it
+        apply_locality(listing)
+        # every image is checked before any file is stored, so a rejected row leaves none behind
+        try:
+            sources = image_sources(row)[:MAX_IMAGES]
+            row_images = [image_for(listing, source, images_dir) for source in sources]
+            stored.extend(store_image_files(row_images))
+        except (OSError, ValueError) as e:
+            result.add_error(line, str(e))
+            continue
+        for order, image in enumerate(row_images):
+            image.order = order
+        listings.append(listing)
+        images.extend(row_images)
+
+        if len(listings) >= batch_size:
+            flush()
+
+    if listings:
+        flush()
+    return result
+
+
+# ======================
+# export
+# ======================
+class Echo:
+    """File-like object whose write() returns the line, for streaming csv.writer output."""
+    def write(self, value):
+        return value
+
+
+def export_rows(queryset, chunk_size=500):
+    """Listings as import rows, read in chunks (one query for the listings and one for the images per chunk)."""
+    from .models import ListingImage
+
+    images = Prefetch('images', queryset=ListingImage.objects.exclude(image='').only('listing_id', 'image', 'order'))
+    listings = queryset.select_related('category').prefetch_related(images).order_by('id')
+    for listing in listings.iterator(chunk_size=chunk_size):
+        yield {
+            'slug': listing.slug,
+            'status': listing.status,
+            'created_at': listing.created_at,
+            'title': listing.title,
+            'description': listing.description,
+            'category': listing.category.slug if listing.category else '',
+            'price': listing.price,
+            'city': listing.city,
+            'county': listing.county,
+            'location': listing.location or '',
+            'contact_phone': listing.contact_phone or '',
+            'condition': listing.condition,
+            'negotiable': listing.negotiable,
+            'images': [image.image.url for image in listing.images.all()],
+        }
+
+
+def export_lines(rows, fmt, absolute_url=lambda url: url):
+    """Encode export rows as CSV or JSONL lines, lazily."""
+    if fmt == 'csv':
+        writer = csv.DictWriter(Echo(), fieldnames=EXPORT_FIELDS)
+        yield writer.writeheader()
+        for row in rows:
+            row['images'] = ' '.join(absolute_url(url) for url in row['images'])
+            yield writer.writerow(row)
+    else:
+        for row in rows:
+            row['images'] = [absolute_url(url) for url in row['images']]
+            yield json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
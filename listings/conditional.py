@@ -0,0 +1,105 @@
+import hashlib
+from collections import namedtuple
+
+from django.contrib import messages
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control, quote_etag
+from django.utils.http import http_date
+
+ListingVersion = namedtuple('ListingVersion', ['id', 'category_id', 'token', 'last_modified'])
+
+
+def make_etag(*parts):
+    """Strong ETag from everything that decides the response body."""
+    return quote_etag(hashlib.md5('|'.join(str(part) for part in parts).encode()).hexdigest())
+
+
+def _timestamp(value):
+    return value.timestamp() if value is not None else ''
+
+
+def listing_version(queryset, with_owner=False):
+    """ListingVersion of the first listing in `queryset`, None if there is none.
+
+    The token covers the listing row (updated_at), its image set (count and
+    latest image change) and, with_owner, the owner's profile, from one
+    aggregate query; nothing else is loaded.
+    """
+    aggregates = {'image_count': Count('images'), 'images_updated_at': Max('images__updated_at')}
+    if with_owner:
+        # the profile is saved with the user (accounts.models.save_user_profile) and on new ratings
+        aggregates['owner_updated_at'] = Max('owner__profile__updated_at')
+    row = (
+        queryset.order_by()
+        .annotate(**aggregates)
+        .values('id', 'category_id', 'updated_at', *aggregates)
+        .first()
+    )
+    if row is None:
+        return None
+    changes = [row['updated_at'], row['images_updated_at'], row.get('owner_updated_at')]
+    token = '.'.join(str(part) for part in [
+        row['id'], _timestamp(row['updated_at']), row['image_count'],
+        _timestamp(row['images_updated_at']), _timestamp(row.get('owner_updated_at')),
+    ])
+    return ListingVersion(row['id'], row['category_id'], token, max(filter(None, changes)))
+
+
+def set_validators(response, etag, last_modified=None):
+    response.headers['ETag'] = etag
+    if last_modified is not None:
+        response.headers['Last-Modified'] = http_date(last_modified.timestamp())
+    # clients may keep the copy but have to revalidate it
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+def not_modified(request, etag, last_modified=None):
+    """304 (or 412 for a failed If-Match) when the client's copy is current, else None.
+
+    Call it before the expensive part of a view, with validators that are cheap to compute.
+    """
+    response = get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=int(last_modified.timestamp()) if last_modified is not None else None,
+    )
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
+
+
+def viewer_key(request):
+    # the header and the owner-only buttons depend on who is looking
+    user = request.user
+    if not user.is_authenticated:
+        return 'anonymous'
+    return f'{user.pk}.{user.username}.{user.get_full_name()}'
+
+
+def _page_last_modified(request, last_modified):
+    # a logged-in page also changes with things the dates do not cover (favorites,
+    # the header), so it is compared by ETag only
+    return None if request.user.is_authenticated else last_modified
+
+
+def _keep_private(request, response):
+    if request.user.is_authenticated:
+        patch_cache_control(response, private=True)
+    return response
+
+
+def page_not_modified(request, etag, last_modified=None):
+    """not_modified() for an HTML page; the ETag has to include viewer_key(request).
+
+    Pending messages are shown on the next rendered page, so they always get one.
+    """
+    if len(messages.get_messages(request)):
+        return None
+    response = not_modified(request, etag, _page_last_modified(request, last_modified))
+    return _keep_private(request, response) if response is not None else None
+
+
+def set_page_validators(request, response, etag, last_modified=None):
+    set_validators(response, etag, _page_last_modified(request, last_modified))
+    return _keep_private(request, response)
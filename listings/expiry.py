@@ -0,0 +1,94 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Q
+from django.urls import reverse
+from django.utils import timezone
+
+from categories.counters import apply_listing_deltas
+from .page_cache import bump_generation
+
+
+def _expiry_notifications(rows):
+    from notifications.models import Notification, NotificationPreference
+
+    owner_ids = {owner_id for _, _, owner_id, _, _, _ in rows if owner_id}
+    muted = set(
+        NotificationPreference.objects.filter(user_id__in=owner_ids, app_listing_updates=False)
+        .values_list('user_id', flat=True)
+    )
+    return [
+        Notification(
+            recipient_id=owner_id,
+            notification_type='listing_expired',
+            title='Anunțul tău a expirat',
+            message=f'Anunțul „{title}” a expirat și nu mai este afișat. Îl găsești în continuare în Anunțurile mele.',
+            related_object_type='listing',
+            related_object_id=listing_id,
+            # the owner cannot set the status back (not in ListingForm, read-only in the API)
+            action_url=reverse('listings:my_listings'),
+        )
+        for listing_id, _, owner_id, _, title, slug in rows
+        if owner_id and owner_id not in muted
+    ]
+
+
+def expire_batch(sweep, batch_size):
+    """Deactivate the next batch of expired listings after the sweep's cursor.
+
+    Returns the number of listings expired, 0 once the sweep is done.
+    """
+    from .models import Listing
+
+    with transaction.atomic():
+        batch = Listing.objects.filter(status='active', expires_at__lte=sweep.cutoff)
+        if sweep.last_id is not None:
+            batch = batch.filter(
+                Q(expires_at__gt=sweep.last_expires_at)
+                | Q(expires_at=sweep.last_expires_at, id__gt=sweep.last_id)
+            )
+        # rows being edited right now are skipped and picked up by the next run
+        rows = list(
+            batch.order_by('expires_at', 'id')
+            .select_for_update(skip_locked=True, of=('self',))
+            .values_list('id', 'expires_at', 'owner_id', 'category_id', 'title', 'slug')[:batch_size]
+        )
+        if not rows:
+            return 0
+
+        # QuerySet.update sends no signals and skips auto_now: set updated_at, so the
+        # API's ETag and Last-Modified change, and apply the counter deltas and notifications here
+        Listing.objects.filter(id__in=[row[0] for row in rows]).update(status='inactive', updated_at=timezone.now())
+        apply_listing_deltas({
+            category_id: -count
+            for category_id, count in Counter(row[3] for row in rows if row[3]).items()
+        })
+        from notifications.models import Notification
+        Notification.objects.bulk_create(_expiry_notifications(rows), batch_size=batch_size)
+
+        sweep.last_id, sweep.last_expires_at = rows[-1][0], rows[-1][1]
+        sweep.expired_count += len(rows)
+        sweep.save(update_fields=['last_id', 'last_expires_at', 'expired_count'])
+        bump_generation('listings')
+    return len(rows)
+
+
+def expire_listings(batch_size=500, max_batches=None, now=None):
+    """Move active listings past expires_at to inactive, resuming an interrupted sweep first.
+
+    Returns the sweep.
+    """
+    from .models import ExpirySweep
+
+    sweep = ExpirySweep.objects.filter(finished_at__isnull=True).order_by('started_at').first()
+    if sweep is None:
+        sweep = ExpirySweep.objects.create(cutoff=now or timezone.now())
+
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        if not expire_batch(sweep, batch_size):
+            sweep.finished_at = timezone.now()
+            sweep.save(update_fields=['finished_at'])
+            break
+        batches += 1
+    return sweep
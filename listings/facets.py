@@ -0,0 +1,217 @@
+import hashlib
+from collections import Counter
+from contextlib import nullcontext
+from decimal import Decimal, InvalidOperation
+
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.utils.http import urlencode
+
+from categories.tree import get_category_tree
+from locations.gazetteer import get_gazetteer
+from locations.geo import within_radius
+from search.engines import get_search_engine
+from Micu_market.db_router import reading_from_primary
+from .page_cache import get_generation, page_cache_timeout
+
+# query parameters that narrow the list page; sorting and paging do not change the counts
+FILTER_PARAMS = ('seller', 'category', 'min_price', 'max_price', 'city', 'radius', 'condition', 'search')
+# (key, label, lowest price, first price not included)
+PRICE_BUCKETS = [
+    ('0-100', 'Sub 100 RON', None, 100),
+    ('100-500', '100 - 500 RON', 100, 500),
+    ('500-1000', '500 - 1.000 RON', 500, 1000),
+    ('1000-5000', '1.000 - 5.000 RON', 1000, 5000),
+    ('5000-', 'Peste 5.000 RON', 5000, None),
+]
+TOP_CITIES = 10
+# km, offered in the sidebar; any value up to MAX_RADIUS is accepted
+RADIUS_CHOICES = [10, 25, 50, 100, 200]
+MAX_RADIUS = 500
+
+
+def resolve_category(value):
+    # from the cached category tree, by slug or by id
+    if not value:
+        return None
+    tree = get_category_tree()
+    category = tree.get_by_slug(value)
+    if category is None and value.isdigit():
+        category = tree.get(int(value))
+    if category is not None and not category.is_active:
+        return None
+    return category
+
+
+def parse_radius(value):
+    try:
+        radius = int(value)
+    except (TypeError, ValueError):
+        return None
+    return min(radius, MAX_RADIUS) if radius > 0 else None
+
+
+def parse_price(value):
+    # a price bound from the query string; anything that is not a number is ignored
+    try:
+        price = Decimal(value)
+    except (TypeError, ValueError, InvalidOperation):
+        return None
+    return price if price.is_finite() else None
+
+
+def filter_listings(params):
+    """Active listings matching the list page filters in `params`, ranked when searching.
+
+    Returns (queryset, selected category).
+    """
+    from .models import Listing
+
+    listings = Listing.objects.filter(status='active')
+
+    # sellers sorting
+    if params.get('seller'):
+        listings = listings.filter(owner__username=params['seller'])
+
+    # category sorting, the category and its subcategories
+    selected_category = resolve_category(params.get('category'))
+    if selected_category is not None:
+        listings = listings.filter(category_id__in=selected_category.get_descendant_ids())
+
+    # price sorting
+    min_price = parse_price(params.get('min_price'))
+    if min_price is not None:
+        listings = listings.filter(price__gte=min_price)
+    max_price = parse_price(params.get('max_price'))
+    if max_price is not None:
+        listings = listings.filter(price__lte=max_price)
+
+    # city sorting: listing cities are normalized to the gazetteer on save, so a known
+    # place is an exact (indexed) match, or a distance search around it with `radius`
+    city = params.get('city')
+    if city:
+        locality = get_gazetteer().find(city)
+        radius = parse_radius(params.get('radius'))
+        if locality is not None and radius:
+            listings = within_radius(listings, locality.latitude, locality.longitude, radius)
+        elif locality is not None:
+            listings = listings.filter(city=locality.name, county=locality.county.name)
+        else:
+            listings = listings.filter(city__icontains=city)
+
+    if params.get('condition') in dict(Listing.CONDITION_CHOICES):
+        listings = listings.filter(condition=params['condition'])
+
+    # search, full-text on PostgreSQL
+    if params.get('search'):
+        listings = get_search_engine().search(listings, params['search'])
+    return listings, selected_category
+
+
+def price_filter(low, high):
+    q = Q()
+    if low is not None:
+        q &= Q(price__gte=low)
+    if high is not None:
+        q &= Q(price__lt=high)
+    return q
+
+
+def count_facets(listings):
+    """Counts per category, city, condition and price bucket, from one grouped query.
+
+    Rows are grouped by (category, city); conditions and price buckets are
+    FILTER (WHERE ...) aggregates on the same rows. Category counts include
+    the subcategories, as on the category pages.
+    """
+    from .models import Listing
+
+    aggregates = {'total': Count('id')}
+    for value, _ in Listing.CONDITION_CHOICES:
+        aggregates[f'condition_{value}'] = Count('id', filter=Q(condition=value))
+    for index, (_, _, low, high) in enumerate(PRICE_BUCKETS):
+        aggregates[f'price_{index}'] = Count('id', filter=price_filter(low, high))
+    rows = listings.order_by().values('category_id', 'city').annotate(**aggregates)
+
+    total = 0
+    own = Counter()
+    cities = Counter()
+    conditions = Counter()
+    prices = Counter()
+    for row in rows:
+        total += row['total']
+        if row['category_id']:
+            own[row['category_id']] += row['total']
+        cities[row['city']] += row['total']
+        for value, _ in Listing.CONDITION_CHOICES:
+            conditions[value] += row[f'condition_{value}']
+        for index in range(len(PRICE_BUCKETS)):
+            prices[index] += row[f'price_{index}']
+
+    tree = get_category_tree()
+    categories = Counter()
+    for category_id, count in own.items():
+        for counted_id in tree.counted_ancestor_ids(category_id):
+            categories[counted_id] += count
+
+    return {
+        'total': total,
+        'categories': [
+            {'id': category.id, 'slug': category.slug, 'name': category.name, 'icon': category.icon, 'count': categories[category.id]}
+            for category in sorted(tree.by_id.values(), key=lambda c: c.name)
+            if category.is_active
+        ],
+        'cities': [{'value': city, 'count': count} for city, count in cities.most_common(TOP_CITIES)],
+        'conditions': [
+            {'value': value, 'label': label, 'count': conditions[value]}
+            for value, label in Listing.CONDITION_CHOICES
+        ],
+        'prices': [
+            {
+                'key': key,
+                'label': label,
+                'min_price': str(low) if low is not None else '',
+                # the filter's max_price is inclusive, prices have two decimals
+                'max_price': str(Decimal(high) - Decimal('0.01')) if high is not None else '',
+                'count': prices[index],
+            }
+            for index, (key, label, low, high) in enumerate(PRICE_BUCKETS)
+        ],
+    }
+
+
+def filter_key(params):
+    return urlencode(sorted((key, params[key]) for key in FILTER_PARAMS if params.get(key)))
+
+
+def get_facets(params):
+    """Facet counts for the filters in `params`, cached per normalized filter set.
+
+    The key includes the page cache generation, so any listing change starts fresh counts.
+    """
+    key = filter_key(params)
+    cache_key = f'facets:{get_generation()}:{hashlib.md5(key.encode()).hexdigest()}'
+    facets = cache.get(cache_key)
+    if facets is None:
+        timeout = page_cache_timeout()
+        # cached under the current generation: not from a replica that may lag behind it
+        with reading_from_primary() if timeout else nullcontext():
+            facets = count_facets(filter_listings(params)[0])
+        cache.set(cache_key, facets, timeout)
+    return {**facets, 'key': key}
+
+
+def facet_links(facets, params):
+    """Add to every city, condition and price value the query string that selects it."""
+    base = {key: value for key, value in params.items() if value and key not in ('page', 'cursor')}
+
+    def query(**changes):
+        return urlencode(sorted((key, value) for key, value in {**base, **changes}.items() if value))
+
+    for city in facets['cities']:
+        city['query'] = query(city=city['value'])
+    for condition in facets['conditions']:
+        condition['query'] = query(condition=condition['value'])
+    for price in facets['prices']:
+        price['query'] = query(min_price=price['min_price'], max_price=price['max_price'])
+    return facets
@@ -3,6 +3,15 @@ from django.core.exceptions import ValidationError
 from django.db import models
 from .models import Listing, ListingImage
 from categories.models import Category
+from categories.tree import get_category_tree
+
+
+def validate_listing_price(price):
+    # shared with the API serializer (api/serializers.py)
+    if price <= 0:
+        raise ValidationError('Prețul trebuie să fie mai mare decât 0.')
+    if price > 1000000:
+        raise ValidationError('Prețul nu poate fi mai mare de 1.000.000 RON.')
 
 
 class ListingForm(forms.ModelForm):
@@ -79,10 +88,7 @@ class ListingForm(forms.ModelForm):
 
     def clean_price(self):
         price = self.cleaned_data.get('price')
-        if price <= 0:
-            raise ValidationError('Prețul trebuie să fie mai mare decât 0.')
-        if price > 1000000:
-            raise ValidationError('Prețul nu poate fi mai mare de 1.000.000 RON.')
+        validate_listing_price(price)
         return price
 
     def clean_contact_phone(self):
@@ -91,6 +97,30 @@ class ListingForm(forms.ModelForm):
         return phone
 
 
+class CategoryTreeField(forms.Field):
+    """Active category by slug or id, resolved from the cached category tree (no query per value)."""
+    default_error_messages = {
+        'invalid_choice': 'Selectează o categorie validă.',
+    }
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        value = str(value).strip()
+        tree = get_category_tree()
+        category = tree.get_by_slug(value)
+        if category is None and value.isdigit():
+            category = tree.get(int(value))
+        if category is None or not category.is_active:
+            raise ValidationError(self.error_messages['invalid_choice'], code='invalid_choice')
+        return category
+
+
+class ImportListingForm(ListingForm):
+    """ListingForm rules for one row of a bulk import, see listings/bulk.py."""
+    category = CategoryTreeField(label='Categorie')
+
+
 class ListingImageForm(forms.ModelForm):
     class Meta:
         model = ListingImage
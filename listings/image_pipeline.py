@@ -0,0 +1,267 @@
+import hashlib
+import http.client
+import ipaddress
+import logging
+import os
+import socket
+import ssl
+import threading
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.images import get_image_dimensions
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# longest side in pixels for each derivative
+VARIANT_SIZES = {
+    'detail': 1200,
+    'card': 400,
+    'thumb': 200,
+}
+VARIANT_FORMATS = {
+    'jpeg': {'format': 'JPEG', 'ext': 'jpg', 'options': {'quality': 82, 'optimize': True, 'progressive': True}},
+    'webp': {'format': 'WEBP', 'ext': 'webp', 'options': {'quality': 80, 'method': 4}},
+}
+VARIANTS_DIR = 'listings/variants'
+# same limits as ListingImageForm, for originals downloaded from ListingImage.source_url
+SOURCE_MAX_BYTES = 5 * 1024 * 1024
+SOURCE_EXTENSIONS = {'jpg', 'jpeg', 'png', 'webp'}
+SOURCE_TIMEOUT = 10
+SOURCE_MAX_REDIRECTS = 3
+REDIRECT_STATUSES = {301, 302, 303, 307, 308}
+
+
+def _decode(img, largest):
+    # let the JPEG decoder downscale by 1/2, 1/4 or 1/8 while decoding
+    img.draft('RGB', (largest, largest))
+    img = ImageOps.exif_transpose(img)
+    if img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+    return img
+
+
+def encode(img, fmt):
+    spec = VARIANT_FORMATS[fmt]
+    buffer = BytesIO()
+    img.save(buffer, spec['format'], **spec['options'])
+    return buffer.getvalue()
+
+
+def render_variants(source):
+    """Decode the original once and encode every size/format.
+
+    Pure function (no Django models), so it can run in a process pool.
+    Returns {size: {fmt: (bytes, width, height)}}.
+    """
+    largest = max(VARIANT_SIZES.values())
+    with Image.open(source) as img:
+        current = _decode(img, largest)
+        rendered = {}
+        # each size is resized from the previous, larger one
+        for size, side in sorted(VARIANT_SIZES.items(), key=lambda item: -item[1]):
+            current = current.copy()
+            current.thumbnail((side, side), Image.Resampling.LANCZOS)
+            rendered[size] = {
+                fmt: (encode(current, fmt), current.width, current.height)
+                for fmt in VARIANT_FORMATS
+            }
+    return rendered
+
+
+def render_variant(source, side, fmt='jpeg'):
+    """Encode a single size of the original, longest side at most `side` pixels."""
+    with Image.open(source) as img:
+        img = _decode(img, side)
+        img.thumbnail((side, side), Image.Resampling.LANCZOS)
+        return encode(img, fmt)
+
+
+def store_variants(rendered):
+    """Save rendered variants under content-hashed names and describe them for ListingImage.variants."""
+    variants = {}
+    for size, formats in rendered.items():
+        variants[size] = {}
+        for fmt, (data, width, height) in formats.items():
+            digest = hashlib.sha256(data).hexdigest()[:20]
+            name = f"{VARIANTS_DIR}/{digest[:2]}/{digest}-{size}.{VARIANT_FORMATS[fmt]['ext']}"
+            # same content, same name: nothing to write twice
+            if not default_storage.exists(name):
+                name = default_storage.save(name, ContentFile(data))
+            variants[size][fmt] = {'name': name, 'width': width, 'height': height}
+    return variants
+
+
+def save_variants(image, rendered):
+    """Store rendered variants for a ListingImage and copy them to the listing cover if needed."""
+    from .models import ListingImage
+
+    variants = store_variants(rendered)
+    ListingImage.objects.filter(pk=image.pk).update(
+        variants=variants, variants_status='ready', variants_error='', updated_at=timezone.now(),
+    )
+    image.variants = variants
+    image.listing.refresh_cover_image()
+    return variants
+
+
+def mark_failed(image_id, error):
+    from .models import ListingImage
+
+    logger.error("Could not render variants for listing image %s: %s", image_id, error)
+    ListingImage.objects.filter(pk=image_id).update(
+        variants_status='failed', variants_error=str(error)[:255], updated_at=timezone.now(),
+    )
+
+
+def public_address(host, port):
+    """The address to connect to for `host`, if every address it resolves to is public, else ValueError.
+
+    Keeps imports away from localhost, the private network and the cloud metadata address.
+    """
+    try:
+        infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except (socket.gaierror, UnicodeError):
+        raise ValueError('Adresa imaginii nu a putut fi găsită.')
+    # all of them: a name can resolve to a public and a private address
+    addresses = [ipaddress.ip_address(info[4][0].split('%')[0]) for info in infos]
+    if not addresses or any(not address.is_global or address.is_multicast for address in addresses):
+        raise ValueError('Imaginile pot fi importate doar de pe adrese publice.')
+    return str(addresses[0])
+
+
+class PinnedHTTPConnection(http.client.HTTPConnection):
+    """Connects to the address that was checked, not to what the name resolves to a moment later."""
+
+    def __init__(self, host, address, **kwargs):
+        super().__init__(host, **kwargs)
+        self.address = address
+
+    def connect(self):
+        self.sock = socket.create_connection((self.address, self.port), self.timeout)
+
+
+class PinnedHTTPSConnection(http.client.HTTPSConnection):
+    def __init__(self, host, address, **kwargs):
+        self.tls_context = ssl.create_default_context()
+        super().__init__(host, context=self.tls_context, **kwargs)
+        self.address = address
+
+    def connect(self):
+        sock = socket.create_connection((self.address, self.port), self.timeout)
+        # the certificate is still checked against the host name
+        self.sock = self.tls_context.wrap_socket(sock, server_hostname=self.host)
+
+
+def download_source(source_url):
+    """The body of source_url, at most SOURCE_MAX_BYTES + 1 bytes; every redirect is checked like the URL itself."""
+    url = source_url
+    for _ in range(SOURCE_MAX_REDIRECTS + 1):
+        parts = urllib.parse.urlsplit(url)
+        # never file:// or other local schemes
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            raise ValueError('Doar adresele http și https sunt acceptate.')
+        port = parts.port or (443 if parts.scheme == 'https' else 80)
+        connection_class = PinnedHTTPSConnection if parts.scheme == 'https' else PinnedHTTPConnection
+        connection = connection_class(parts.hostname, public_address(parts.hostname, port), port=port, timeout=SOURCE_TIMEOUT)
+        try:
+            connection.request('GET', urllib.parse.urlunsplit(('', '', parts.path or '/', parts.query, '')))
+            response = connection.getresponse()
+            location = response.getheader('Location')
+            if response.status in REDIRECT_STATUSES and location:
+                url = urllib.parse.urljoin(url, location)
+                continue
+            if response.status != 200:
+                raise ValueError(f'Imaginea nu a putut fi descărcată (HTTP {response.status}).')
+            return response.read(SOURCE_MAX_BYTES + 1)
+        finally:
+            connection.close()
+    raise ValueError('Prea multe redirecționări la descărcarea imaginii.')
+
+
+def fetch_source(image):
+    """Download an imported image's source_url and store it as the original."""
+    from .models import ListingImage
+
+    url = urllib.parse.urlsplit(image.source_url)
+    if url.scheme not in ('http', 'https'):
+        raise ValueError('Doar adresele http și https sunt acceptate.')
+    name = os.path.basename(url.path)
+    if name.rsplit('.', 1)[-1].lower() not in SOURCE_EXTENSIONS:
+        raise ValueError('Doar fișierele JPG, PNG și WebP sunt acceptate.')
+    data = download_source(image.source_url)
+    if len(data) > SOURCE_MAX_BYTES:
+        raise ValueError('Imaginea nu poate fi mai mare de 5MB.')
+
+    content = ContentFile(data, name=name)
+    width, height = get_image_dimensions(content)
+    if width is None:
+        raise ValueError('Fișierul descărcat nu este o imagine.')
+    stored = default_storage.save(f"listings/{name}", content)
+    ListingImage.objects.filter(pk=image.pk).update(image=stored, width=width, height=height, updated_at=timezone.now())
+    image.image, image.width, image.height = stored, width, height
+    return image
+
+
+def process_listing_image(image_id):
+    """Render, store and record the derivatives of one ListingImage."""
+    from .models import ListingImage
+
+    image = ListingImage.objects.select_related('listing').filter(pk=image_id).first()
+    if image is None or not (image.image or image.source_url):
+        return None
+    try:
+        if not image.image:
+            fetch_source(image)
+        with image.image.open('rb') as source:
+            rendered = render_variants(source)
+    except Exception as e:
+        mark_failed(image_id, e)
+        return None
+    return save_variants(image, rendered)
+
+
+# ======================
+# dispatching
+# ======================
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                workers = getattr(settings, 'IMAGE_PIPELINE', {}).get('WORKERS', 2)
+                _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='image-pipeline')
+    return _executor
+
+
+def _run_in_background(image_id):
+    try:
+        process_listing_image(image_id)
+    finally:
+        # the worker thread has its own DB connection
+        close_old_connections()
+
+
+def schedule_variants(image_id):
+    """Queue the derivatives of a saved ListingImage according to IMAGE_PIPELINE['MODE'].
+
+    thread: background thread pool in this process, after the transaction commits
+    queue:  left as pending for the process_listing_images command
+    sync:   rendered inline (tests, shell)
+    """
+    mode = getattr(settings, 'IMAGE_PIPELINE', {}).get('MODE', 'thread')
+    if mode == 'sync':
+        transaction.on_commit(lambda: process_listing_image(image_id))
+    elif mode == 'thread':
+        transaction.on_commit(lambda: _get_executor().submit(_run_in_background, image_id))
@@ -0,0 +1,37 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from Micu_market.benchmark import run_connection_benchmark, write_results
+
+
+class Command(BaseCommand):
+    help = "Time the database side of a request with a new connection per request, persistent connections and the pool"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help="Measured request cycles per mode")
+        parser.add_argument('--warmup', type=int, default=5, help="Unmeasured request cycles per thread first")
+        parser.add_argument('--queries', type=int, default=1, help="Queries per request")
+        parser.add_argument('--threads', type=int, default=1, help="Concurrent threads, each with its own connection")
+        parser.add_argument('--mode', action='append', dest='modes', choices=['new', 'persistent', 'pool'], help="Only this mode (repeatable)")
+        parser.add_argument('--output', help="Results file (default: benchmarks/connections-<date>-<commit>.json)")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("The connection benchmark needs the PostgreSQL database.")
+        for name in ('requests', 'queries', 'threads'):
+            if options[name] < 1:
+                raise CommandError(f"--{name} must be at least 1.")
+
+        run = run_connection_benchmark(
+            requests=options['requests'], warmup=options['warmup'], queries=options['queries'],
+            threads=options['threads'], only=options['modes'], log=self.stdout.write,
+        )
+        output = Path(options['output']) if options['output'] else (
+            Path(settings.BASE_DIR) / 'benchmarks' / f"connections-{timezone.now():%Y%m%d-%H%M%S}-{run['commit'] or 'nogit'}.json"
+        )
+        write_results(run, output)
+        self.stdout.write(self.style.SUCCESS(f"Results written to {output}"))
@@ -0,0 +1,42 @@
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from Micu_market.benchmark import compare_runs, run_benchmarks, write_results
+from Micu_market.benchmark_data import benchmark_data_exists
+
+
+class Command(BaseCommand):
+    help = "Time the hot views on the generate_benchmark_data rows: p50/p95 latency and query counts, saved as JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20, help="Measured requests per case")
+        parser.add_argument('--warmup', type=int, default=3, help="Unmeasured requests per case first")
+        parser.add_argument('--case', action='append', dest='cases', help="Only this case (repeatable)")
+        parser.add_argument('--page-cache', action='store_true', help="Keep the anonymous page cache on")
+        parser.add_argument('--output', help="Results file (default: benchmarks/<date>-<commit>.json)")
+        parser.add_argument('--compare', help="Earlier results file to compare with")
+
+    def handle(self, *args, **options):
+        if not benchmark_data_exists():
+            raise CommandError("No benchmark data; run generate_benchmark_data first.")
+        if options['repeat'] < 1:
+            raise CommandError("--repeat must be at least 1.")
+
+        run = run_benchmarks(
+            repeat=options['repeat'], warmup=options['warmup'], page_cache=options['page_cache'],
+            only=options['cases'], log=self.stdout.write,
+        )
+        output = Path(options['output']) if options['output'] else (
+            Path(settings.BASE_DIR) / 'benchmarks' / f"{timezone.now():%Y%m%d-%H%M%S}-{run['commit'] or 'nogit'}.json"
+        )
+        write_results(run, output)
+        self.stdout.write(self.style.SUCCESS(f"Results written to {output}"))
+
+        if options['compare']:
+            previous = json.loads(Path(options['compare']).read_text(encoding='utf-8'))
+            for line in compare_runs(previous, run):
+                self.stdout.write(line)
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from listings.expiry import expire_listings
+
+
+class Command(BaseCommand):
+    help = "Set active listings past their expires_at to inactive and notify the owners"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--max-batches', type=int, default=None, help="Stop after N batches; the next run resumes")
+        parser.add_argument('--interval', type=int, default=0, help="Keep running and sweep every N seconds")
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        while True:
+            sweep = expire_listings(batch_size=options['batch_size'], max_batches=options['max_batches'])
+            state = "done" if sweep.finished_at else "paused, will resume"
+            self.stdout.write(f"Expired {sweep.expired_count} listings up to {sweep.cutoff:%Y-%m-%d %H:%M} ({state}).")
+            if not interval:
+                break
+            time.sleep(interval)
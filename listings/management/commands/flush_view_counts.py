@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from listings.view_counter import get_view_counter
+
+
+class Command(BaseCommand):
+    help = "Write the buffered listing views to Listing.views_count"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=int, default=0, help="Keep running and flush every N seconds")
+
+    def handle(self, *args, **options):
+        counter = get_view_counter()
+        interval = options['interval']
+        while True:
+            deltas = counter.flush()
+            self.stdout.write(f"Flushed {sum(deltas.values())} views for {len(deltas)} listings.")
+            if not interval:
+                break
+            time.sleep(interval)
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Micu_market.benchmark_data import BenchmarkData, benchmark_data_exists, delete_benchmark_data, scaled_counts
+
+
+class Command(BaseCommand):
+    help = "Insert deterministic synthetic users, listings, messages, favorites and reviews for benchmark_views"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--scale', type=float, default=1.0, help="Multiply the default counts (200k listings, 50k users, 2M messages, ...)")
+        for name in ('users', 'listings', 'messages', 'favorites', 'reviews'):
+            parser.add_argument(f'--{name}', type=int, default=None, help=f"Number of {name}, overrides --scale")
+        parser.add_argument('--replace', action='store_true', help="Delete the benchmark rows of an earlier run first")
+
+    def handle(self, *args, **options):
+        if benchmark_data_exists():
+            if not options['replace']:
+                raise CommandError("Benchmark data already exists; use --replace to regenerate it (or a fresh database).")
+            delete_benchmark_data()
+
+        counts = scaled_counts(options['scale'], **{name: options[name] for name in ('users', 'listings', 'messages', 'favorites', 'reviews')})
+        started = time.monotonic()
+        BenchmarkData(counts, seed=options['seed'], log=self.stdout.write).generate()
+        self.stdout.write(self.style.SUCCESS(f"Benchmark data generated in {time.monotonic() - started:.0f}s."))
+        self.stdout.write("Run rebuild_similar_listings to fill the similar listings on the detail pages.")
@@ -0,0 +1,38 @@
+import os
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from listings.bulk import detect_format, import_listings, text_stream
+
+
+class Command(BaseCommand):
+    help = "Create listings for a user from a CSV or JSONL file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--owner', required=True, help="Username of the seller")
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help="Default: from the file extension")
+        parser.add_argument('--images-dir', help="Directory for image paths in the `images` column (default: next to the file)")
+        parser.add_argument('--batch-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        try:
+            owner = get_user_model().objects.get(username=options['owner'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"No user named {options['owner']}")
+
+        path = options['path']
+        fmt = options['format'] or detect_format(path)
+        images_dir = options['images_dir'] or os.path.dirname(os.path.abspath(path))
+        with open(path, 'rb') as f:
+            result = import_listings(
+                text_stream(f), fmt, owner, images_dir=images_dir, batch_size=options['batch_size'],
+            )
+
+        for line, message in result.errors:
+            self.stderr.write(f"line {line}: {message}")
+        self.stdout.write(
+            f"Created {result.created} listings with {result.images} images "
+            f"({len(result.errors)} rows skipped). Run rebuild_similar_listings to include them in similar listings."
+        )
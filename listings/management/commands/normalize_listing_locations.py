@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from listings.models import Listing
+from listings.page_cache import bump_generation
+from locations.gazetteer import apply_locality
+
+FIELDS = ['city', 'county', 'latitude', 'longitude']
+
+
+class Command(BaseCommand):
+    help = "Normalize the city/county of every listing to the gazetteer and set its coordinates"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        changed = []
+        matched = total = 0
+        for listing in Listing.objects.only('id', *FIELDS).iterator(chunk_size=batch_size):
+            total += 1
+            before = [getattr(listing, field) for field in FIELDS]
+            if apply_locality(listing) is not None:
+                matched += 1
+            if [getattr(listing, field) for field in FIELDS] != before:
+                changed.append(listing)
+            if len(changed) >= batch_size:
+                self.save(changed)
+                changed = []
+        self.save(changed)
+        self.stdout.write(f"{matched} of {total} listings matched a locality.")
+
+    def save(self, listings):
+        if not listings:
+            return
+        # bulk_update: no listing signals, nothing else derives from the location
+        with transaction.atomic():
+            Listing.objects.bulk_update(listings, FIELDS)
+            bump_generation('listings')
@@ -0,0 +1,71 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from listings.image_pipeline import fetch_source, mark_failed, render_variants, save_variants
+from listings.models import ListingImage
+
+
+def render_from_bytes(data):
+    # runs in a worker process, without touching the database
+    return render_variants(BytesIO(data))
+
+
+class Command(BaseCommand):
+    help = "Render the resized variants of pending listing images"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retry-failed', action='store_true', help="Also retry images that failed before")
+        parser.add_argument('--all', action='store_true', help="Re-render every image (e.g. after changing the sizes)")
+        parser.add_argument('--workers', type=int, default=getattr(settings, 'IMAGE_PIPELINE', {}).get('WORKERS', 2))
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--interval', type=int, default=0, help="Keep running and poll every N seconds")
+
+    def get_queryset(self, options):
+        # imported images without a file yet are downloaded first
+        images = ListingImage.objects.exclude(image='', source_url='').select_related('listing')
+        if options['all']:
+            return images
+        statuses = ['pending', 'failed'] if options['retry_failed'] else ['pending']
+        return images.filter(variants_status__in=statuses)
+
+    def handle(self, *args, **options):
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            while True:
+                done, failed = self.process(pool, options)
+                self.stdout.write(f"Processed {done} images ({failed} failed).")
+                if not options['interval']:
+                    break
+                time.sleep(options['interval'])
+
+    def process(self, pool, options):
+        done = failed = 0
+        last_id = 0
+        queryset = self.get_queryset(options)
+        while True:
+            # walk by id so that re-rendered or failed rows are not picked up again in this run
+            batch = list(queryset.filter(pk__gt=last_id).order_by('pk')[:options['batch_size']])
+            if not batch:
+                return done, failed
+            last_id = batch[-1].pk
+
+            futures = {}
+            for image in batch:
+                try:
+                    if not image.image:
+                        fetch_source(image)
+                    with image.image.open('rb') as source:
+                        futures[image] = pool.submit(render_from_bytes, source.read())
+                except (OSError, ValueError) as e:
+                    mark_failed(image.pk, e)
+                    failed += 1
+            for image, future in futures.items():
+                try:
+                    save_variants(image, future.result())
+                    done += 1
+                except Exception as e:
+                    mark_failed(image.pk, e)
+                    failed += 1
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from listings.similarity import rebuild_similar_listings
+
+
+class Command(BaseCommand):
+    help = "Recompute the term vectors and similar listings of every active listing"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        count = rebuild_similar_listings(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Similar listings rebuilt for {count} active listings."))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from PIL import Image
+
+from listings.models import Listing, ListingImage
+
+
+class Command(BaseCommand):
+    help = "Fill the denormalized Listing.cover_* fields (and missing image dimensions) for existing listings"
+
+    def handle(self, *args, **options):
+        measured = 0
+        for image in ListingImage.objects.filter(width__isnull=True).exclude(image='').iterator(chunk_size=500):
+            try:
+                with Image.open(image.image.path) as img:
+                    width, height = img.size
+            except (OSError, ValueError) as e:
+                self.stderr.write(f"Skipping image {image.pk}: {e}")
+                continue
+            ListingImage.objects.filter(pk=image.pk).update(width=width, height=height, updated_at=timezone.now())
+            measured += 1
+
+        listings = Listing.objects.only('id', 'cover_image', 'cover_width', 'cover_height')
+        for listing in listings.iterator(chunk_size=500):
+            listing.refresh_cover_image()
+
+        self.stdout.write(self.style.SUCCESS(f"Cover images synced ({measured} images measured)."))
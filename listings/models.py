@@ -1,10 +1,22 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.text import slugify
-from PIL import Image
+from django.core.files.images import get_image_dimensions
 import os
 
+from categories.counters import listing_counter_state, listing_counter_deltas, apply_listing_deltas
+from locations.gazetteer import apply_locality
+from .image_pipeline import schedule_variants
+from .page_cache import bump_generation
+from .similarity import schedule_similarity_update
+from .slugs import next_free_value, random_value, save_unique
+from .thumbnails import get_thumbnail_cache
+
 User = get_user_model()
 
 class Listing(models.Model):
@@ -38,6 +50,9 @@ class Listing(models.Model):
     city = models.CharField(max_length=100, default="București", verbose_name="Oraș")
     county = models.CharField(max_length=100, default="București", verbose_name="Județ")
     location = models.CharField(max_length=200, blank=True, null=True, verbose_name="Adresă completă")
+    # coordinates of the city, from the localities gazetteer (see locations/gazetteer.py)
+    latitude = models.FloatField(null=True, blank=True, editable=False)
+    longitude = models.FloatField(null=True, blank=True, editable=False)
     
     # contact
     contact_phone = models.CharField(max_length=20, blank=True, null=True, verbose_name="Telefon contact")
@@ -49,9 +64,30 @@ class Listing(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Creat la")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Actualizat la")
     expires_at = models.DateTimeField(null=True, blank=True, verbose_name="Expiră la")
+    
+    # first image, denormalized so that listing cards need no query per listing
+    cover_image = models.ImageField(upload_to='listings/', blank=True, editable=False, verbose_name="Imagine principală")
+    cover_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    cover_height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    cover_variants = models.JSONField(default=dict, blank=True, editable=False)
+    
+    # full-text search, maintained by a PostgreSQL trigger (see search/engines.py)
+    search_vector = SearchVectorField(null=True, blank=True, editable=False)
 
     class Meta:
         ordering = ["-created_at"]
+        # match the public query shapes: active listings by date/price, per category, per owner
+        # (trigram indexes for city/title substring search are PostgreSQL-only, see search/engines.py)
+        indexes = [
+            models.Index(fields=['status', '-created_at', '-id'], name='listing_status_created_idx'),
+            models.Index(fields=['status', 'category', '-created_at'], name='listing_status_cat_idx'),
+            models.Index(fields=['status', 'price', 'id'], name='listing_status_price_idx'),
+            models.Index(fields=['owner', 'status', '-created_at'], name='listing_owner_status_idx'),
+            models.Index(fields=['status', 'expires_at', 'id'], name='listing_status_expires_idx'),
+            # city filter (exact, on the normalized name) and the radius search bounding box
+            models.Index(fields=['status', 'city'], name='listing_status_city_idx'),
+            models.Index(fields=['status', 'latitude', 'longitude'], name='listing_status_geo_idx'),
+        ]
         verbose_name = "Anunț"
         verbose_name_plural = "Anunțuri"
 
@@ -59,15 +95,33 @@ class Listing(models.Model):
         return self.title
     
     def save(self, *args, **kwargs):
-        if not self.slug:
-            self.slug = slugify(self.title)
-            # for unique slug
-            original_slug = self.slug
-            counter = 1
-            while Listing.objects.filter(slug=self.slug).exists():
-                self.slug = f"{original_slug}-{counter}"
-                counter += 1
-        super().save(*args, **kwargs)
+        # city and county are normalized to the gazetteer, which also gives the coordinates
+        location_fields = {'city', 'county', 'latitude', 'longitude'}
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            apply_locality(self)
+        elif location_fields & set(update_fields):
+            apply_locality(self)
+            kwargs['update_fields'] = set(update_fields) | location_fields
+        
+        # the category counters are updated from post_save, keep them in the same transaction
+        if self.slug:
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+            return
+        
+        # for unique slug: next free numeric suffix, a random one if inserts keep racing for it
+        base = slugify(self.title) or 'anunt'
+        max_length = self._meta.get_field('slug').max_length
+        self.slug = next_free_value(Listing.objects.all(), 'slug', base, max_length=max_length)
+        save_unique(
+            self, 'slug',
+            allocate=lambda attempt: (
+                next_free_value(Listing.objects.all(), 'slug', base, max_length=max_length)
+                if attempt == 1 else random_value(base, max_length=max_length)
+            ),
+            save=lambda: super(Listing, self).save(*args, **kwargs),
+        )
     
     def get_absolute_url(self):
         return reverse('listings:listing_detail', kwargs={'slug': self.slug})
@@ -78,19 +132,51 @@ class Listing(models.Model):
     
     @property
     def main_image(self):
-        first_image = self.images.first()
-        return first_image.image if first_image else None
+        return self.cover_image or None
+    
+    def refresh_cover_image(self):
+        # keep cover_* equal to the first image by (order, id)
+        # (imported images have no file until the pipeline has downloaded them)
+        first_image = self.images.exclude(image='').order_by('order', 'id').only('image', 'width', 'height', 'variants').first()
+        values = {
+            'cover_image': first_image.image.name if first_image else '',
+            'cover_width': first_image.width if first_image else None,
+            'cover_height': first_image.height if first_image else None,
+            'cover_variants': first_image.variants if first_image else {},
+        }
+        if any(getattr(self, field) != value for field, value in values.items()):
+            # QuerySet.update: no updated_at bump, no listing signals
+            Listing.objects.filter(pk=self.pk).update(**values)
+            for field, value in values.items():
+                setattr(self, field, value)
+            bump_generation('listings')
 
 
 class ListingImage(models.Model):
+    VARIANTS_STATUS_CHOICES = [
+        ('pending', 'În așteptare'),
+        ('ready', 'Gata'),
+        ('failed', 'Eșuat'),
+    ]
+
     listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='images', verbose_name="Anunț")
     image = models.ImageField(upload_to='listings/', verbose_name="Imagine")
+    # imported images are downloaded from here by the image pipeline, see listings/bulk.py
+    source_url = models.URLField(max_length=500, blank=True, editable=False, verbose_name="Sursă import")
     alt_text = models.CharField(max_length=200, blank=True, verbose_name="Text alternativ")
     order = models.IntegerField(default=0, verbose_name="Ordine")
+    width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    # resized copies, {size: {format: {name, width, height}}}, written by listings/image_pipeline.py
+    variants = models.JSONField(default=dict, blank=True, editable=False)
+    variants_status = models.CharField(max_length=10, choices=VARIANTS_STATUS_CHOICES, default='pending', db_index=True, editable=False)
+    variants_error = models.CharField(max_length=255, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    # also set by the pipeline's QuerySet.update calls, part of the listing's ETag (listings/conditional.py)
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
-        ordering = ['order']
+        ordering = ['order', 'id']
         verbose_name = "Imagine anunț"
         verbose_name_plural = "Imagini anunțuri"
     
@@ -98,13 +184,143 @@ class ListingImage(models.Model):
         return f"Imagine pentru {self.listing.title}"
     
     def save(self, *args, **kwargs):
+        source_changed = bool(self.image) and (self._state.adding or self.image.name != self._source_name)
+        if source_changed:
+            # only the header is read here, resizing happens in the image pipeline
+            self.width, self.height = get_image_dimensions(self.image)
+            self.variants = {}
+            self.variants_status = 'pending'
+            self.variants_error = ''
         super().save(*args, **kwargs)
+        self._source_name = self.image.name
         
-        # resize image for optimisation
-        if self.image:
-            img_path = self.image.path
-            with Image.open(img_path) as img:
-                # keep the aspect ratio, but not greater than 800x800
-                if img.height > 800 or img.width > 800:
-                    img.thumbnail((800, 800), Image.Resampling.LANCZOS)
-                    img.save(img_path, optimize=True, quality=85)
+        if source_changed:
+            schedule_variants(self.pk)
+        
+        # saving or reordering an image can change the listing cover
+        self.listing.refresh_cover_image()
+
+
+class ListingTerm(models.Model):
+    """Weighted terms of an active listing, the inverted index behind similar listings"""
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='terms')
+    term = models.IntegerField()
+    weight = models.FloatField()
+    
+    class Meta:
+        indexes = [
+            # covers the candidate lookup: WHERE term IN (...) GROUP BY listing, SUM(weight)
+            models.Index(fields=['term', 'listing', 'weight'], name='listing_term_lookup_idx'),
+        ]
+        verbose_name = "Termen anunț"
+        verbose_name_plural = "Termeni anunțuri"
+
+
+class SimilarListing(models.Model):
+    """Precomputed nearest neighbours of a listing, see listings/similarity.py"""
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='neighbours')
+    similar = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='similar_to')
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['listing', 'rank'], name='similar_listing_rank_idx'),
+        ]
+        verbose_name = "Anunț similar"
+        verbose_name_plural = "Anunțuri similare"
+
+
+class ExpirySweep(models.Model):
+    """One run of the expiry sweeper; an unfinished run is resumed from its cursor"""
+    cutoff = models.DateTimeField(verbose_name="Expirate până la")
+    last_expires_at = models.DateTimeField(null=True, blank=True)
+    last_id = models.IntegerField(null=True, blank=True)
+    expired_count = models.IntegerField(default=0, verbose_name="Anunțuri expirate")
+    started_at = models.DateTimeField(auto_now_add=True, verbose_name="Pornit la")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="Terminat la")
+    
+    class Meta:
+        ordering = ['-started_at']
+        verbose_name = "Rulare expirare anunțuri"
+        verbose_name_plural = "Rulări expirare anunțuri"
+    
+    def __str__(self):
+        return f"Expirare {self.cutoff:%d.%m.%Y %H:%M}: {self.expired_count} anunțuri"
+
+
+# signals to keep the per-category active listing counters in sync
+@receiver(post_init, sender=Listing)
+def remember_counter_state(sender, instance, **kwargs):
+    instance._counter_state = listing_counter_state(instance)
+
+@receiver(post_save, sender=Listing)
+def update_counters_on_save(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and not {'status', 'category', 'category_id'} & set(update_fields):
+        return
+    new_state = listing_counter_state(instance)
+    old_state = (None, False) if created else instance._counter_state
+    apply_listing_deltas(listing_counter_deltas(old_state, new_state))
+    instance._counter_state = new_state
+
+@receiver(post_delete, sender=Listing)
+def update_counters_on_delete(sender, instance, **kwargs):
+    apply_listing_deltas(listing_counter_deltas(instance._counter_state, (None, False)))
+    instance._counter_state = (None, False)
+
+
+@receiver(post_init, sender=ListingImage)
+def remember_image_source(sender, instance, **kwargs):
+    # a replaced file needs new variants
+    source = instance.__dict__.get('image')
+    instance._source_name = getattr(source, 'name', source)
+
+
+# keep the similar listings up to date when the text, category or status changes
+SIMILARITY_FIELDS = ('title', 'description', 'category_id', 'status')
+
+@receiver(post_init, sender=Listing)
+def remember_similarity_state(sender, instance, **kwargs):
+    instance._similarity_state = tuple(instance.__dict__.get(field) for field in SIMILARITY_FIELDS)
+
+@receiver(post_save, sender=Listing)
+def update_similarity_on_save(sender, instance, created, **kwargs):
+    state = tuple(instance.__dict__.get(field) for field in SIMILARITY_FIELDS)
+    if not created and state == instance._similarity_state:
+        return
+    instance._similarity_state = state
+    schedule_similarity_update(instance)
+
+
+@receiver(post_delete, sender=ListingImage)
+def refresh_cover_on_image_delete(sender, instance, origin=None, **kwargs):
+    # nothing to refresh when the whole listing is being deleted
+    if isinstance(origin, Listing):
+        return
+    # the image set changed: the deleted image's date may have been the newest one
+    # behind the listing's Last-Modified (listings/conditional.py), so move updated_at past it
+    Listing.objects.filter(pk=instance.listing_id).update(updated_at=timezone.now())
+    listing = Listing.objects.filter(pk=instance.listing_id).first()
+    if listing is not None:
+        listing.refresh_cover_image()
+
+@receiver(post_delete, sender=Listing)
+def touch_owner_profile_on_delete(sender, instance, **kwargs):
+    # a deleted listing leaves no date behind, and the public profile's Last-Modified must
+    # not go back to the previous listing's: the profile's updated_at records the change
+    from accounts.models import UserProfile
+
+    UserProfile.objects.filter(user_id=instance.owner_id).update(updated_at=timezone.now())
+
+@receiver(post_delete, sender=ListingImage)
+def purge_thumbnails_on_image_delete(sender, instance, **kwargs):
+    get_thumbnail_cache().purge(f"listing/{instance.pk}")
+
+
+# cached pages and fragments (listings/page_cache.py) show listings and their images
+@receiver(post_save, sender=Listing)
+@receiver(post_delete, sender=Listing)
+@receiver(post_save, sender=ListingImage)
+@receiver(post_delete, sender=ListingImage)
+def bump_page_cache_on_change(sender, **kwargs):
+    bump_generation('listings')
@@ -0,0 +1,118 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import InvalidCacheBackendError, cache, caches
+from django.db import transaction
+from django.http import HttpResponse
+from django.core.cache.utils import make_template_fragment_key
+from django.utils.http import urlencode
+
+from favorites.cache import get_favorite_ids
+from Micu_market.db_router import reading_from_primary
+
+# generation counters, bumped whenever something shown on the cached pages changes
+GENERATION_KEYS = {
+    'listings': 'pagecache:gen:listings',
+    'categories': 'pagecache:gen:categories',
+}
+# tracking parameters that do not change the page
+IGNORED_PARAMS = {'fbclid', 'gclid'}
+
+
+def page_cache_timeout():
+    return getattr(settings, 'PAGE_CACHE', {}).get('TIMEOUT', 300)
+
+
+def get_generation():
+    """Current generations as one token, e.g. '1718000000000.1718000000123'."""
+    keys = list(GENERATION_KEYS.values())
+    values = cache.get_many(keys)
+    for key in keys:
+        if key not in values:
+            # start from the clock, so a lost counter never reuses an old value
+            cache.add(key, int(time.time() * 1000), timeout=None)
+            values[key] = cache.get(key)
+    return '.'.join(str(values[key]) for key in keys)
+
+
+def bump_generation(*names):
+    def bump():
+        for name in names:
+            key = GENERATION_KEYS[name]
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.add(key, int(time.time() * 1000), timeout=None)
+    # after commit, so a page cached under the new generation sees the new rows
+    transaction.on_commit(bump)
+
+
+def normalized_params(request):
+    """Query string with sorted keys, empty values and tracking parameters dropped."""
+    params = sorted(
+        (key, value) for key, value in request.GET.items()
+        if value and key not in IGNORED_PARAMS and not key.startswith('utm_')
+    )
+    return urlencode(params)
+
+
+def page_cache_key(request, prefix):
+    params = hashlib.md5(normalized_params(request).encode()).hexdigest()
+    return f'pagecache:{prefix}:{get_generation()}:{params}'
+
+
+def cache_anonymous_page(prefix):
+    """Serve anonymous GET requests from the cache, keyed by the normalized query string.
+
+    Logged-in users, requests with pending messages and non-200 responses
+    always go to the view.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            timeout = page_cache_timeout()
+            if (
+                not timeout
+                or request.method not in ('GET', 'HEAD')
+                or request.user.is_authenticated
+                or len(messages.get_messages(request))
+            ):
+                return view(request, *args, **kwargs)
+
+            key = page_cache_key(request, prefix)
+            cached = cache.get(key)
+            if cached is not None:
+                content, headers = cached
+                return HttpResponse(content, headers=headers)
+
+            # stored under the current generation, so not rendered from a replica that may not have its rows yet
+            with reading_from_primary():
+                response = view(request, *args, **kwargs)
+            if response.status_code == 200 and not response.cookies and not response.streaming:
+                cache.set(key, (response.content, dict(response.items())), timeout)
+            return response
+        return wrapper
+    return decorator
+
+
+def fragment_cached(name, *vary_on):
+    """Whether the {% cache %} fragment `name` is in the cache, for views that load its rows up front."""
+    # the cache the tag uses
+    try:
+        fragment_cache = caches['template_fragments']
+    except InvalidCacheBackendError:
+        fragment_cache = cache
+    return fragment_cache.has_key(make_template_fragment_key(name, vary_on))
+
+
+def page_cache_context(request):
+    """Fragment cache keys for the templates, and the user's favorites to mark on the cached cards."""
+    return {
+        'cache_generation': get_generation(),
+        'cache_params': normalized_params(request),
+        'page_cache_timeout': page_cache_timeout(),
+        'favorite_ids': sorted(get_favorite_ids(request.user)),
+    }
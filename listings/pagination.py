@@ -0,0 +1,162 @@
+import json
+
+from django.core import signing
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q
+
+# sort options that can be paginated by key, always with id as tie-breaker
+KEYSET_ORDERINGS = {
+    '-created_at': ('-created_at', '-id'),
+    'created_at': ('created_at', 'id'),
+    'price': ('price', 'id'),
+    '-price': ('-price', '-id'),
+}
+
+
+def estimate_count(queryset, exact_limit=1000):
+    """Exact count up to exact_limit, the planner's estimate (PostgreSQL) above it.
+
+    Returns (count, is_estimate).
+    """
+    queryset = queryset.order_by()
+    capped = queryset[:exact_limit + 1].count()
+    if capped <= exact_limit:
+        return capped, False
+
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return max(int(plan[0]['Plan']['Plan Rows']), capped), True
+    return capped, True
+
+
+class KeysetPage:
+    is_keyset = True
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if not self._has_next or not self.object_list:
+            return None
+        return self.paginator.encode_cursor(self.object_list[-1], 'next')
+
+    @property
+    def previous_cursor(self):
+        if not self._has_previous or not self.object_list:
+            return None
+        return self.paginator.encode_cursor(self.object_list[0], 'prev')
+
+
+class KeysetPaginator:
+    """Cursor pagination over a fixed ordering, e.g. ('-created_at', '-id').
+
+    Pages are found with WHERE (key) < (last key) instead of OFFSET, so deep
+    pages cost the same as the first one and rows inserted meanwhile do not
+    shift them. Cursors are signed and opaque to clients. The total is only
+    counted (or estimated) on the first page and then carried in the cursor.
+    """
+
+    salt = 'listings.keyset'
+
+    def __init__(self, queryset, ordering, per_page=12, with_count=True):
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.per_page = per_page
+        self.with_count = with_count
+        self.count = None
+        self.count_is_estimate = False
+        self.fields = [
+            (name.lstrip('-'), name.startswith('-'), queryset.model._meta.get_field(name.lstrip('-')))
+            for name in self.ordering
+        ]
+
+    def encode_cursor(self, obj, direction):
+        payload = {
+            'o': list(self.ordering),
+            'd': direction,
+            'k': [field.value_to_string(obj) for _, _, field in self.fields],
+        }
+        if self.count is not None:
+            payload['c'] = [self.count, self.count_is_estimate]
+        return signing.dumps(payload, salt=self.salt, compress=True)
+
+    def decode_cursor(self, cursor):
+        if not cursor:
+            return None
+        try:
+            payload = signing.loads(cursor, salt=self.salt)
+            if payload['o'] != list(self.ordering) or payload['d'] not in ('next', 'prev'):
+                return None
+            values = [field.to_python(value) for (_, _, field), value in zip(self.fields, payload['k'], strict=True)]
+        except (signing.BadSignature, KeyError, TypeError, ValueError, ValidationError):
+            # a tampered or stale cursor just starts from the first page
+            return None
+        return values, payload['d'], payload.get('c')
+
+    def _beyond(self, values, backwards=False):
+        # rows strictly after `values` in the ordering (before, when going backwards)
+        condition = Q()
+        equal = {}
+        for (name, descending, _), value in zip(self.fields, values):
+            lookup = 'lt' if descending != backwards else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        # redundant bound on the leading key so the planner can use an index range scan
+        name, descending, _ = self.fields[0]
+        bound = 'lte' if descending != backwards else 'gte'
+        return Q(**{f'{name}__{bound}': values[0]}) & condition
+
+    def get_page(self, cursor=None):
+        decoded = self.decode_cursor(cursor)
+        limit = self.per_page + 1
+
+        if decoded is None:
+            rows = list(self.queryset.order_by(*self.ordering)[:limit])
+            has_next, has_previous = len(rows) > self.per_page, False
+            rows = rows[:self.per_page]
+            if self.with_count:
+                self.count, self.count_is_estimate = estimate_count(self.queryset)
+        else:
+            values, direction, count = decoded
+            if count:
+                self.count, self.count_is_estimate = count
+            if direction == 'next':
+                rows = list(self.queryset.order_by(*self.ordering).filter(self._beyond(values))[:limit])
+                has_next, has_previous = len(rows) > self.per_page, True
+                rows = rows[:self.per_page]
+            else:
+                reverse_ordering = [name[1:] if name.startswith('-') else f'-{name}' for name in self.ordering]
+                rows = list(self.queryset.order_by(*reverse_ordering).filter(self._beyond(values, backwards=True))[:limit])
+                has_next, has_previous = True, len(rows) > self.per_page
+                rows = rows[:self.per_page][::-1]
+
+        return KeysetPage(rows, self, has_next, has_previous)
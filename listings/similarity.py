@@ -0,0 +1,268 @@
+import heapq
+import logging
+import math
+import re
+import threading
+import unicodedata
+import zlib
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from operator import itemgetter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from django.db.models import Case, Count, F, FloatField, Q, Sum, Value, When
+
+# terms kept per listing (the rest barely moves the cosine) and neighbours stored per listing
+TOP_TERMS = 32
+NEIGHBOURS = 8
+TITLE_WEIGHT = 2
+# added to the cosine of two listings in the same category
+CATEGORY_BONUS = 0.1
+# terms found in more than this share of listings are treated as stopwords
+MAX_DF_RATIO = 0.1
+# a rebuild scores each term only against the listings where it weighs the most,
+# so a common term costs a bounded number of comparisons instead of O(n) per listing
+MAX_POSTINGS = 250
+DESCRIPTION_CHARS = 2000
+# the number of active listings, the n of the IDF, set by every rebuild
+DOC_COUNT_KEY = 'similarity:active_listings'
+DOC_COUNT_TIMEOUT = 60 * 60 * 24
+
+logger = logging.getLogger(__name__)
+
+WORD_RE = re.compile(r'[a-z0-9]+')
+STOPWORDS = frozenset(
+    'si sau de la in cu pe din pentru un o este sunt care ce mai foarte nu se ca al ale ai '
+    'lui fara prin dupa sub peste doar vand vinde vanzare pret'.split()
+)
+
+
+def tokenize(text):
+    # lowercase and strip diacritics, so "ț" and "t" match
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return [word for word in WORD_RE.findall(text) if len(word) > 1 and word not in STOPWORDS]
+
+
+def term_id(term):
+    # stable across processes (unlike hash()), fits a signed 32-bit column
+    return zlib.crc32(term.encode()) & 0x7fffffff
+
+
+def term_counts(title, description):
+    """Hashed term frequencies: title words and word pairs (weighted), description words."""
+    counts = Counter()
+    title_words = tokenize(title or '')
+    for word in title_words:
+        counts[term_id(word)] += TITLE_WEIGHT
+    for first, second in zip(title_words, title_words[1:]):
+        counts[term_id(f'{first} {second}')] += TITLE_WEIGHT
+    for word in tokenize((description or '')[:DESCRIPTION_CHARS]):
+        counts[term_id(word)] += 1
+    return counts
+
+
+def weigh(counts, df, n_docs):
+    """TF-IDF vector reduced to the TOP_TERMS heaviest terms, L2-normalized."""
+    weights = {}
+    for term, count in counts.items():
+        term_df = df.get(term, 0)
+        if n_docs >= 20 and term_df > MAX_DF_RATIO * n_docs:
+            continue
+        weights[term] = (1 + math.log(count)) * (math.log((1 + n_docs) / (1 + term_df)) + 1)
+    top = heapq.nlargest(TOP_TERMS, weights.items(), key=itemgetter(1))
+    norm = math.sqrt(sum(weight * weight for _, weight in top))
+    return {term: weight / norm for term, weight in top} if norm else {}
+
+
+def rank_neighbours(scores, category_id, categories):
+    """Top NEIGHBOURS (listing_id, score) from {listing_id: cosine}."""
+    ranked = (
+        (other_id, score + (CATEGORY_BONUS if category_id and categories.get(other_id) == category_id else 0))
+        for other_id, score in scores.items()
+    )
+    return heapq.nlargest(NEIGHBOURS, ranked, key=itemgetter(1))
+
+
+def _neighbour_rows(listing_id, neighbours):
+    from .models import SimilarListing
+
+    return [
+        SimilarListing(listing_id=listing_id, similar_id=other_id, score=score, rank=rank)
+        for rank, (other_id, score) in enumerate(neighbours)
+    ]
+
+
+def rebuild_similar_listings(batch_size=1000):
+    """Recompute the term vectors and neighbours of every active listing.
+
+    The listings are streamed twice, for the document frequencies and then for
+    the vectors, so only the top terms of each listing stay in memory. Scoring
+    walks an inverted index capped at MAX_POSTINGS per term, so each listing
+    is compared with a bounded number of listings sharing a term.
+    """
+    from .models import Listing, ListingTerm, SimilarListing
+
+    listings = Listing.objects.filter(status='active').only('id', 'title', 'description', 'category_id')
+    df = Counter()
+    n_docs = 0
+    for listing in listings.iterator(chunk_size=batch_size):
+        df.update(term_counts(listing.title, listing.description).keys())
+        n_docs += 1
+
+    vectors = {}
+    categories = {}
+    for listing in listings.iterator(chunk_size=batch_size):
+        vectors[listing.id] = weigh(term_counts(listing.title, listing.description), df, n_docs)
+        categories[listing.id] = listing.category_id
+    del df
+
+    postings = defaultdict(list)
+    for listing_id, vector in vectors.items():
+        for term, weight in vector.items():
+            postings[term].append((listing_id, weight))
+    for term, posting in postings.items():
+        if len(posting) > MAX_POSTINGS:
+            postings[term] = heapq.nlargest(MAX_POSTINGS, posting, key=itemgetter(1))
+
+    term_rows = []
+    neighbour_rows = []
+    for listing_id, vector in vectors.items():
+        scores = defaultdict(float)
+        for term, weight in vector.items():
+            for other_id, other_weight in postings[term]:
+                scores[other_id] += weight * other_weight
+        scores.pop(listing_id, None)
+        neighbour_rows.extend(_neighbour_rows(listing_id, rank_neighbours(scores, categories[listing_id], categories)))
+        term_rows.extend(ListingTerm(listing_id=listing_id, term=term, weight=weight) for term, weight in vector.items())
+
+    with transaction.atomic():
+        ListingTerm.objects.all().delete()
+        SimilarListing.objects.all().delete()
+        ListingTerm.objects.bulk_create(term_rows, batch_size=batch_size)
+        SimilarListing.objects.bulk_create(neighbour_rows, batch_size=batch_size)
+    cache.set(DOC_COUNT_KEY, n_docs, DOC_COUNT_TIMEOUT)
+    return len(vectors)
+
+
+def active_listing_count():
+    """The number of active listings as of the last rebuild; counted once when the cache has none."""
+    from .models import Listing
+
+    n_docs = cache.get(DOC_COUNT_KEY)
+    if n_docs is None:
+        n_docs = Listing.objects.filter(status='active').count()
+        cache.set(DOC_COUNT_KEY, n_docs, DOC_COUNT_TIMEOUT)
+    return n_docs
+
+
+def update_listing_similarity(listing):
+    """Refresh one listing's terms and neighbours, and offer it to the listings it resembles.
+
+    Document frequencies come from the stored top terms and the listing count
+    from the last rebuild, so weights drift a little from a full rebuild until
+    the next `rebuild_similar_listings`.
+    """
+    from .models import ListingTerm, SimilarListing
+
+    with transaction.atomic():
+        ListingTerm.objects.filter(listing=listing).delete()
+        SimilarListing.objects.filter(Q(listing=listing) | Q(similar=listing)).delete()
+        if listing.status != 'active':
+            return []
+
+        counts = term_counts(listing.title, listing.description)
+        n_docs = active_listing_count()
+        df = dict(
+            ListingTerm.objects.filter(term__in=list(counts)).values('term')
+            .annotate(df=Count('listing')).values_list('term', 'df')
+        )
+        vector = weigh(counts, df, n_docs)
+        if not vector:
+            return []
+        ListingTerm.objects.bulk_create(
+            [ListingTerm(listing=listing, term=term, weight=weight) for term, weight in vector.items()]
+        )
+
+        # dot products with every listing sharing a term, in one grouped query over the term index
+        query_weight = Case(
+            *[When(term=term, then=Value(weight)) for term, weight in vector.items()],
+            default=Value(0.0), output_field=FloatField(),
+        )
+        candidates = list(
+            ListingTerm.objects.filter(term__in=list(vector), listing__status='active')
+            .exclude(listing=listing)
+            .values('listing_id', 'listing__category_id')
+            .annotate(score=Sum(F('weight') * query_weight))
+            .order_by('-score')[:NEIGHBOURS * 4]
+        )
+        scores = {row['listing_id']: row['score'] for row in candidates}
+        categories = {row['listing_id']: row['listing__category_id'] for row in candidates}
+        neighbours = rank_neighbours(scores, listing.category_id, categories)
+        SimilarListing.objects.bulk_create(_neighbour_rows(listing.id, neighbours))
+
+        # the score is symmetric: put this listing into the neighbours' lists where it ranks
+        current = defaultdict(list)
+        rows = SimilarListing.objects.filter(listing_id__in=[other_id for other_id, _ in neighbours])
+        for other_id, similar_id, score in rows.values_list('listing_id', 'similar_id', 'score'):
+            if similar_id != listing.id:
+                current[other_id].append((similar_id, score))
+        changed = {}
+        for other_id, score in neighbours:
+            merged = heapq.nlargest(NEIGHBOURS, current[other_id] + [(listing.id, score)], key=itemgetter(1))
+            if any(similar_id == listing.id for similar_id, _ in merged):
+                changed[other_id] = merged
+        if changed:
+            SimilarListing.objects.filter(listing_id__in=list(changed)).delete()
+            SimilarListing.objects.bulk_create(
+                [row for other_id, merged in changed.items() for row in _neighbour_rows(other_id, merged)]
+            )
+        return neighbours
+
+
+# ======================
+# dispatching
+# ======================
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                # one worker: the updates of a listing saved twice apply in order
+                _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='similar-listings')
+    return _executor
+
+
+def _update_in_background(listing_id):
+    from .models import Listing
+
+    try:
+        # the current row, not the instance the request may still change
+        listing = Listing.objects.filter(pk=listing_id).only('id', 'title', 'description', 'category_id', 'status').first()
+        if listing is not None:
+            update_listing_similarity(listing)
+    except Exception:
+        logger.exception("Similar listings update failed for listing %s", listing_id)
+    finally:
+        # the worker thread has its own DB connection
+        close_old_connections()
+
+
+def schedule_similarity_update(listing):
+    """Queue the update of a saved listing's neighbours according to SIMILAR_LISTINGS['MODE'].
+
+    thread: background worker in this process, after the transaction commits
+    queue:  left to the next rebuild_similar_listings run
+    sync:   updated inline once the transaction commits (tests, shell)
+    """
+    mode = getattr(settings, 'SIMILAR_LISTINGS', {}).get('MODE', 'thread')
+    if mode == 'sync':
+        transaction.on_commit(lambda: update_listing_similarity(listing))
+    elif mode == 'thread':
+        transaction.on_commit(lambda: _get_executor().submit(_update_in_background, listing.pk))
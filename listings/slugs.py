@@ -0,0 +1,82 @@
+import re
+import secrets
+
+from django.db import IntegrityError, transaction
+from django.db.models import BigIntegerField, Count, Max, Q
+from django.db.models.functions import Cast, Substr
+
+
+def next_free_value(queryset, field, base, separator='-', max_length=None):
+    """First free value among base, base-1, base-2, ... found with a single query.
+
+    Looks at the highest numeric suffix already taken instead of probing one
+    candidate per query. Gaps are not reused.
+    """
+    return allocate_values(queryset, field, [base], separator, max_length)[0]
+
+
+def allocate_values(queryset, field, bases, separator='-', max_length=None, chunk_size=50):
+    """Free values for a batch of bases, in order, distinct from each other too.
+
+    One aggregate query per `chunk_size` distinct bases, e.g. slugs for a
+    whole import batch where several rows share a title.
+    """
+    distinct = list(dict.fromkeys(bases))
+    taken = {}
+    for start in range(0, len(distinct), chunk_size):
+        chunk = distinct[start:start + chunk_size]
+        aggregates = {}
+        condition = Q()
+        for index, base in enumerate(chunk):
+            prefix = f"{base}{separator}"
+            # at most 9 digits, so the cast cannot overflow
+            suffixed = Q(**{f'{field}__startswith': prefix, f'{field}__regex': rf'^{re.escape(prefix)}[0-9]{{1,9}}$'})
+            aggregates[f'base_{index}'] = Count('pk', filter=Q(**{field: base}))
+            aggregates[f'highest_{index}'] = Max(Cast(Substr(field, len(prefix) + 1), BigIntegerField()), filter=suffixed)
+            condition |= Q(**{field: base}) | suffixed
+        result = queryset.filter(condition).aggregate(**aggregates)
+        for index, base in enumerate(chunk):
+            taken[base] = (bool(result[f'base_{index}']), result[f'highest_{index}'] or 0)
+
+    values = []
+    for base in bases:
+        base_taken, highest = taken[base]
+        if not base_taken:
+            values.append(base[:max_length] if max_length else base)
+        else:
+            highest += 1
+            values.append(with_suffix(base, f"{separator}{highest}", max_length))
+        taken[base] = (True, highest)
+    return values
+
+
+def random_value(base, separator='-', max_length=None, nbytes=4):
+    """base plus a short random token, for when the numbered suffixes keep colliding."""
+    return with_suffix(base, f"{separator}{secrets.token_hex(nbytes)}", max_length)
+
+
+def with_suffix(base, suffix, max_length=None):
+    if max_length:
+        base = base[:max_length - len(suffix)]
+    return f"{base}{suffix}"
+
+
+def save_unique(instance, field, allocate, save=None, attempts=3):
+    """Save instance, re-allocating `field` when a concurrent insert took the same value.
+
+    The unique constraint is what guarantees correctness; allocate(attempt) is
+    called for a new value after each collision. Other integrity errors are
+    re-raised.
+    """
+    save = save or instance.save
+    model = type(instance)
+    for attempt in range(1, attempts + 1):
+        try:
+            with transaction.atomic():
+                save()
+            return
+        except IntegrityError:
+            value = getattr(instance, field)
+            if attempt == attempts or not model._default_manager.filter(**{field: value}).exists():
+                raise
+            setattr(instance, field, allocate(attempt))
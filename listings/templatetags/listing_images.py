@@ -0,0 +1,44 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html
+
+register = template.Library()
+
+CARD_SIZES = '(max-width: 600px) 100vw, 400px'
+
+
+def _srcset(variants, fmt):
+    entries = sorted((formats[fmt]['width'], formats[fmt]['name']) for formats in variants.values() if fmt in formats)
+    return ', '.join(f"{default_storage.url(name)} {width}w" for width, name in entries)
+
+
+@register.filter
+def variant_url(image, size):
+    """URL of a resized copy of a ListingImage, or of the original while it is not rendered yet."""
+    if not image:
+        return ''
+    variant = (image.variants or {}).get(size, {}).get('jpeg')
+    return default_storage.url(variant['name']) if variant else image.image.url
+
+
+@register.simple_tag
+def cover_picture(listing, sizes=CARD_SIZES):
+    """<picture> for a listing card: WebP and JPEG srcsets, the original cover as fallback."""
+    variants = listing.cover_variants or {}
+    card = variants.get('card', {}).get('jpeg')
+    if card:
+        src, width, height = default_storage.url(card['name']), card['width'], card['height']
+    else:
+        src, width, height = listing.cover_image.url, listing.cover_width, listing.cover_height
+
+    webp = _srcset(variants, 'webp')
+    jpeg = _srcset(variants, 'jpeg')
+    return format_html(
+        '<picture>{}<img src="{}"{} alt="{}" width="{}" height="{}" loading="lazy" decoding="async"></picture>',
+        format_html('<source type="image/webp" srcset="{}" sizes="{}">', webp, sizes) if webp else '',
+        src,
+        format_html(' srcset="{}" sizes="{}"', jpeg, sizes) if jpeg else '',
+        listing.title,
+        width or '',
+        height or '',
+    )
@@ -0,0 +1,32 @@
+from django import template
+from django.template import NodeList
+from django.templatetags.cache import do_cache
+
+from Micu_market.db_router import reading_from_primary
+
+register = template.Library()
+
+
+class PrimaryReadNodeList(NodeList):
+    def __init__(self, nodelist, expire_time_var):
+        super().__init__(nodelist)
+        self.expire_time_var = expire_time_var
+
+    def render(self, context):
+        # a timeout of 0 (PAGE_CACHE off) stores nothing
+        if not self.expire_time_var.resolve(context):
+            return super().render(context)
+        with reading_from_primary():
+            return super().render(context)
+
+
+@register.tag('cache')
+def do_primary_cache(parser, token):
+    """Django's {% cache %}; a fragment that has to be rendered for the cache reads from the primary database.
+
+    The fragments are keyed by the page cache generation, which a write has just
+    bumped when they miss; a lagging replica would put the old rows under it.
+    """
+    node = do_cache(parser, token)
+    node.nodelist = PrimaryReadNodeList(node.nodelist, node.expire_time_var)
+    return node
@@ -0,0 +1,13 @@
+from django import template
+
+from listings.thumbnails import thumbnail_url
+
+register = template.Library()
+
+
+@register.simple_tag
+def thumbnail(obj, size, ext='jpg'):
+    """URL of a resized ListingImage or UserProfile avatar, rendered on first request."""
+    if not obj:
+        return ''
+    return thumbnail_url(obj, size, ext)
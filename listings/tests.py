@@ -1,3 +1,949 @@
-from django.test import TestCase
+import shutil
+import tempfile
+import threading
+import uuid
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
+from django.core import signing
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.db.models import Q
+from django.http import QueryDict
+from django.test import Client, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from categories.models import Category
+from notifications.models import Notification, NotificationPreference
+from Micu_market.db_router import STICKY_COOKIE, ReplicaRouter, _state, read_database, reading_from_primary, reading_from_replica
+from Micu_market.testing import MarketplaceRows, QueryCountTestMixin, ReplicaTestMixin, query_budget_test_settings
+from . import image_pipeline
+from .bulk import import_listings
+from .expiry import expire_listings
+from .facets import count_facets, facet_links, filter_listings, get_facets
+from .models import Listing, ListingImage, SimilarListing
+from .pagination import KEYSET_ORDERINGS, KeysetPaginator
+from .similarity import DOC_COUNT_KEY, rebuild_similar_listings
+from .slugs import allocate_values, next_free_value, save_unique
+from .thumbnails import get_thumbnail_cache, thumbnail_url
+from .view_counter import LocMemViewCounter, RedisViewCounter
+
+User = get_user_model()
+
+
+@override_settings(PAGE_CACHE={'TIMEOUT': 0})
+class ListingIndexUsageTests(TestCase):
+    """The main listing_list_view query shapes must be able to use the listing indexes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('seller', 'seller@example.com', 'parola-test-123')
+        cls.category = Category.objects.create(name='Telefoane', slug='telefoane')
+        for i in range(30):
+            Listing.objects.create(
+                title=f'Telefon {i}',
+                description='Descriere telefon',
+                price=10 + i,
+                city='Cluj-Napoca',
+                owner=cls.owner,
+                category=cls.category,
+                status='active' if i % 3 else 'sold',
+            )
+
+    def explain(self, sql, params=()):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                # the test tables are tiny, so ask whether an index can be used at all
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute(f'EXPLAIN {sql}', params)
+            else:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return '\n'.join(str(row) for row in cursor.fetchall())
+
+    def list_page_sql(self, params):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('listings:list'), params)
+        self.assertEqual(response.status_code, 200)
+        for query in ctx.captured_queries:
+            sql = query['sql']
+            if sql.startswith('SELECT') and 'FROM "listings_listing"' in sql and 'LIMIT' in sql and 'COUNT(' not in sql:
+                return sql
+        self.fail(f'no listing page query for {params}')
+
+    def assertUsesIndex(self, plan, *index_names):
+        self.assertTrue(
+            any(name in plan for name in index_names),
+            f'expected one of {index_names} in plan:\n{plan}',
+        )
+
+    def test_newest_first(self):
+        plan = self.explain(self.list_page_sql({}))
+        self.assertUsesIndex(plan, 'listing_status_created_idx')
+
+    def test_oldest_first(self):
+        plan = self.explain(self.list_page_sql({'sort': 'created_at'}))
+        self.assertUsesIndex(plan, 'listing_status_created_idx')
+
+    def test_price_sort_and_range(self):
+        plan = self.explain(self.list_page_sql({'sort': 'price'}))
+        self.assertUsesIndex(plan, 'listing_status_price_idx')
+        plan = self.explain(self.list_page_sql({'sort': '-price', 'min_price': 15, 'max_price': 30}))
+        self.assertUsesIndex(plan, 'listing_status_price_idx')
+
+    def test_category_filter(self):
+        plan = self.explain(self.list_page_sql({'category': 'telefoane'}))
+        self.assertUsesIndex(plan, 'listing_status_cat_idx', 'listing_status_created_idx')
+
+    def test_owner_listings(self):
+        queryset = Listing.objects.filter(owner=self.owner, status='active').order_by('-created_at')
+        plan = self.explain(*queryset.query.sql_with_params())
+        self.assertUsesIndex(plan, 'listing_owner_status_idx')
+
+    @skipUnless(connection.vendor == 'postgresql', 'trigram indexes are PostgreSQL-only')
+    def test_city_substring_uses_trigram_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            if cursor.fetchone() is None:
+                self.skipTest('pg_trgm is not installed')
+        for field, index_name in (('city', 'listing_city_trgm_idx'), ('title', 'listing_title_trgm_idx')):
+            queryset = Listing.objects.filter(**{f'{field}__icontains': 'clu'}).values('id')
+            plan = self.explain(*queryset.query.sql_with_params())
+            self.assertUsesIndex(plan, index_name)
+
+
+@query_budget_test_settings
+class ListingPageQueryTests(QueryCountTestMixin, TestCase):
+    """Listing pages run a fixed number of queries, within their @query_budget."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create_user('viewer', 'viewer@example.com', 'parola-test-123')
+        cls.rows = MarketplaceRows(cls.viewer)
+        cls.rows.add()
+
+    def test_public_pages(self):
+        listing = Listing.objects.filter(owner=self.rows.partner).first()
+        urls = [
+            reverse('listings:home'),
+            reverse('listings:list'),
+            reverse('listings:list') + f'?category={self.rows.parent.slug}&sort=price',
+            reverse('listings:list') + '?city=Cluj-Napoca&radius=25&min_price=50',
+            reverse('listings:list') + f'?seller={self.rows.partner.username}',
+            reverse('listings:list') + '?search=bicicleta',
+            reverse('listings:detail', args=[listing.slug]),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertQueryCountStable(url, self.rows.add)
+
+    def test_logged_in_pages(self):
+        self.client.force_login(self.viewer)
+        listing = Listing.objects.filter(owner=self.rows.partner).first()
+        for url in (reverse('listings:home'), reverse('listings:list'), reverse('listings:detail', args=[listing.slug]), reverse('listings:my_listings')):
+            with self.subTest(url=url):
+                self.assertQueryCountStable(url, self.rows.add)
+
+
+@override_settings(READ_REPLICAS={'DATABASES': ['replica'], 'STICKY_SECONDS': 15})
+@query_budget_test_settings
+class ReadReplicaTests(ReplicaTestMixin, TransactionTestCase):
+    """Browsing pages read from the replica; writes, and the writer's next reads, use the primary."""
+
+    def setUp(self):
+        self.viewer = User.objects.create_user('viewer', 'viewer@example.com', 'parola-test-123')
+        self.rows = MarketplaceRows(self.viewer)
+        self.rows.add(1)
+        self.listing = Listing.objects.filter(owner=self.rows.partner).first()
+
+    def reads(self, queries):
+        return [sql for sql in queries if sql.lstrip().upper().startswith('SELECT')]
+
+    def test_browsing_pages_read_from_replica(self):
+        urls = [
+            reverse('listings:home'),
+            reverse('listings:list') + '?sort=price',
+            reverse('listings:detail', args=[self.listing.slug]),
+            reverse('reviews:user_reviews', args=[self.viewer.username]),
+            reverse('accounts:public_profile', args=[self.viewer.username]),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                response, queries = self.queries_by_database(self.client.get, url)
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(queries['replica'])
+                self.assertEqual(self.reads(queries['default']), [])
+
+    def listing_reads(self, queries):
+        return [sql for sql in self.reads(queries) if 'FROM "listings_listing"' in sql]
+
+    def test_cache_fills_read_from_primary(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        with override_settings(PAGE_CACHE={'TIMEOUT': 300}):
+            # an anonymous page rendered for the page cache
+            response, queries = self.queries_by_database(self.client.get, reverse('listings:home'))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(queries['replica'], [])
+
+            # logged in: the list_grid fragment and the facet counts are filled from the primary...
+            self.client.force_login(self.viewer)
+            url = reverse('listings:list')
+            response, queries = self.queries_by_database(self.client.get, url)
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(self.listing_reads(queries['default']))
+            self.assertEqual(self.listing_reads(queries['replica']), [])
+
+            # ...and once they are cached the page reads from the replica again
+            response, queries = self.queries_by_database(self.client.get, url)
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(self.listing_reads(queries['replica']))
+            self.assertEqual(self.listing_reads(queries['default']), [])
+
+    def test_other_pages_use_primary(self):
+        self.client.force_login(self.viewer)
+        response, queries = self.queries_by_database(self.client.get, reverse('favorites:list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(queries['replica'], [])
+
+    def test_owner_reads_new_listing_from_primary(self):
+        self.client.force_login(self.viewer)
+        data = {
+            'title': 'Canapea extensibilă', 'description': 'Canapea gri, 3 locuri.',
+            'category': self.listing.category_id, 'price': '750', 'city': 'Cluj-Napoca', 'condition': 'good',
+        }
+        response = self.client.post(reverse('listings:create'), data)
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(STICKY_COOKIE, response.cookies)
+
+        response, queries = self.queries_by_database(self.client.get, response['Location'])
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Canapea extensibilă')
+        self.assertEqual(queries['replica'], [])
+
+        # the other visitors still read from the replica
+        response, queries = self.queries_by_database(Client().get, response.wsgi_request.path)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(queries['replica'])
+
+    def test_view_counter_writes_to_primary(self):
+        counter = {'BACKEND': 'listings.view_counter.LocMemViewCounter', 'OPTIONS': {'flush_interval': 1e-9}}
+        with override_settings(VIEW_COUNTER=counter):
+            response, queries = self.queries_by_database(self.client.get, reverse('listings:detail', args=[self.listing.slug]))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(any(sql.startswith('UPDATE') and 'views_count' in sql for sql in queries['default']))
+        self.assertFalse(any(sql.startswith('UPDATE') for sql in queries['replica']))
+        # a GET that flushes the counter does not pin the visitor to the primary
+        self.assertNotIn(STICKY_COOKIE, response.cookies)
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.views_count, 1)
+
+    def test_transactions_read_from_primary(self):
+        self.assertEqual(read_database(), 'default')
+        with reading_from_replica():
+            self.assertEqual(Listing.objects.all().db, 'replica')
+            with transaction.atomic():
+                self.assertEqual(Listing.objects.all().db, 'default')
+            self.assertEqual(Listing.objects.all().db, 'replica')
+        self.assertEqual(Listing.objects.all().db, 'default')
+
+    def test_sticky_cookie_keeps_reads_on_primary(self):
+        url = reverse('listings:detail', args=[self.listing.slug])
+        self.client.cookies[STICKY_COOKIE] = '1'
+        response, queries = self.queries_by_database(self.client.get, url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(queries['replica'], [])
+        # a read does not renew it
+        self.assertNotIn(STICKY_COOKIE, response.cookies)
+
+        # once the cookie has expired, back to the replica
+        del self.client.cookies[STICKY_COOKIE]
+        response, queries = self.queries_by_database(self.client.get, url)
+        self.assertTrue(queries['replica'])
+
+    def test_sticky_cookie_lifetime(self):
+        with override_settings(READ_REPLICAS={'DATABASES': ['replica'], 'STICKY_SECONDS': 42}):
+            response = self.client.post(reverse('account_login'), {'login': 'viewer@example.com', 'password': 'parola-test-123'})
+        self.assertEqual(response.status_code, 302)
+        # the session saved at login counts as a write
+        cookie = response.cookies[STICKY_COOKIE]
+        self.assertEqual((cookie['max-age'], cookie['httponly'], cookie['samesite']), (42, True, 'Lax'))
+
+    def test_post_without_writes_is_not_sticky(self):
+        self.client.force_login(self.viewer)
+        response = self.client.post(reverse('listings:create'), {'title': ''})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(STICKY_COOKIE, response.cookies)
+
+    def test_no_cookie_without_replicas(self):
+        self.client.force_login(self.viewer)
+        with override_settings(READ_REPLICAS={'DATABASES': [], 'STICKY_SECONDS': 15}):
+            response = self.client.post(reverse('favorites:toggle'), {'listing_id': self.listing.id})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(STICKY_COOKIE, response.cookies)
+
+
+@override_settings(READ_REPLICAS={'DATABASES': ['replica'], 'STICKY_SECONDS': 15})
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+
+    def test_no_opinion_outside_replica_reads(self):
+        self.assertIsNone(self.router.db_for_read(Listing))
+        self.assertEqual(read_database(), 'default')
+
+    def test_blocks(self):
+        with reading_from_replica():
+            self.assertEqual(self.router.db_for_read(Listing), 'replica')
+            # sessions never come from a replica
+            self.assertEqual(self.router.db_for_read(Session), 'default')
+            with reading_from_primary():
+                self.assertEqual(self.router.db_for_read(Listing), 'default')
+            self.assertEqual(self.router.db_for_read(Listing), 'replica')
+        with reading_from_primary():
+            self.assertEqual(self.router.db_for_read(Listing), 'default')
+
+    def test_without_replicas(self):
+        with override_settings(READ_REPLICAS={'DATABASES': [], 'STICKY_SECONDS': 15}), reading_from_replica():
+            self.assertEqual(self.router.db_for_read(Listing), 'default')
+
+    def test_writes_go_to_primary(self):
+        with reading_from_replica():
+            self.assertEqual(self.router.db_for_write(Listing), 'default')
+            # asked for constraint checks too, so it does not pin the request
+            self.assertEqual(self.router.db_for_read(Listing), 'replica')
+            _state.get().wrote = True
+            self.assertEqual(self.router.db_for_read(Listing), 'default')
+
+    def test_sticky_state(self):
+        with reading_from_replica():
+            _state.get().sticky = True
+            self.assertEqual(self.router.db_for_read(Listing), 'default')
+
+    def test_migrations_only_on_primary(self):
+        self.assertFalse(self.router.allow_migrate('replica', 'listings'))
+        self.assertIsNone(self.router.allow_migrate('default', 'listings'))
+
+
+class RedirectHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(302)
+        self.send_header('Location', 'http://169.254.169.254/latest/meta-data/x.jpg')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class SourceDownloadTests(SimpleTestCase):
+    """Imported image URLs are only fetched from public addresses, redirects included."""
+
+    def test_rejects_internal_addresses(self):
+        for url in (
+            'http://127.0.0.1:6379/a.png', 'http://169.254.169.254/x.jpg', 'http://10.0.0.5/a.jpg',
+            'http://192.168.1.1/a.jpg', 'http://[::1]/a.jpg', 'http://0.0.0.0/a.jpg', 'http://localhost/a.jpg',
+        ):
+            with self.subTest(url=url), self.assertRaisesMessage(ValueError, 'adrese publice'):
+                image_pipeline.download_source(url)
+
+    def test_rejects_other_schemes(self):
+        with self.assertRaisesMessage(ValueError, 'http și https'):
+            image_pipeline.download_source('file:///etc/passwd.jpg')
+
+    def test_checks_every_redirect(self):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), RedirectHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        real_public_address = image_pipeline.public_address
+
+        def public_address(host, port):
+            # the test server stands in for a public host
+            return '127.0.0.1' if host == 'images.test' else real_public_address(host, port)
+
+        with mock.patch.object(image_pipeline, 'public_address', public_address):
+            with self.assertRaisesMessage(ValueError, 'adrese publice'):
+                image_pipeline.download_source(f'http://images.test:{server.server_port}/a.jpg')
+
+
+class ListingImportViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('seller', 'seller@example.com', 'parola-test-123')
+        self.client.force_login(self.user)
+
+    def test_broken_csv_is_reported(self):
+        # a field over the csv module's size limit makes the reader raise csv.Error
+        content = 'title,description,category,price,city\n"' + 'x' * 200_000 + '",desc,cat,10,Cluj\n'
+        upload = SimpleUploadedFile('anunturi.csv', content.encode(), content_type='text/csv')
+        response = self.client.post(reverse('listings:import'), {'file': upload})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Fișierul nu a putut fi citit')
+        self.assertFalse(Listing.objects.exists())
+
+
+@override_settings(IMAGE_PIPELINE={'MODE': 'queue'}, SIMILAR_LISTINGS={'MODE': 'queue'})
+class ListingImportImageTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.images_dir = tempfile.mkdtemp()
+        for path in (self.media_root, self.images_dir):
+            self.addCleanup(shutil.rmtree, path, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.owner = User.objects.create_user('seller', 'seller@example.com', 'parola-test-123')
+        self.category = Category.objects.create(name='Biciclete', slug='biciclete')
+        Image.new('RGB', (64, 48), 'red').save(f'{self.images_dir}/fata.jpg', 'JPEG')
+        with open(f'{self.images_dir}/text.png', 'w') as f:
+            f.write('nu este o imagine')
+
+    def run_import(self, *image_lists):
+        lines = ['title,description,category,price,city,images']
+        lines += [f'Bicicletă,Puțin folosită.,biciclete,100,Cluj-Napoca,{images}' for images in image_lists]
+        return import_listings(StringIO('\n'.join(lines) + '\n'), 'csv', self.owner, images_dir=self.images_dir)
+
+    def stored_files(self):
+        return sorted(path.name for path in Path(self.media_root).rglob('*') if path.is_file())
+
+    def test_rejected_row_stores_no_files(self):
+        result = self.run_import('fata.jpg|text.png', 'fata.jpg|lipsa.jpg')
+        self.assertEqual(result.created, 0)
+        self.assertEqual([line for line, _ in result.errors], [2, 3])
+        self.assertEqual(self.stored_files(), [])
+
+    def test_valid_row_stores_its_files(self):
+        result = self.run_import('fata.jpg', 'text.png')
+        self.assertEqual((result.created, result.images), (1, 1))
+        image = ListingImage.objects.get()
+        self.assertEqual((image.width, image.height), (64, 48))
+        self.assertEqual(self.stored_files(), [Path(image.image.name).name])
+
+    def test_failed_batch_deletes_its_files(self):
+        with mock.patch('listings.bulk.insert_batch', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                self.run_import('fata.jpg')
+        self.assertEqual(self.stored_files(), [])
+
+
+@override_settings(PAGE_CACHE={'TIMEOUT': 0})
+class ListingExpiryTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('seller', 'seller@example.com', 'parola-test-123')
+        self.listing = Listing.objects.create(
+            title='Bicicletă de oraș', description='Puțin folosită.', price=300, city='Cluj-Napoca',
+            owner=self.owner, expires_at=timezone.now() - timedelta(days=1),
+        )
+
+    def test_expired_listing_is_not_served_as_unchanged(self):
+        self.client.force_login(self.owner)
+        api_url = reverse('api:listing-detail', kwargs={'slug': self.listing.slug})
+        detail_url = reverse('listings:detail', kwargs={'slug': self.listing.slug})
+        api_etag = self.client.get(api_url).headers['ETag']
+        detail_etag = self.client.get(detail_url).headers['ETag']
+
+        expire_listings()
+
+        # the owner still sees the listing in the API, now inactive
+        response = self.client.get(api_url, HTTP_IF_NONE_MATCH=api_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'inactive')
+        self.assertNotEqual(response.headers['ETag'], api_etag)
+        # the page is gone for everybody
+        self.assertEqual(self.client.get(detail_url, HTTP_IF_NONE_MATCH=detail_etag).status_code, 404)
+
+        # the notification leads to a page that still lists it
+        notification = Notification.objects.get(notification_type='listing_expired', related_object_id=self.listing.id)
+        self.assertNotIn('reactiva', notification.message)
+        self.assertContains(self.client.get(notification.action_url), self.listing.title)
+
+    def create(self, owner, **fields):
+        return Listing.objects.create(title='Canapea', description='Trei locuri.', price=100, city='Cluj-Napoca', owner=owner, **fields)
+
+    def test_sweep_resumes_from_its_cursor(self):
+        muted = User.objects.create_user('muted', 'muted@example.com', 'parola-test-123')
+        NotificationPreference.objects.update_or_create(user=muted, defaults={'app_listing_updates': False})
+        now = timezone.now()
+        # two share expires_at, so the id decides their order
+        oldest = [self.create(self.owner, expires_at=now - timedelta(days=5)) for _ in range(2)]
+        muted_listing = self.create(muted, expires_at=now - timedelta(days=3))
+        future = self.create(self.owner, expires_at=now + timedelta(days=1))
+        sold = self.create(self.owner, expires_at=now - timedelta(days=2), status='sold')
+
+        sweep = expire_listings(batch_size=2, max_batches=1, now=now)
+        self.assertIsNone(sweep.finished_at)
+        self.assertEqual((sweep.last_id, sweep.last_expires_at, sweep.expired_count), (oldest[1].id, oldest[1].expires_at, 2))
+        self.assertEqual(set(Listing.objects.filter(status='inactive').values_list('id', flat=True)), {listing.id for listing in oldest})
+
+        # the next run finishes the same sweep instead of starting over
+        resumed = expire_listings(batch_size=2)
+        self.assertEqual(resumed.pk, sweep.pk)
+        self.assertIsNotNone(resumed.finished_at)
+        self.assertEqual(resumed.expired_count, 4)
+        statuses = dict(Listing.objects.values_list('id', 'status'))
+        self.assertEqual(statuses[muted_listing.id], 'inactive')
+        self.assertEqual(statuses[self.listing.id], 'inactive')
+        self.assertEqual(statuses[future.id], 'active')
+        self.assertEqual(statuses[sold.id], 'sold')
+
+        notified = Notification.objects.filter(notification_type='listing_expired')
+        self.assertEqual(sorted(notified.values_list('related_object_id', flat=True)), sorted([*(listing.id for listing in oldest), self.listing.id]))
+
+        # a new run starts a new sweep
+        self.assertNotEqual(expire_listings().pk, sweep.pk)
+
+
+@override_settings(SIMILAR_LISTINGS={'MODE': 'sync'})
+class SimilarListingsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user('seller', 'seller@example.com', 'parola-test-123')
+        self.bikes = [self.create(f'Bicicletă de oraș {n}', 'Bicicletă cu cadru de aluminiu și frâne pe disc.') for n in range(3)]
+        self.sofa = self.create('Canapea extensibilă', 'Canapea gri din stofă, trei locuri.')
+
+    def create(self, title, description):
+        return Listing.objects.create(title=title, description=description, price=100, city='Cluj-Napoca', owner=self.owner)
+
+    def neighbours(self, listing):
+        return list(SimilarListing.objects.filter(listing=listing).order_by('rank').values_list('similar_id', flat=True))
+
+    def test_rebuild_ranks_listings_sharing_terms(self):
+        self.assertEqual(rebuild_similar_listings(), 4)
+        self.assertEqual(set(self.neighbours(self.bikes[0])), {self.bikes[1].id, self.bikes[2].id})
+        self.assertEqual(self.neighbours(self.sofa), [])
+
+    def test_save_updates_after_commit_without_counting_listings(self):
+        rebuild_similar_listings()
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True):
+                bike = self.create('Bicicletă de oraș nouă', 'Bicicletă cu frâne pe disc.')
+                # nothing is computed inside the request's transaction
+                self.assertFalse(SimilarListing.objects.filter(listing=bike).exists())
+        # the listing count comes from the last rebuild
+        self.assertFalse([query['sql'] for query in queries if 'COUNT(*)' in query['sql']])
+        self.assertEqual(set(self.neighbours(bike)), {listing.id for listing in self.bikes})
+        self.assertIn(bike.id, self.neighbours(self.bikes[0]))
+
+    def test_save_counts_listings_when_the_count_expired(self):
+        rebuild_similar_listings()
+        cache.delete(DOC_COUNT_KEY)
+        with self.captureOnCommitCallbacks(execute=True):
+            bike = self.create('Bicicletă de oraș nouă', 'Bicicletă cu frâne pe disc.')
+        self.assertEqual(set(self.neighbours(bike)), {listing.id for listing in self.bikes})
+
+    @override_settings(SIMILAR_LISTINGS={'MODE': 'queue'})
+    def test_queue_mode_leaves_saves_to_the_rebuild(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            bike = self.create('Bicicletă de oraș nouă', 'Bicicletă cu frâne pe disc.')
+        self.assertFalse(SimilarListing.objects.filter(Q(listing=bike) | Q(similar=bike)).exists())
+
+
+class ViewCounterTests(TestCase):
+    def setUp(self):
+        owner = User.objects.create_user('seller', 'seller@example.com', 'parola-test-123')
+        self.listing = Listing.objects.create(title='Bicicletă', description='Puțin folosită.', price=100, city='Cluj-Napoca', owner=owner)
+
+    def views(self):
+        return Listing.objects.values_list('views_count', flat=True).get(pk=self.listing.pk)
+
+    def check_failed_flush_is_retried(self, counter):
+        counter.incr(self.listing.id, 3)
+        with mock.patch('listings.view_counter.apply_view_deltas', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                counter.flush()
+        counter.incr(self.listing.id, 2)
+        counter.flush()
+        counter.flush()
+        self.assertEqual(self.views(), 5)
+
+    def test_locmem_failed_flush_is_retried(self):
+        self.check_failed_flush_is_retried(LocMemViewCounter(flush_interval=0))
+
+    @skipUnless(settings.REDIS_URL, 'needs REDIS_URL')
+    def test_redis_failed_flush_is_retried(self):
+        counter = RedisViewCounter(key=f'test:views:{uuid.uuid4().hex}', flush_interval=0)
+        self.addCleanup(counter.client.delete, counter.key, counter.processing_key)
+        self.check_failed_flush_is_retried(counter)
+        self.assertFalse(counter.client.exists(counter.processing_key))
+
+    @skipUnless(settings.REDIS_URL, 'needs REDIS_URL')
+    def test_redis_flush_outliving_its_lock(self):
+        counter = RedisViewCounter(key=f'test:views:{uuid.uuid4().hex}', flush_interval=0, lock_timeout=1)
+        self.addCleanup(counter.client.delete, counter.key, counter.processing_key)
+        counter.incr(self.listing.id)
+
+        def slow_apply(deltas, batch_size):
+            counter.client.delete(f'{counter.key}:lock')
+        with mock.patch('listings.view_counter.apply_view_deltas', side_effect=slow_apply):
+            self.assertEqual(counter.flush(), {self.listing.id: 1})
+
+
+class ThumbnailViewTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root, THUMBNAILS={'DIR': f'{media_root}/thumbnails'})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        source = BytesIO()
+        Image.new('RGB', (640, 480), 'red').save(source, 'JPEG')
+        name = default_storage.save('listings/bicicleta.jpg', ContentFile(source.getvalue()))
+        owner = User.objects.create_user('seller', 'seller@example.com', 'parola-test-123')
+        listing = Listing.objects.create(title='Bicicletă', description='Puțin folosită.', price=100, city='Cluj-Napoca', owner=owner)
+        # bulk_create: nothing is scheduled for the image pipeline
+        self.image, = ListingImage.objects.bulk_create([ListingImage(listing=listing, image=name, width=640, height=480)])
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Image.open(BytesIO(b''.join(response.streaming_content))).size, (200, 150))
+
+    def test_thumbnail_evicted_from_disk_is_rendered_again(self):
+        url = thumbnail_url(self.image, 200)
+        self.get(url)
+        cache_dir = get_thumbnail_cache().directory
+        self.assertEqual(len(list(cache_dir.rglob('*.jpg'))), 1)
+
+        for path in cache_dir.rglob('*.jpg'):
+            path.unlink()
+        self.get(url)
+        self.get(url)
+
+    def test_thumbnail_evicted_right_after_rendering(self):
+        cache = get_thumbnail_cache()
+        put = cache.put
+
+        def put_then_evict(key, data):
+            # another process's writes push the new file out at once
+            path = put(key, data)
+            path.unlink()
+            return path
+        with mock.patch.object(cache, 'put', side_effect=put_then_evict):
+            self.get(thumbnail_url(self.image, 200))
+
+
+def image_file(name, size, fmt='JPEG', mode='RGB'):
+    data = BytesIO()
+    Image.new(mode, size, 'red').save(data, fmt)
+    return SimpleUploadedFile(name, data.getvalue())
+
+
+class ImagePipelineTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root, IMAGE_PIPELINE={'MODE': 'sync'}, SIMILAR_LISTINGS={'MODE': 'queue'})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        owner = User.objects.create_user('seller', 'seller@example.com', 'parola-test-123')
+        self.listing = Listing.objects.create(title='Bicicletă', description='Puțin folosită.', price=100, city='Cluj-Napoca', owner=owner)
+
+    def upload(self, upload):
+        with self.captureOnCommitCallbacks(execute=True):
+            image = ListingImage.objects.create(listing=self.listing, image=upload)
+        image.refresh_from_db()
+        return image
+
+    def assertVariants(self, image, sizes):
+        self.assertEqual(image.variants_status, 'ready')
+        self.assertEqual(image.variants_error, '')
+        self.assertEqual(set(image.variants), set(sizes))
+        for size, dimensions in sizes.items():
+            for fmt, pil_format in (('jpeg', 'JPEG'), ('webp', 'WEBP')):
+                with self.subTest(size=size, fmt=fmt):
+                    variant = image.variants[size][fmt]
+                    self.assertEqual((variant['width'], variant['height']), dimensions)
+                    self.assertTrue(variant['name'].endswith(f"-{size}.{image_pipeline.VARIANT_FORMATS[fmt]['ext']}"))
+                    with default_storage.open(variant['name']) as f, Image.open(f) as stored:
+                        self.assertEqual((stored.format, stored.size), (pil_format, dimensions))
+
+    def test_jpeg_is_rendered_in_every_size_and_format(self):
+        image = self.upload(image_file('bicicleta.jpg', (1600, 800)))
+        self.assertEqual((image.width, image.height), (1600, 800))
+        self.assertVariants(image, {'detail': (1200, 600), 'card': (400, 200), 'thumb': (200, 100)})
+        # the first image is the cover, with its variants
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.cover_variants, image.variants)
+
+    def test_small_png_is_not_enlarged(self):
+        image = self.upload(image_file('lampa.png', (300, 150), 'PNG', 'RGBA'))
+        self.assertVariants(image, {'detail': (300, 150), 'card': (300, 150), 'thumb': (200, 100)})
+
+    def test_same_content_is_stored_once(self):
+        first = self.upload(image_file('a.jpg', (500, 500)))
+        second = self.upload(image_file('b.jpg', (500, 500)))
+        self.assertEqual(first.variants, second.variants)
+
+    def test_corrupt_file_is_marked_failed(self):
+        with self.assertLogs('listings.image_pipeline', 'ERROR'):
+            image = self.upload(SimpleUploadedFile('stricat.jpg', b'\xff\xd8 not really a jpeg'))
+        self.assertEqual(image.variants_status, 'failed')
+        self.assertTrue(image.variants_error)
+        self.assertEqual(image.variants, {})
+
+
+@override_settings(IMAGE_PIPELINE={'MODE': 'queue'}, SIMILAR_LISTINGS={'MODE': 'queue'})
+class CoverImageTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        owner = User.objects.create_user('seller', 'seller@example.com', 'parola-test-123')
+        self.listing = Listing.objects.create(title='Bicicletă', description='Puțin folosită.', price=100, city='Cluj-Napoca', owner=owner)
+
+    def add(self, name, size, order=0):
+        return ListingImage.objects.create(listing=self.listing, image=image_file(name, size), order=order)
+
+    def cover(self):
+        self.listing.refresh_from_db()
+        return self.listing.cover_image, self.listing.cover_width, self.listing.cover_height
+
+    def test_first_upload_sets_the_cover(self):
+        self.assertEqual(self.cover(), ('', None, None))
+        first = self.add('fata.jpg', (640, 480))
+        self.assertEqual(self.cover(), (first.image.name, 640, 480))
+        self.add('spate.jpg', (480, 640), order=1)
+        self.assertEqual(self.cover(), (first.image.name, 640, 480))
+
+    def test_reordering_changes_the_cover(self):
+        first = self.add('fata.jpg', (640, 480))
+        second = self.add('spate.jpg', (480, 640), order=1)
+        second.order = -1
+        second.save()
+        self.assertEqual(self.cover(), (second.image.name, 480, 640))
+        # same order: the older image wins
+        second.order = 0
+        second.save()
+        self.assertEqual(self.cover(), (first.image.name, 640, 480))
+
+    def test_deleting_the_cover_falls_back_to_the_next_image(self):
+        first = self.add('fata.jpg', (640, 480))
+        second = self.add('spate.jpg', (480, 640), order=1)
+        first.delete()
+        self.assertEqual(self.cover(), (second.image.name, 480, 640))
+        second.delete()
+        self.assertEqual(self.cover(), ('', None, None))
+        self.assertEqual(self.listing.cover_variants, {})
+
+
+class KeysetPaginatorTests(TestCase):
+    def setUp(self):
+        owner = User.objects.create_user('seller', 'seller@example.com', 'parola-test-123')
+        Listing.objects.bulk_create([
+            Listing(title=f'Bicicletă {n}', slug=f'bicicleta-{n}', description='Puțin folosită.', price=100 + n % 3, city='Cluj-Napoca', owner=owner)
+            for n in range(11)
+        ])
+        # ties on the leading key, so the id tie-breaker decides the page boundaries
+        created_at = timezone.now()
+        ids = list(Listing.objects.order_by('id').values_list('id', flat=True))
+        Listing.objects.filter(id__in=ids[:6]).update(created_at=created_at)
+        Listing.objects.filter(id__in=ids[6:]).update(created_at=created_at - timedelta(hours=1))
+
+    def paginator(self, ordering, per_page=4):
+        return KeysetPaginator(Listing.objects.all(), KEYSET_ORDERINGS[ordering], per_page=per_page)
+
+    def ids(self, page):
+        return [listing.id for listing in page]
+
+    def test_pages_cover_every_row_once_in_both_directions(self):
+        for ordering, keys in KEYSET_ORDERINGS.items():
+            with self.subTest(ordering=ordering):
+                expected = list(Listing.objects.order_by(*keys).values_list('id', flat=True))
+                pages = [self.paginator(ordering).get_page()]
+                while pages[-1].has_next():
+                    pages.append(self.paginator(ordering).get_page(pages[-1].next_cursor))
+                self.assertEqual([self.ids(page) for page in pages], [expected[:4], expected[4:8], expected[8:]])
+                self.assertFalse(pages[0].has_previous())
+
+                back = [pages[-1]]
+                while back[-1].has_previous():
+                    back.append(self.paginator(ordering).get_page(back[-1].previous_cursor))
+                self.assertEqual([self.ids(page) for page in back[1:]], [expected[4:8], expected[:4]])
+
+    def test_page_boundaries(self):
+        page = self.paginator('-created_at', per_page=11).get_page()
+        self.assertEqual(len(page), 11)
+        self.assertFalse(page.has_next())
+        self.assertIsNone(page.next_cursor)
+
+        first = self.paginator('-created_at', per_page=10).get_page()
+        self.assertTrue(first.has_next())
+        last = self.paginator('-created_at', per_page=10).get_page(first.next_cursor)
+        self.assertEqual(len(last), 1)
+        self.assertFalse(last.has_next())
+        self.assertTrue(last.has_previous())
+
+    def test_count_is_carried_in_the_cursor(self):
+        first = self.paginator('price').get_page()
+        second_paginator = self.paginator('price')
+        with self.assertNumQueries(1):
+            second_paginator.get_page(first.next_cursor)
+        self.assertEqual(second_paginator.count, 11)
+
+    def test_bad_cursors_start_from_the_first_page(self):
+        paginator = self.paginator('-created_at')
+        first_ids = self.ids(paginator.get_page())
+        cursor = paginator.get_page().next_cursor
+        listing = Listing.objects.first()
+        cursors = {
+            'tampered': cursor[:-2] + ('AA' if not cursor.endswith('AA') else 'BB'),
+            'other ordering': self.paginator('price').get_page().next_cursor,
+            'unsigned': 'eyJvIjpbXX0',
+            'bad key value': signing.dumps({'o': ['-created_at', '-id'], 'd': 'next', 'k': ['ieri', 'x']}, salt=KeysetPaginator.salt),
+            'missing key': signing.dumps({'o': ['-created_at', '-id'], 'd': 'next', 'k': [str(listing.id)]}, salt=KeysetPaginator.salt),
+            'bad direction': signing.dumps({'o': ['-created_at', '-id'], 'd': 'up', 'k': ['', '1']}, salt=KeysetPaginator.salt),
+        }
+        for name, bad_cursor in cursors.items():
+            with self.subTest(name):
+                page = self.paginator('-created_at').get_page(bad_cursor)
+                self.assertEqual(self.ids(page), first_ids)
+                self.assertFalse(page.has_previous())
+
+    @override_settings(PAGE_CACHE={'TIMEOUT': 0})
+    def test_list_view_ignores_a_bad_cursor(self):
+        response = self.client.get(reverse('listings:list'), {'cursor': 'nu-e-un-cursor'})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.context['page_obj'].has_previous())
+
+
+class SlugAllocationTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('seller', 'seller@example.com', 'parola-test-123')
+
+    def create(self, title='Bicicletă', **fields):
+        return Listing.objects.create(title=title, description='Puțin folosită.', price=100, city='Cluj-Napoca', owner=self.owner, **fields)
+
+    def free(self, base, **kwargs):
+        return next_free_value(Listing.objects.all(), 'slug', base, **kwargs)
+
+    def test_suffix_after_the_highest_taken(self):
+        self.assertEqual(self.free('bicicleta'), 'bicicleta')
+        for slug in ('bicicleta', 'bicicleta-1', 'bicicleta-7'):
+            self.create(slug=slug)
+        # other slugs that share the prefix do not count as suffixes
+        for slug in ('bicicleta-noua', 'bicicleta-9-2', 'bicicletas-20', 'bicicleta-1234567890'):
+            self.create(slug=slug)
+        self.assertEqual(self.free('bicicleta'), 'bicicleta-8')
+        # the base is cut, not the suffix
+        self.assertEqual(self.free('bicicleta', max_length=10), 'biciclet-8')
+
+    def test_batch_values_are_distinct(self):
+        self.create(slug='canapea')
+        bases = ['canapea', 'bicicleta', 'canapea', 'bicicleta', 'masa']
+        self.assertEqual(
+            allocate_values(Listing.objects.all(), 'slug', bases, chunk_size=2),
+            ['canapea-1', 'bicicleta', 'canapea-2', 'bicicleta-1', 'masa'],
+        )
+
+    def test_save_allocates_in_order(self):
+        slugs = [self.create().slug for _ in range(3)]
+        self.assertEqual(slugs, ['bicicleta', 'bicicleta-1', 'bicicleta-2'])
+
+    def test_collision_is_allocated_again(self):
+        self.create()
+        real = next_free_value
+        # a concurrent insert took the slug between the query and the insert
+        stale = iter(['bicicleta'])
+        with mock.patch('listings.models.next_free_value', side_effect=lambda *args, **kwargs: next(stale, None) or real(*args, **kwargs)):
+            self.assertEqual(self.create().slug, 'bicicleta-1')
+
+    def test_repeated_collisions_fall_back_to_a_random_token(self):
+        self.create()
+        with mock.patch('listings.models.next_free_value', return_value='bicicleta'):
+            slug = self.create().slug
+        self.assertRegex(slug, r'^bicicleta-[0-9a-f]{8}$')
+
+    def test_other_integrity_errors_are_raised(self):
+        listing = Listing(title='Bicicletă', slug='bicicleta', owner=self.owner)
+        allocate = mock.Mock()
+
+        def save():
+            raise IntegrityError('NOT NULL constraint failed')
+        with self.assertRaises(IntegrityError):
+            save_unique(listing, 'slug', allocate, save=save)
+        allocate.assert_not_called()
+
+
+@override_settings(SIMILAR_LISTINGS={'MODE': 'queue'})
+class FacetCountTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user('seller', 'seller@example.com', 'parola-test-123')
+        self.sport = Category.objects.create(name='Sport', slug='sport')
+        self.bikes = Category.objects.create(name='Biciclete', slug='biciclete', parent=self.sport)
+        self.home = Category.objects.create(name='Casă', slug='casa')
+        rows = [
+            # (category, city, condition, price, status)
+            (self.bikes, 'Orășelul A', 'new', '99.99', 'active'),
+            (self.bikes, 'Orășelul A', 'good', '100.00', 'active'),
+            (self.sport, 'Orășelul B', 'good', '499.99', 'active'),
+            (self.home, 'Orășelul B', 'poor', '500.00', 'active'),
+            (self.home, 'Orășelul B', 'new', '5000.00', 'active'),
+            (None, 'Orășelul C', 'new', '10.00', 'active'),
+            (self.bikes, 'Orășelul A', 'new', '50.00', 'sold'),
+        ]
+        for category, city, condition, price, status in rows:
+            Listing.objects.create(
+                title='Anunț', description='Descriere.', owner=self.owner, category=category,
+                city=city, condition=condition, price=price, status=status,
+            )
+
+    def facets(self, **params):
+        return count_facets(filter_listings(params)[0])
+
+    def by(self, facets, group, key):
+        return {row[key]: row['count'] for row in facets[group]}
+
+    def test_counts(self):
+        facets = self.facets()
+        self.assertEqual(facets['total'], 6)
+        # a category counts its subcategories too
+        self.assertEqual(self.by(facets, 'categories', 'slug'), {'sport': 3, 'biciclete': 2, 'casa': 2})
+        self.assertEqual(self.by(facets, 'cities', 'value'), {'Orășelul B': 3, 'Orășelul A': 2, 'Orășelul C': 1})
+        self.assertEqual(self.by(facets, 'conditions', 'value'), {'new': 3, 'like_new': 0, 'good': 2, 'fair': 0, 'poor': 1})
+        # the buckets include their lower bound and exclude the upper one
+        self.assertEqual(self.by(facets, 'prices', 'key'), {'0-100': 2, '100-500': 2, '500-1000': 1, '1000-5000': 0, '5000-': 1})
+
+    def test_counts_follow_the_filters(self):
+        facets = self.facets(category='sport', min_price='100')
+        self.assertEqual(facets['total'], 2)
+        self.assertEqual(self.by(facets, 'cities', 'value'), {'Orășelul A': 1, 'Orășelul B': 1})
+        self.assertEqual(self.by(facets, 'categories', 'slug'), {'sport': 2, 'biciclete': 1, 'casa': 0})
+
+    def test_bad_price_bounds_are_ignored(self):
+        for value in ('abc', 'NaN', 'Infinity', '1,5'):
+            with self.subTest(value):
+                self.assertEqual(self.facets(min_price=value, max_price='499.99')['total'], 4)
+        response = self.client.get(reverse('listings:facets'), {'min_price': 'abc'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['total'], 6)
+
+    def test_price_links_select_their_bucket(self):
+        params = {'category': 'sport', 'cursor': 'x'}
+        facets = facet_links(self.facets(**params), params)
+        for price in facets['prices']:
+            with self.subTest(price['key']):
+                query = QueryDict(price['query'])
+                self.assertNotIn('cursor', query)
+                self.assertEqual(filter_listings(query.dict())[0].count(), price['count'])
+
+    def test_cached_until_a_listing_changes(self):
+        self.assertEqual(get_facets({})['total'], 6)
+        Listing.objects.filter(status='sold').update(status='active')
+        self.assertEqual(get_facets({})['total'], 6)
+        with self.captureOnCommitCallbacks(execute=True):
+            Listing.objects.create(title='Anunț', description='Descriere.', owner=self.owner, city='Orășelul C', price='1.00')
+        self.assertEqual(get_facets({})['total'], 8)
@@ -0,0 +1,217 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from io import BytesIO
+from pathlib import Path
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.urls import reverse
+
+from .image_pipeline import VARIANT_FORMATS, render_variant
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the in-process lock is used
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# kind in the URL -> (app_label.Model, image field)
+THUMBNAIL_SOURCES = {
+    'listing': ('listings.ListingImage', 'image'),
+    'avatar': ('accounts.UserProfile', 'avatar'),
+}
+EXTENSIONS = {'jpg': 'jpeg', 'webp': 'webp'}
+
+
+def thumbnail_settings():
+    return {
+        'DIR': Path(settings.MEDIA_ROOT) / 'cache' / 'thumbnails',
+        'MAX_BYTES': 512 * 1024 * 1024,
+        'SIZES': [64, 96, 200, 400, 800, 1200],
+        **getattr(settings, 'THUMBNAILS', {}),
+    }
+
+
+class DiskLRUCache:
+    """Files on disk, bounded in total size, least recently used evicted first.
+
+    Hits only touch the file's mtime; the directory is scanned for eviction
+    after about 5% of max_bytes has been written by this process.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._written = max_bytes  # scan once on the first write
+        self._lock = threading.Lock()
+
+    def path(self, key):
+        return self.directory / key
+
+    def open(self, key):
+        """The cached file opened for reading, or None; an open file can still be read after eviction."""
+        path = self.path(key)
+        try:
+            f = open(path, 'rb')
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return f
+
+    def put(self, key, data):
+        path = self.path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # write then rename, so a reader never sees a half-written file
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+        with self._lock:
+            self._written += len(data)
+            if self._written < self.max_bytes * 0.05:
+                return path
+            self._written = 0
+        self.evict()
+        return path
+
+    def evict(self):
+        files = []
+        total = 0
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith(('.tmp', '.lock')):
+                    continue
+                full = os.path.join(root, name)
+                try:
+                    stat = os.stat(full)
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, full))
+                total += stat.st_size
+        if total <= self.max_bytes:
+            return 0
+
+        removed = 0
+        # down to 90% so that the next writes do not evict again right away
+        target = self.max_bytes * 0.9
+        for _, size, full in sorted(files):
+            if total <= target:
+                break
+            for stale in (full, full + '.lock'):
+                try:
+                    os.remove(stale)
+                except FileNotFoundError:
+                    pass
+            total -= size
+            removed += 1
+        return removed
+
+    def purge(self, prefix):
+        for path in self.path(prefix).glob('*'):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+
+_cache = None
+_key_locks = weakref.WeakValueDictionary()
+_key_locks_guard = threading.Lock()
+
+
+def get_thumbnail_cache():
+    global _cache
+    if _cache is None:
+        config = thumbnail_settings()
+        _cache = DiskLRUCache(config['DIR'], config['MAX_BYTES'])
+    return _cache
+
+
+def reset_thumbnail_cache(**kwargs):
+    global _cache
+    if kwargs.get('setting', 'THUMBNAILS') in ('THUMBNAILS', 'MEDIA_ROOT'):
+        _cache = None
+
+
+setting_changed.connect(reset_thumbnail_cache)
+
+
+@contextmanager
+def variant_lock(path):
+    """Only one thread (and, where fcntl exists, one process) renders a given variant."""
+    key = str(path)
+    with _key_locks_guard:
+        lock = _key_locks.get(key)
+        if lock is None:
+            lock = _key_locks[key] = threading.Lock()
+    with lock:
+        if fcntl is None:
+            yield
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        lock_path = path.with_name(path.name + '.lock')
+        with open(lock_path, 'wb') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def source_token(name):
+    # changes whenever the original is replaced, so thumbnail URLs can be cached forever
+    return hashlib.sha1(name.encode()).hexdigest()[:12]
+
+
+def cache_key(kind, pk, size, token, ext):
+    return f"{kind}/{pk}/{token}-{size}.{ext}"
+
+
+def thumbnail_url(obj, size, ext='jpg'):
+    kind = next(kind for kind, (label, _) in THUMBNAIL_SOURCES.items() if label == obj._meta.label)
+    field = getattr(obj, THUMBNAIL_SOURCES[kind][1])
+    if not field:
+        return ''
+    return reverse('listings:thumbnail', kwargs={
+        'kind': kind, 'pk': obj.pk, 'size': size, 'token': source_token(field.name), 'ext': ext,
+    })
+
+
+def cached_thumbnail(key):
+    """An already rendered thumbnail opened for reading, or None. No database access, no decoding."""
+    return get_thumbnail_cache().open(key)
+
+
+def render_thumbnail(key, source, size, ext):
+    """Render `source` (a FieldFile) into the cache under `key`, once across concurrent requests.
+
+    Returns the thumbnail as a readable file.
+    """
+    cache = get_thumbnail_cache()
+    with variant_lock(cache.path(key)):
+        # another request may have rendered it while we waited
+        thumbnail = cache.open(key)
+        if thumbnail is not None:
+            return thumbnail
+        started = time.monotonic()
+        with source.open('rb') as f:
+            data = render_variant(f, size, EXTENSIONS[ext])
+        logger.debug("Rendered thumbnail %s in %.0f ms", key, (time.monotonic() - started) * 1000)
+        cache.put(key, data)
+    # from memory: the file may already be evicted by another process's writes
+    return BytesIO(data)
+
+
+def content_type(ext):
+    return f"image/{VARIANT_FORMATS[EXTENSIONS[ext]]['format'].lower()}"
@@ -1,4 +1,4 @@
-from django.urls import path
+from django.urls import path, re_path
 from . import views
 
 app_name = 'listings'
@@ -6,10 +6,18 @@ app_name = 'listings'
 urlpatterns = [
     path('', views.home_view, name='home'),
     path('anunturi/', views.listing_list_view, name='list'),
+    path('anunturi/filtre.json', views.listing_facets_view, name='facets'),
     path('anunt/<slug:slug>/', views.listing_detail_view, name='detail'),
     path('adauga/', views.listing_create_view, name='create'),
     path('anunt/<slug:slug>/editeaza/', views.listing_update_view, name='update'),
     path('anunt/<slug:slug>/sterge/', views.listing_delete_view, name='delete'),
     path('anunturile-mele/', views.my_listings_view, name='my_listings'),
     path('anunt/<slug:slug>/imagini/', views.upload_images_view, name='upload_images'),
+    path('anunturile-mele/import/', views.listing_import_view, name='import'),
+    path('anunturile-mele/export/', views.listing_export_view, name='export'),
+    re_path(
+        r'^thumb/(?P<kind>listing|avatar)/(?P<pk>\d+)/(?P<token>[0-9a-f]{12})-(?P<size>\d+)\.(?P<ext>jpg|webp)$',
+        views.thumbnail_view,
+        name='thumbnail',
+    ),
 ]
@@ -0,0 +1,189 @@
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils.module_loading import import_string
+
+
+class BaseViewCounter:
+    """Buffers listing views until they are flushed to Listing.views_count."""
+
+    def __init__(self, flush_interval=30, batch_size=500, **options):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._last_flush = time.monotonic()
+
+    def incr(self, listing_id, amount=1):
+        """Add views and return how many are pending for this listing."""
+        raise NotImplementedError
+
+    def pending(self, listing_id):
+        raise NotImplementedError
+
+    def drain(self):
+        """Remove and return all pending deltas as {listing_id: delta}."""
+        raise NotImplementedError
+
+    def restore(self, deltas):
+        # put deltas back after a failed flush so no views are lost
+        for listing_id, delta in deltas.items():
+            self.incr(listing_id, delta)
+
+    def acknowledge(self, deltas):
+        """Called once the drained deltas are committed to the database."""
+
+    def flush(self):
+        deltas = self.drain()
+        try:
+            apply_view_deltas(deltas, self.batch_size)
+        except Exception:
+            self.restore(deltas)
+            raise
+        self.acknowledge(deltas)
+        self._last_flush = time.monotonic()
+        return deltas
+
+    def maybe_flush(self):
+        if self.flush_interval and time.monotonic() - self._last_flush >= self.flush_interval:
+            self._last_flush = time.monotonic()
+            self.flush()
+
+
+class LocMemViewCounter(BaseViewCounter):
+    """Per-process buffer, for development and tests."""
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self._lock = threading.Lock()
+        self._counts = Counter()
+
+    def incr(self, listing_id, amount=1):
+        with self._lock:
+            self._counts[listing_id] += amount
+            return self._counts[listing_id]
+
+    def pending(self, listing_id):
+        with self._lock:
+            return self._counts.get(listing_id, 0)
+
+    def drain(self):
+        with self._lock:
+            deltas, self._counts = dict(self._counts), Counter()
+        return deltas
+
+
+class RedisViewCounter(BaseViewCounter):
+    """Buffer shared by all processes, kept in one Redis hash."""
+
+    def __init__(self, url=None, key='listings:views:pending', lock_timeout=60, **options):
+        import redis
+
+        super().__init__(**options)
+        self.client = redis.Redis.from_url(url or settings.REDIS_URL)
+        self.response_error = redis.exceptions.ResponseError
+        self.lock_not_owned_error = redis.exceptions.LockNotOwnedError
+        self.key = key
+        self.processing_key = f'{key}:processing'
+        self.lock_timeout = lock_timeout
+
+    def incr(self, listing_id, amount=1):
+        return self.client.hincrby(self.key, listing_id, amount)
+
+    def pending(self, listing_id):
+        return int(self.client.hget(self.key, listing_id) or 0)
+
+    def drain(self):
+        # a hash left in processing_key means the previous flush died halfway
+        if not self.client.exists(self.processing_key):
+            try:
+                self.client.rename(self.key, self.processing_key)
+            except self.response_error:
+                # nothing pending
+                return {}
+        # processing_key stays until acknowledge(): a flush that dies before the
+        # UPDATE commits leaves its deltas to the next one instead of losing them
+        return {int(k): int(v) for k, v in self.client.hgetall(self.processing_key).items()}
+
+    def restore(self, deltas):
+        # nothing to put back, the failed deltas are still in processing_key
+        pass
+
+    def acknowledge(self, deltas):
+        self.client.delete(self.processing_key)
+
+    def flush(self):
+        lock = self.client.lock(f'{self.key}:lock', timeout=self.lock_timeout, blocking=False)
+        if not lock.acquire():
+            # another process is flushing right now
+            return {}
+        try:
+            return super().flush()
+        finally:
+            try:
+                lock.release()
+            except self.lock_not_owned_error:
+                # the flush outlasted lock_timeout and the lock expired; nothing left to release
+                pass
+
+
+def apply_view_deltas(deltas, batch_size=500):
+    """One UPDATE ... SET views_count = views_count + CASE ... per batch."""
+    from .models import Listing
+
+    items = sorted((listing_id, delta) for listing_id, delta in deltas.items() if delta)
+    # all batches or none, so a retry of the same deltas cannot count the first batches twice
+    with transaction.atomic():
+        for start in range(0, len(items), batch_size):
+            batch = items[start:start + batch_size]
+            # QuerySet.update skips save(), so updated_at and the signals stay untouched
+            Listing.objects.filter(id__in=[listing_id for listing_id, _ in batch]).update(
+                views_count=F('views_count') + Case(
+                    *[When(id=listing_id, then=Value(delta)) for listing_id, delta in batch],
+                    default=Value(0),
+                    output_field=IntegerField(),
+                )
+            )
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_view_counter():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                config = getattr(settings, 'VIEW_COUNTER', {})
+                backend_class = import_string(config.get('BACKEND', 'listings.view_counter.LocMemViewCounter'))
+                _backend = backend_class(**config.get('OPTIONS', {}))
+    return _backend
+
+
+def reset_view_counter(**kwargs):
+    global _backend
+    if kwargs.get('setting', 'VIEW_COUNTER') == 'VIEW_COUNTER':
+        _backend = None
+
+
+setting_changed.connect(reset_view_counter)
+
+
+def count_view(listing_id):
+    """Count one view of a listing and return how many are pending for it.
+
+    Also used for 304 answers: the page is not rendered again, but it is still a view.
+    """
+    counter = get_view_counter()
+    pending = counter.incr(listing_id)
+    counter.maybe_flush()
+    return pending
+
+
+def record_view(listing):
+    """Count one view of listing and return the number to display."""
+    return listing.views_count + count_view(listing.id)
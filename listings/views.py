@@ -1,158 +1,208 @@
+import csv
+from contextlib import nullcontext
+
+from django.apps import apps
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.core.paginator import Paginator
-from django.db.models import Count, Q
+from django.db.models import Count, Prefetch, Q
+from django.http import FileResponse, Http404, JsonResponse, StreamingHttpResponse
+from django.utils.cache import patch_cache_control
 from .models import Listing, ListingImage
 from .forms import ListingForm, ListingImageFormSet
-from categories.models import Category
+from .view_counter import count_view, record_view
+from .conditional import listing_version, make_etag, page_not_modified, set_page_validators, viewer_key
+from .bulk import UPLOAD_MAX_ROWS, detect_format, export_lines, export_rows, import_listings, text_stream
+from .pagination import KeysetPaginator, KEYSET_ORDERINGS
+from .page_cache import cache_anonymous_page, fragment_cached, page_cache_context
+from .facets import RADIUS_CHOICES, facet_links, filter_listings, get_facets, parse_radius
+from .thumbnails import (
+    THUMBNAIL_SOURCES, cache_key, cached_thumbnail, content_type, render_thumbnail,
+    source_token, thumbnail_settings, thumbnail_url,
+)
+from categories.models import CategoryListingCount
+from favorites.cache import get_favorite_ids
+from Micu_market.db_router import read_from_replica, reading_from_primary
+from Micu_market.query_budget import query_budget
 
+@cache_anonymous_page('home')
+@query_budget(8)
+@read_from_replica
 def home_view(request):
-    recent_listings = Listing.objects.filter(status='active').select_related('category', 'owner').prefetch_related('images').order_by('-created_at')[:8]
-    featured_listings = Listing.objects.filter(status='active', is_featured=True).select_related('category', 'owner').prefetch_related('images').order_by('-created_at')[:4]
+    # querysets stay lazy: when the template fragments are cached they never run
+    recent_listings = Listing.objects.filter(status='active').select_related('category', 'owner').order_by('-created_at')[:8]
+    featured_listings = Listing.objects.filter(status='active', is_featured=True).select_related('category', 'owner').order_by('-created_at')[:4]
     
-    # favorites stat for authenticated user
-    if request.user.is_authenticated:
-        from favorites.models import Favorite
-        user_favorites = set(Favorite.objects.filter(user=request.user).values_list('listing_id', flat=True))
+    def top_categories():
+        # numbers of listings for each category, including subcategories,
+        # read from the denormalized counters (one indexed query)
+        counts = CategoryListingCount.objects.filter(
+            category__is_active=True
+        ).select_related('category').order_by('-total_count', 'category__order', 'category__name')[:12]
         
-        for listing in recent_listings:
-            listing.is_favorited = listing.id in user_favorites
-        for listing in featured_listings:
-            listing.is_favorited = listing.id in user_favorites
-    
-    # numbers of listings for each category, includind subcategories
-    categories = Category.objects.filter(is_active=True)
-    categories_with_counts = []
-    
-    for category in categories:
-        category_ids = [category.id] + [sub.id for sub in category.get_all_children]
-        active_count = Listing.objects.filter(
-            category_id__in=category_ids, 
-            status='active'
-        ).count()
-        
-        category.active_listings_count = active_count
-        categories_with_counts.append(category)
-    
-    # first 12 categories after the number of listings
-    categories_with_counts.sort(key=lambda x: x.active_listings_count, reverse=True)
-    top_categories = categories_with_counts[:12]
+        categories = []
+        for count in counts:
+            category = count.category
+            category.active_listings_count = count.total_count
+            categories.append(category)
+        return categories
     
     context = {
         'recent_listings': recent_listings,
         'featured_listings': featured_listings,
         'categories': top_categories,
+        **page_cache_context(request),
     }
     return render(request, 'listings/home.html', context)
 
+@cache_anonymous_page('list')
+@query_budget(8)
+@read_from_replica
 def listing_list_view(request):
-    listings = Listing.objects.filter(status='active').select_related('category', 'owner').prefetch_related('images')
-    
-    # sellers sorting
-    seller = request.GET.get('seller')
-    if seller:
-        listings = listings.filter(owner__username=seller)
-    
-    # category sorting
+    # filters shared with the facet counts (listings/facets.py)
+    listings, selected_category = filter_listings(request.GET)
+    listings = listings.select_related('category', 'owner')
     category_param = request.GET.get('category')
-    selected_category = None
-    if category_param:
-        try:
-            selected_category = Category.objects.get(slug=category_param, is_active=True)
-            category_ids = [selected_category.id] + [sub.id for sub in selected_category.get_all_children]
-            listings = listings.filter(category_id__in=category_ids)
-        except Category.DoesNotExist:
-            try:
-                selected_category = Category.objects.get(id=category_param, is_active=True)
-                category_ids = [selected_category.id] + [sub.id for sub in selected_category.get_all_children]
-                listings = listings.filter(category_id__in=category_ids)
-            except (Category.DoesNotExist, ValueError):
-                pass
-    
-    # price sorting
+    seller = request.GET.get('seller')
     min_price = request.GET.get('min_price')
     max_price = request.GET.get('max_price')
-    if min_price:
-        listings = listings.filter(price__gte=min_price)
-    if max_price:
-        listings = listings.filter(price__lte=max_price)
-    
-    # city sorting
     city = request.GET.get('city')
-    if city:
-        listings = listings.filter(city__icontains=city)
-    
-    # search
+    radius = parse_radius(request.GET.get('radius'))
+    condition = request.GET.get('condition')
     search = request.GET.get('search')
-    if search:
-        listings = listings.filter(
-            Q(title__icontains=search) | 
-            Q(description__icontains=search)
-        )
     
-    # sorting
-    sort_by = request.GET.get('sort', '-created_at')
+    # sorting, by relevance by default when searching
+    sort_by = request.GET.get('sort') or ('relevance' if search else '-created_at')
     valid_sorts = ['-created_at', 'created_at', 'price', '-price', 'title', '-title']
-    if sort_by in valid_sorts:
+    if sort_by == 'relevance' and search:
+        pass  # already ordered by rank
+    elif sort_by in valid_sorts:
         listings = listings.order_by(sort_by)
     else:
-        listings = listings.order_by('-created_at')
-    
-    # pagination
-    paginator = Paginator(listings, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+        sort_by = '-created_at'
+        listings = listings.order_by(sort_by)
     
-    if request.user.is_authenticated:
-        from favorites.models import Favorite
-        user_favorites = set(Favorite.objects.filter(user=request.user).values_list('listing_id', flat=True))
-        
-        for listing in page_obj:
-            listing.is_favorited = listing.id in user_favorites
+    # pagination: keyset (cursor) for the date and price sorts, offsets for the others
+    keyset_ordering = KEYSET_ORDERINGS.get(sort_by)
+    cache_context = page_cache_context(request)
+    if keyset_ordering:
+        paginator = KeysetPaginator(listings, keyset_ordering, per_page=12)
+        # the rows are loaded here, before the template; when they will fill the list_grid fragment, from the primary
+        filling = cache_context['page_cache_timeout'] and not fragment_cached('list_grid', cache_context['cache_generation'], cache_context['cache_params'])
+        with reading_from_primary() if filling else nullcontext():
+            page_obj = paginator.get_page(request.GET.get('cursor'))
+    else:
+        paginator = Paginator(listings, 12)
+        page_number = request.GET.get('page')
+        page_obj = paginator.get_page(page_number)
     
-    # templates context
-    categories = Category.objects.filter(is_active=True).order_by('name')
+    # current filters, for the pagination links
+    query_params = request.GET.copy()
+    query_params.pop('page', None)
+    query_params.pop('cursor', None)
     
     context = {
         'page_obj': page_obj,
-        'categories': categories,
+        # counts per category, city, condition and price for the sidebar, one cached query
+        'facets': facet_links(get_facets(request.GET), request.GET),
         'current_category': selected_category,
         'current_category_slug': category_param,
         'current_city': city,
+        'current_radius': radius,
+        'radius_choices': RADIUS_CHOICES,
+        'current_condition': condition,
         'current_seller': seller,
         'min_price': min_price,
         'max_price': max_price,
         'search_query': search,
         'sort_by': sort_by,
+        'pagination_query': query_params.urlencode(),
+        **cache_context,
     }
     return render(request, 'listings/list.html', context)
 
+def listing_facets_view(request):
+    return JsonResponse(facet_links(get_facets(request.GET), request.GET))
+
+def similar_listings(listing_id, category_id, columns=None):
+    """Up to 4 similar active listings, precomputed by listings/similarity.py, else from the same category."""
+    def pick(listings):
+        if columns is not None:
+            listings = listings.values_list(*columns)
+        return list(listings[:4])
+    
+    similar = pick(Listing.objects.filter(similar_to__listing_id=listing_id, status='active').order_by('similar_to__rank'))
+    if not similar:
+        similar = pick(Listing.objects.filter(category_id=category_id, status='active').exclude(id=listing_id))
+    return similar
+
+def listing_detail_validators(request, version):
+    """(ETag, Last-Modified) of a detail page: the listing, its images, the owner's profile,
+    the similar listings and the viewer. views_count is left out, so views do not change it."""
+    similar = similar_listings(version.id, version.category_id, columns=('id', 'updated_at', 'cover_image', 'cover_variants'))
+    is_favorited = version.id in get_favorite_ids(request.user)
+    etag = make_etag(version.token, similar, viewer_key(request), is_favorited)
+    last_modified = max([version.last_modified, *(updated_at for _, updated_at, _, _ in similar)])
+    return etag, last_modified
+
+@query_budget(12)
+@read_from_replica
 def listing_detail_view(request, slug):
-    listing = get_object_or_404(Listing, slug=slug, status='active')
+    # validators first, from a few narrow queries; an unchanged page is only counted
+    version = listing_version(Listing.objects.filter(slug=slug, status='active'), with_owner=True)
+    if version is None:
+        raise Http404("Anunțul nu există")
+    etag, last_modified = listing_detail_validators(request, version)
+    response = page_not_modified(request, etag, last_modified)
+    if response is not None:
+        count_view(version.id)
+        return response
     
-    # numbers of views for each listing
-    listing.views_count += 1
-    listing.save(update_fields=['views_count'])
+    # imported images still being downloaded have no file yet
+    images = Prefetch('images', queryset=ListingImage.objects.exclude(image=''))
+    listing = get_object_or_404(Listing.objects.select_related('category', 'owner').prefetch_related(images), slug=slug, status='active')
     
-    # check for favorite listing if user is authenticated
-    is_favorited = False
-    if request.user.is_authenticated:
-        from favorites.models import Favorite
-        is_favorited = Favorite.objects.filter(user=request.user, listing=listing).exists()
+    # numbers of views for each listing, buffered and flushed in batches
+    listing.views_count = record_view(listing)
     
-    # similar listings
-    similar_listings = Listing.objects.filter(
-        category=listing.category,
-        status='active'
-    ).exclude(id=listing.id).prefetch_related('images')[:4]
+    # check for favorite listing (empty set for anonymous users)
+    is_favorited = listing.id in get_favorite_ids(request.user)
     
     context = {
         'listing': listing,
-        'similar_listings': similar_listings,
+        'similar_listings': similar_listings(listing.id, listing.category_id),
         'is_favorited': is_favorited,
     }
-    return render(request, 'listings/detail.html', context)
+    return set_page_validators(request, render(request, 'listings/detail.html', context), etag, last_modified)
+
+def thumbnail_view(request, kind, pk, token, size, ext):
+    size = int(size)
+    if size not in thumbnail_settings()['SIZES']:
+        raise Http404("Dimensiune indisponibilă")
+    
+    # a cache hit is served straight from disk: no query, no decoding. The file is opened
+    # right away, so an eviction between the lookup and the response cannot break it
+    key = cache_key(kind, pk, size, token, ext)
+    thumbnail = cached_thumbnail(key)
+    if thumbnail is None:
+        model_label, field_name = THUMBNAIL_SOURCES[kind]
+        obj = get_object_or_404(apps.get_model(model_label).objects.only(field_name), pk=pk)
+        source = getattr(obj, field_name)
+        if not source:
+            raise Http404("Imagine inexistentă")
+        if source_token(source.name) != token:
+            # the original was replaced since this URL was generated
+            return redirect(thumbnail_url(obj, size, ext))
+        try:
+            thumbnail = render_thumbnail(key, source, size, ext)
+        except (OSError, ValueError):
+            raise Http404("Imagine inexistentă")
+    
+    response = FileResponse(thumbnail, content_type=content_type(ext))
+    # the URL changes with the original, so it can be cached for good
+    patch_cache_control(response, public=True, max_age=60 * 60 * 24 * 365, immutable=True)
+    return response
 
 def process_images(request, listing):
     images = request.FILES.getlist('images')
@@ -229,8 +279,9 @@ def listing_delete_view(request, slug):
     return render(request, 'listings/delete.html', context)
 
 @login_required
+@query_budget(7)
 def my_listings_view(request):
-    listings = Listing.objects.filter(owner=request.user).order_by('-created_at')
+    listings = Listing.objects.filter(owner=request.user).select_related('category').order_by('-created_at')
     
     paginator = Paginator(listings, 10)
     page_number = request.GET.get('page')
@@ -264,4 +315,40 @@ def upload_images_view(request, slug):
         'formset': formset,
         'title': f'Imagini pentru: {listing.title}'
     }
-    return render(request, 'listings/upload_images.html', context)
\ No newline at end of file
+    return render(request, 'listings/upload_images.html', context)
+@login_required
+def listing_import_view(request):
+    result = None
+    if request.method == 'POST':
+        upload = request.FILES.get('file')
+        if not upload:
+            messages.error(request, 'Alege un fișier CSV sau JSONL.')
+        else:
+            fmt = request.POST.get('format') or detect_format(upload.name)
+            try:
+                result = import_listings(
+                    text_stream(upload.open('rb')), fmt, request.user, max_rows=UPLOAD_MAX_ROWS,
+                )
+            except (UnicodeDecodeError, ValueError, csv.Error) as e:
+                messages.error(request, f'Fișierul nu a putut fi citit: {e}')
+            else:
+                if result.created:
+                    messages.success(request, f'Au fost create {result.created} anunțuri. Imaginile se procesează în fundal.')
+    
+    context = {
+        'result': result,
+        'max_rows': UPLOAD_MAX_ROWS,
+        'title': 'Importă anunțuri'
+    }
+    return render(request, 'listings/import.html', context)
+
+@login_required
+def listing_export_view(request):
+    fmt = 'jsonl' if request.GET.get('format') == 'jsonl' else 'csv'
+    rows = export_rows(Listing.objects.filter(owner=request.user))
+    response = StreamingHttpResponse(
+        export_lines(rows, fmt, absolute_url=request.build_absolute_uri),
+        content_type='application/x-ndjson; charset=utf-8' if fmt == 'jsonl' else 'text/csv; charset=utf-8',
+    )
+    response['Content-Disposition'] = f'attachment; filename="anunturi-{request.user.username}.{fmt}"'
+    return response
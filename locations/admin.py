@@ -0,0 +1,14 @@
+from django.contrib import admin
+from .models import County, Locality
+
+@admin.register(County)
+class CountyAdmin(admin.ModelAdmin):
+    list_display = ('name', 'code')
+    search_fields = ('name', 'code')
+
+@admin.register(Locality)
+class LocalityAdmin(admin.ModelAdmin):
+    list_display = ('name', 'county', 'kind', 'latitude', 'longitude', 'population')
+    list_filter = ('kind', 'county')
+    search_fields = ('name', 'aliases')
+    prepopulated_fields = {'slug': ('name',)}
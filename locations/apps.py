@@ -0,0 +1,18 @@
+from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def load_localities_after_migrate(sender, using, **kwargs):
+    from .gazetteer import load_localities
+    from .models import County
+    # the bundled gazetteer, only into an empty table so that a fuller import is kept
+    if not County.objects.using(using).exists():
+        load_localities(using=using)
+
+
+class LocationsConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'locations'
+
+    def ready(self):
+        post_migrate.connect(load_localities_after_migrate, sender=self)
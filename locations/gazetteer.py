@@ -0,0 +1,167 @@
+import csv
+import re
+import threading
+import time
+import unicodedata
+import uuid
+from pathlib import Path
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.text import slugify
+
+from Micu_market.db_router import reading_from_primary
+
+GAZETTEER_VERSION_KEY = 'locations:gazetteer:version'
+# how often a process checks whether its copy is still current
+RECHECK_SECONDS = 30
+DEFAULT_DATA = Path(__file__).resolve().parent / 'data' / 'localities.csv'
+
+# preferred when a name exists in several places and the county does not decide
+KIND_RANK = {'municipiu': 0, 'oras': 1, 'comuna': 2, 'sat': 3}
+PREFIX_RE = re.compile(r'^(municipiul|mun|orasul|oras|or|comuna|com|satul|sat|judetul|jud)\b\.?\s*')
+SEPARATOR_RE = re.compile(r'[\s\-.,_/]+')
+
+
+def normalize_name(value):
+    """Lookup key for a place name: lowercase, no diacritics, no "mun."/"jud." prefix, "Tg." spelled out."""
+    text = unicodedata.normalize('NFKD', (value or '').strip().lower())
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    text = PREFIX_RE.sub('', text)
+    text = re.sub(r'^tg\b\.?\s*', 'targu ', text)
+    return SEPARATOR_RE.sub(' ', text).strip()
+
+
+class Gazetteer:
+    """In-memory index over counties and localities, built from two queries."""
+
+    def __init__(self, counties, localities):
+        self.counties = {}
+        for county in counties:
+            self.counties[normalize_name(county.name)] = county
+            self.counties[county.code.lower()] = county
+        self.by_name = {}
+        for locality in localities:
+            names = [locality.name] + [alias for alias in locality.aliases.split('|') if alias]
+            for name in names:
+                self.by_name.setdefault(normalize_name(name), []).append(locality)
+
+    @classmethod
+    def load(cls):
+        from .models import County, Locality
+        return cls(County.objects.all(), Locality.objects.select_related('county'))
+
+    def county(self, value):
+        return self.counties.get(normalize_name(value))
+
+    def find(self, city, county=None):
+        """Best locality for a city name, within `county` when it matches there."""
+        candidates = self.by_name.get(normalize_name(city), [])
+        if county and len(candidates) > 1:
+            county = self.county(county)
+            in_county = [locality for locality in candidates if county and locality.county_id == county.id]
+            candidates = in_county or candidates
+        if not candidates:
+            return None
+        return min(candidates, key=lambda l: (KIND_RANK.get(l.kind, len(KIND_RANK)), -(l.population or 0), l.id))
+
+
+_lock = threading.Lock()
+_state = {'version': None, 'gazetteer': None, 'checked_at': 0.0}
+
+
+def _current_version():
+    version = cache.get(GAZETTEER_VERSION_KEY)
+    if version is None:
+        cache.add(GAZETTEER_VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(GAZETTEER_VERSION_KEY)
+    return version
+
+
+def get_gazetteer():
+    """Return the process-local gazetteer, reloading it when another process invalidated it."""
+    now = time.monotonic()
+    gazetteer = _state['gazetteer']
+    if gazetteer is not None and now - _state['checked_at'] < RECHECK_SECONDS:
+        return gazetteer
+
+    version = _current_version()
+    if gazetteer is not None and version == _state['version']:
+        _state['checked_at'] = now
+        return gazetteer
+
+    with _lock:
+        if _state['gazetteer'] is not None and _state['version'] == version:
+            return _state['gazetteer']
+        # kept until the next version: not from a replica that may not have the change yet
+        with reading_from_primary():
+            gazetteer = Gazetteer.load()
+        _state.update(version=version, gazetteer=gazetteer, checked_at=now)
+    return gazetteer
+
+
+def invalidate_gazetteer():
+    """Drop the local copy and tell the other processes to reload theirs."""
+    cache.set(GAZETTEER_VERSION_KEY, uuid.uuid4().hex, None)
+    with _lock:
+        _state.update(version=None, gazetteer=None, checked_at=0.0)
+
+
+def apply_locality(listing):
+    """Normalize listing.city/county to the gazetteer and set its coordinates.
+
+    Places that are not in the gazetteer keep the text as typed and get no
+    coordinates, so they are left out of radius searches.
+    """
+    locality = get_gazetteer().find(listing.city, listing.county)
+    if locality is None:
+        listing.latitude = listing.longitude = None
+        return None
+    listing.city = locality.name
+    listing.county = locality.county.name
+    listing.latitude, listing.longitude = locality.latitude, locality.longitude
+    return locality
+
+
+def load_localities(path=DEFAULT_DATA, using='default', batch_size=1000):
+    """Insert or update counties and localities from a CSV file.
+
+    Columns: county_code, county, name, kind, latitude, longitude, population, aliases.
+    Returns the number of localities read.
+    """
+    from .models import County, Locality
+
+    with open(path, newline='', encoding='utf-8') as f:
+        rows = list(csv.DictReader(f))
+
+    with transaction.atomic(using=using):
+        counties = {row['county_code']: row['county'] for row in rows}
+        County.objects.using(using).bulk_create(
+            [County(code=code, name=name) for code, name in counties.items()],
+            update_conflicts=True, unique_fields=['code'], update_fields=['name'],
+        )
+        county_ids = dict(County.objects.using(using).values_list('code', 'id'))
+
+        localities = {}
+        for row in rows:
+            locality = Locality(
+                county_id=county_ids[row['county_code']],
+                name=row['name'],
+                slug=slugify(row['name']),
+                kind=row.get('kind') or 'sat',
+                latitude=float(row['latitude']),
+                longitude=float(row['longitude']),
+                population=int(row['population']) if row.get('population') else None,
+                aliases=row.get('aliases') or '',
+            )
+            # a name repeated within a county keeps the larger place
+            key = (locality.county_id, locality.slug)
+            if key not in localities or (locality.population or 0) > (localities[key].population or 0):
+                localities[key] = locality
+        Locality.objects.using(using).bulk_create(
+            list(localities.values()), batch_size=batch_size,
+            update_conflicts=True, unique_fields=['county', 'slug'],
+            update_fields=['name', 'kind', 'latitude', 'longitude', 'population', 'aliases'],
+        )
+    invalidate_gazetteer()
+    return len(localities)
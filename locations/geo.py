@@ -0,0 +1,47 @@
+import math
+
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import ASin, Cos, Least, Power, Radians, Sin, Sqrt
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.045
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    dlat = math.radians(lat2 - lat1)
+    dlon = math.radians(lon2 - lon1)
+    a = math.sin(dlat / 2) ** 2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_box(lat, lon, radius_km):
+    """(min_lat, max_lat, min_lon, max_lon) around a point, containing the whole circle."""
+    dlat = radius_km / KM_PER_DEGREE
+    dlon = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01))
+    return lat - dlat, lat + dlat, lon - dlon, lon + dlon
+
+
+def distance_km(lat, lon, lat_field='latitude', lon_field='longitude'):
+    """Haversine distance from a point as an ORM expression.
+
+    Uses only functions built into PostgreSQL and registered by Django on
+    SQLite, so no PostGIS is needed.
+    """
+    half_dlat = Radians(F(lat_field) - Value(lat)) / 2
+    half_dlon = Radians(F(lon_field) - Value(lon)) / 2
+    a = Power(Sin(half_dlat), 2) + Value(math.cos(math.radians(lat))) * Cos(Radians(F(lat_field))) * Power(Sin(half_dlon), 2)
+    # rounding can push the root just above 1 for antipodal points
+    return Value(2 * EARTH_RADIUS_KM) * ASin(Least(Sqrt(a), Value(1.0)), output_field=FloatField())
+
+
+def within_radius(queryset, lat, lon, radius_km):
+    """Rows of `queryset` within radius_km of a point, annotated with `distance`.
+
+    The bounding box is a plain range filter the (latitude, longitude) index
+    can answer; the exact distance is only computed for the rows inside it.
+    """
+    min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, radius_km)
+    return queryset.filter(
+        latitude__range=(min_lat, max_lat),
+        longitude__range=(min_lon, max_lon),
+    ).annotate(distance=distance_km(lat, lon)).filter(distance__lte=radius_km)
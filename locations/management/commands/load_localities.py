@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from locations.gazetteer import DEFAULT_DATA, load_localities
+
+
+class Command(BaseCommand):
+    help = "Load or update the localities gazetteer from a CSV file (the bundled one by default)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default=str(DEFAULT_DATA),
+            help="CSV with county_code, county, name, kind, latitude, longitude, population, aliases",
+        )
+
+    def handle(self, *args, **options):
+        count = load_localities(options['path'])
+        self.stdout.write(f"Loaded {count} localities. Run normalize_listing_locations to update existing listings.")
@@ -0,0 +1,58 @@
+from django.db import models
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .gazetteer import invalidate_gazetteer
+
+
+class County(models.Model):
+    name = models.CharField(max_length=100, unique=True, verbose_name="Nume")
+    code = models.CharField(max_length=2, unique=True, verbose_name="Indicativ")
+
+    class Meta:
+        ordering = ['name']
+        verbose_name = "Județ"
+        verbose_name_plural = "Județe"
+
+    def __str__(self):
+        return self.name
+
+
+class Locality(models.Model):
+    """A town or village with its coordinates, what Listing.city and county are normalized to"""
+    KIND_CHOICES = [
+        ('municipiu', 'Municipiu'),
+        ('oras', 'Oraș'),
+        ('comuna', 'Comună'),
+        ('sat', 'Sat'),
+    ]
+
+    county = models.ForeignKey(County, on_delete=models.CASCADE, related_name='localities', verbose_name="Județ")
+    name = models.CharField(max_length=100, verbose_name="Nume")
+    slug = models.SlugField(max_length=120)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, default='sat', verbose_name="Tip")
+    latitude = models.FloatField(verbose_name="Latitudine")
+    longitude = models.FloatField(verbose_name="Longitudine")
+    population = models.PositiveIntegerField(null=True, blank=True, verbose_name="Populație")
+    # other spellings people type, separated by |
+    aliases = models.CharField(max_length=255, blank=True, verbose_name="Alte denumiri")
+
+    class Meta:
+        ordering = ['name']
+        constraints = [
+            models.UniqueConstraint(fields=['county', 'slug'], name='locality_county_slug_uniq'),
+        ]
+        verbose_name = "Localitate"
+        verbose_name_plural = "Localități"
+
+    def __str__(self):
+        return f"{self.name}, {self.county.name}"
+
+
+# the in-memory gazetteer is rebuilt after any edit (load_localities invalidates it itself)
+@receiver(post_save, sender=County)
+@receiver(post_delete, sender=County)
+@receiver(post_save, sender=Locality)
+@receiver(post_delete, sender=Locality)
+def invalidate_gazetteer_on_change(sender, **kwargs):
+    invalidate_gazetteer()
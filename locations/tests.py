@@ -0,0 +1,138 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from listings.models import Listing
+from .gazetteer import get_gazetteer, normalize_name
+from .geo import bounding_box, haversine_km, within_radius
+from .models import County, Locality
+
+User = get_user_model()
+
+
+class NormalizeNameTests(SimpleTestCase):
+    def test_names(self):
+        cases = [
+            ('Cluj-Napoca', 'cluj napoca'),
+            ('  BRAȘOV ', 'brasov'),
+            ('Târgu Mureș', 'targu mures'),
+            ('Tg. Mureș', 'targu mures'),
+            ('Tg Jiu', 'targu jiu'),
+            ('Mun. Cluj-Napoca', 'cluj napoca'),
+            ('municipiul București', 'bucuresti'),
+            ('Jud. Cluj', 'cluj'),
+            ('Comuna Florești', 'floresti'),
+            ('Sânmartin', 'sanmartin'),
+            (None, ''),
+        ]
+        for value, key in cases:
+            with self.subTest(value):
+                self.assertEqual(normalize_name(value), key)
+
+
+class LocalityTestMixin:
+    def setUp(self):
+        cache.clear()
+        # start from known places instead of the bundled gazetteer loaded after migrate
+        County.objects.all().delete()
+        self.cluj = County.objects.create(name='Cluj', code='CJ')
+        self.mures = County.objects.create(name='Mureș', code='MS')
+        self.cluj_napoca = self.locality(self.cluj, 'Cluj-Napoca', 'municipiu', 46.7712, 23.6236, 'Cluj|Kolozsvár')
+        self.floresti = self.locality(self.cluj, 'Florești', 'comuna', 46.7475, 23.4908)
+        self.turda = self.locality(self.cluj, 'Turda', 'municipiu', 46.5667, 23.7833)
+        self.targu_mures = self.locality(self.mures, 'Târgu Mureș', 'municipiu', 46.5386, 24.5575)
+        # the same village name in two counties
+        self.sancraiu_cluj = self.locality(self.cluj, 'Sâncraiu', 'comuna', 46.8331, 23.0167, population=1500)
+        self.sancraiu_mures = self.locality(self.mures, 'Sâncraiu de Mureș', 'comuna', 46.5539, 24.5264, 'Sâncraiu', population=7000)
+
+    def locality(self, county, name, kind, latitude, longitude, aliases='', population=None):
+        return Locality.objects.create(
+            county=county, name=name, slug=normalize_name(name).replace(' ', '-'), kind=kind,
+            latitude=latitude, longitude=longitude, aliases=aliases, population=population,
+        )
+
+
+class GazetteerTests(LocalityTestMixin, TestCase):
+    def test_find_ignores_case_diacritics_and_prefixes(self):
+        gazetteer = get_gazetteer()
+        for value in ('Cluj-Napoca', 'cluj napoca', 'CLUJ-NAPOCA', 'Mun. Cluj-Napoca'):
+            with self.subTest(value):
+                self.assertEqual(gazetteer.find(value), self.cluj_napoca)
+        for value in ('Targu Mures', 'Tg. Mureș', 'târgu-mureș'):
+            with self.subTest(value):
+                self.assertEqual(gazetteer.find(value), self.targu_mures)
+        self.assertIsNone(gazetteer.find('Atlantida'))
+
+    def test_find_by_alias(self):
+        gazetteer = get_gazetteer()
+        self.assertEqual(gazetteer.find('Cluj'), self.cluj_napoca)
+        self.assertEqual(gazetteer.find('Kolozsvár'), self.cluj_napoca)
+
+    def test_county_decides_between_namesakes(self):
+        gazetteer = get_gazetteer()
+        self.assertEqual(gazetteer.find('Sâncraiu', 'Cluj'), self.sancraiu_cluj)
+        self.assertEqual(gazetteer.find('Sancraiu', 'jud. Mures'), self.sancraiu_mures)
+        self.assertEqual(gazetteer.find('Sâncraiu', 'MS'), self.sancraiu_mures)
+        # no county, or one without the name: the larger place
+        self.assertEqual(gazetteer.find('Sâncraiu'), self.sancraiu_mures)
+        self.assertEqual(gazetteer.find('Sâncraiu', 'Ilfov'), self.sancraiu_mures)
+
+    def test_reloaded_after_a_change(self):
+        self.assertIsNone(get_gazetteer().find('Gherla'))
+        gherla = self.locality(self.cluj, 'Gherla', 'municipiu', 47.0333, 23.9167)
+        self.assertEqual(get_gazetteer().find('Gherla'), gherla)
+
+
+@override_settings(SIMILAR_LISTINGS={'MODE': 'queue'})
+class ListingLocationTests(LocalityTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = User.objects.create_user('seller', 'seller@example.com', 'parola-test-123')
+
+    def create(self, city, county=''):
+        return Listing.objects.create(
+            title='Bicicletă', description='Puțin folosită.', price=100, owner=self.owner, city=city, county=county,
+        )
+
+    def test_save_normalizes_the_place(self):
+        listing = self.create('tg. mures')
+        self.assertEqual((listing.city, listing.county), ('Târgu Mureș', 'Mureș'))
+        self.assertEqual((listing.latitude, listing.longitude), (46.5386, 24.5575))
+
+        listing = self.create('Sancraiu', 'cluj')
+        self.assertEqual((listing.city, listing.county), ('Sâncraiu', 'Cluj'))
+
+        listing.city = 'Cluj'
+        listing.save(update_fields=['city'])
+        listing.refresh_from_db()
+        self.assertEqual((listing.city, listing.latitude, listing.longitude), ('Cluj-Napoca', 46.7712, 23.6236))
+
+    def test_unknown_place_is_kept_without_coordinates(self):
+        listing = self.create('Cluj-Napoca')
+        listing.city = 'Satul din Vale'
+        listing.save()
+        listing.refresh_from_db()
+        self.assertEqual(listing.city, 'Satul din Vale')
+        self.assertIsNone(listing.latitude)
+        self.assertIsNone(listing.longitude)
+
+    def test_within_radius(self):
+        center = self.create('Cluj-Napoca')
+        near = self.create('Florești')
+        far = self.create('Turda')
+        self.create('Satul din Vale')
+        # inside the 15 km bounding box, outside the circle
+        corner = self.locality(self.cluj, 'Colț', 'sat', 46.7712 + 0.12, 23.6236 + 0.17)
+        in_corner = self.create('Colț')
+        self.assertGreater(haversine_km(46.7712, 23.6236, corner.latitude, corner.longitude), 15)
+        min_lat, max_lat, min_lon, max_lon = bounding_box(46.7712, 23.6236, 15)
+        self.assertTrue(min_lat < corner.latitude < max_lat and min_lon < corner.longitude < max_lon)
+        self.assertFalse(min_lat < self.turda.latitude < max_lat)
+
+        found = within_radius(Listing.objects.all(), self.cluj_napoca.latitude, self.cluj_napoca.longitude, 15)
+        distances = {listing.id: listing.distance for listing in found}
+        self.assertEqual(set(distances), {center.id, near.id})
+        self.assertAlmostEqual(distances[center.id], 0, places=3)
+        self.assertAlmostEqual(distances[near.id], haversine_km(46.7712, 23.6236, 46.7475, 23.4908), places=3)
+        self.assertNotIn(far.id, distances)
+        self.assertNotIn(in_corner.id, distances)
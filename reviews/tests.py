@@ -1,3 +1,24 @@
+from django.contrib.auth import get_user_model
 from django.test import TestCase
+from django.urls import reverse
 
-# Create your tests here.
+from Micu_market.testing import MarketplaceRows, QueryCountTestMixin, query_budget_test_settings
+
+User = get_user_model()
+
+
+@query_budget_test_settings
+class ReviewPageQueryTests(QueryCountTestMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create_user('viewer', 'viewer@example.com', 'parola-test-123')
+        cls.rows = MarketplaceRows(cls.viewer)
+        cls.rows.add()
+
+    def test_user_reviews(self):
+        self.assertQueryCountStable(reverse('reviews:user_reviews', args=[self.viewer.username]), self.rows.add)
+
+    def test_my_reviews(self):
+        self.client.force_login(self.viewer)
+        self.assertQueryCountStable(reverse('reviews:my_reviews'), self.rows.add)
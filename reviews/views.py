@@ -3,16 +3,20 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth import get_user_model
 from django.contrib import messages
 from django.core.paginator import Paginator
-from django.db.models import Avg, Q
+from django.db.models import Avg, Count, Q
 from django.http import JsonResponse
 from django.views.decorators.http import require_POST
 
 from .models import Review, ReviewResponse
 from listings.models import Listing
+from Micu_market.db_router import read_from_replica
+from Micu_market.query_budget import query_budget
 from .forms import ReviewForm, ReviewResponseForm
 
 User = get_user_model()
 
+@query_budget(10)
+@read_from_replica
 def user_reviews_view(request, username):
     """Afișează toate review-urile pentru un utilizator"""
     user = get_object_or_404(User, username=username)
@@ -23,20 +27,15 @@ def user_reviews_view(request, username):
         is_approved=True
     ).select_related('reviewer', 'listing').prefetch_related('response').order_by('-created_at')
     
-    # Statistici
-    total_reviews = reviews.count()
-    if total_reviews > 0:
-        avg_rating = reviews.aggregate(avg=Avg('rating'))['avg']
-        rating_distribution = {
-            5: reviews.filter(rating=5).count(),
-            4: reviews.filter(rating=4).count(),
-            3: reviews.filter(rating=3).count(),
-            2: reviews.filter(rating=2).count(),
-            1: reviews.filter(rating=1).count(),
-        }
-    else:
-        avg_rating = 0
-        rating_distribution = {5: 0, 4: 0, 3: 0, 2: 0, 1: 0}
+    # Statistici, dintr-o singură interogare
+    stats = reviews.aggregate(
+        total=Count('id'),
+        avg=Avg('rating'),
+        **{f'rating_{stars}': Count('id', filter=Q(rating=stars)) for stars in range(1, 6)},
+    )
+    total_reviews = stats['total']
+    avg_rating = stats['avg'] or 0
+    rating_distribution = {stars: stats[f'rating_{stars}'] for stars in range(5, 0, -1)}
     
     # Paginare
     paginator = Paginator(reviews, 10)
@@ -183,6 +182,7 @@ def reviews_stats_api(request, username):
         'rating_distribution': rating_distribution
     })
 
+@query_budget(7)
 def my_reviews_view(request):
     """Review-urile pe care le-am lăsat eu"""
     if not request.user.is_authenticated:
@@ -190,7 +190,7 @@ def my_reviews_view(request):
     
     reviews = Review.objects.filter(
         reviewer=request.user
-    ).select_related('reviewed_user', 'listing').order_by('-created_at')
+    ).select_related('reviewed_user__profile', 'listing', 'response').order_by('-created_at')
     
     paginator = Paginator(reviews, 10)
     page_number = request.GET.get('page')
@@ -1,6 +1,17 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def install_search_schema_after_migrate(sender, using, **kwargs):
+    from .engines import install_search_schema, install_trigram_indexes
+    install_search_schema(using=using)
+    install_trigram_indexes(using=using)
 
 
 class SearchConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'search'
+
+    def ready(self):
+        # PostgreSQL-only DDL (text search config, trigger, GIN and trigram indexes), skipped on other databases
+        post_migrate.connect(install_search_schema_after_migrate, sender=self)
@@ -0,0 +1,147 @@
+import logging
+
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class BaseSearchEngine:
+    """Filters a Listing queryset by a user query and annotates a `rank`."""
+
+    def search(self, queryset, query):
+        raise NotImplementedError
+
+
+class PostgresSearchEngine(BaseSearchEngine):
+    """Full-text search over Listing.search_vector (title weight A, description weight B)."""
+
+    def __init__(self, config=None):
+        self.config = config or getattr(settings, 'SEARCH_CONFIG', 'ro_unaccent')
+
+    def search(self, queryset, query):
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+        from django.db.models import F
+
+        search_query = SearchQuery(query, config=self.config, search_type='websearch')
+        return queryset.filter(search_vector=search_query).annotate(
+            rank=SearchRank(F('search_vector'), search_query)
+        ).order_by('-rank', '-created_at')
+
+
+class SimpleSearchEngine(BaseSearchEngine):
+    """Substring fallback for SQLite and tests: every word must match, title hits rank first."""
+
+    def search(self, queryset, query):
+        words = query.split()
+        if not words:
+            return queryset.none()
+        for word in words:
+            queryset = queryset.filter(Q(title__icontains=word) | Q(description__icontains=word))
+        return queryset.annotate(
+            rank=Case(
+                When(title__icontains=query, then=Value(2)),
+                default=Value(1),
+                output_field=IntegerField(),
+            )
+        ).order_by('-rank', '-created_at')
+
+
+def get_search_engine():
+    engine = getattr(settings, 'SEARCH_ENGINE', None)
+    if engine:
+        return import_string(engine)()
+    if connection.vendor == 'postgresql':
+        return PostgresSearchEngine()
+    return SimpleSearchEngine()
+
+
+# ======================
+# PostgreSQL schema (applied after migrate)
+# ======================
+SEARCH_VECTOR_SQL = (
+    "setweight(to_tsvector('{config}', coalesce({row}.title, '')), 'A') || "
+    "setweight(to_tsvector('{config}', coalesce({row}.description, '')), 'B')"
+)
+
+
+def install_search_schema(using='default', config=None):
+    """Create the text search config, the trigger that maintains search_vector and its GIN index."""
+    config = config or getattr(settings, 'SEARCH_CONFIG', 'ro_unaccent')
+    db = connections[using]
+    if db.vendor != 'postgresql':
+        return
+
+    with db.cursor() as cursor:
+        has_unaccent = True
+        try:
+            with transaction.atomic(using=using):
+                cursor.execute("CREATE EXTENSION IF NOT EXISTS unaccent")
+        except Exception as exc:
+            # needs postgresql-contrib; search still works, only accent-sensitive
+            has_unaccent = False
+            logger.warning("unaccent extension unavailable, %s will not strip diacritics: %s", config, exc)
+
+        cursor.execute("SELECT 1 FROM pg_ts_config WHERE cfgname = %s", [config])
+        if cursor.fetchone() is None:
+            cursor.execute(f"CREATE TEXT SEARCH CONFIGURATION {config} (COPY = romanian)")
+            if has_unaccent:
+                cursor.execute(
+                    f"ALTER TEXT SEARCH CONFIGURATION {config} "
+                    f"ALTER MAPPING FOR hword, hword_part, word WITH unaccent, romanian_stem"
+                )
+
+        cursor.execute(f"""
+            CREATE OR REPLACE FUNCTION listings_listing_search_vector_update() RETURNS trigger AS $$
+            BEGIN
+                NEW.search_vector := {SEARCH_VECTOR_SQL.format(config=config, row='NEW')};
+                RETURN NEW;
+            END
+            $$ LANGUAGE plpgsql
+        """)
+        cursor.execute("DROP TRIGGER IF EXISTS listings_listing_search_vector_trigger ON listings_listing")
+        cursor.execute("""
+            CREATE TRIGGER listings_listing_search_vector_trigger
+            BEFORE INSERT OR UPDATE OF title, description, search_vector ON listings_listing
+            FOR EACH ROW EXECUTE FUNCTION listings_listing_search_vector_update()
+        """)
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS listings_listing_search_vector_gin "
+            "ON listings_listing USING gin (search_vector)"
+        )
+        # backfill rows written before the trigger existed
+        cursor.execute(
+            f"UPDATE listings_listing SET search_vector = {SEARCH_VECTOR_SQL.format(config=config, row='listings_listing')} "
+            f"WHERE search_vector IS NULL"
+        )
+
+
+# trigram indexes serving city/title icontains, which Django compiles to UPPER(col::text) LIKE UPPER(%s)
+TRIGRAM_INDEXES = {
+    'listing_city_trgm_idx': 'city',
+    'listing_title_trgm_idx': 'title',
+}
+
+
+def install_trigram_indexes(using='default'):
+    db = connections[using]
+    if db.vendor != 'postgresql':
+        return
+
+    with db.cursor() as cursor:
+        try:
+            with transaction.atomic(using=using):
+                cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        except Exception as exc:
+            logger.warning("pg_trgm extension unavailable, substring filters will not be indexed: %s", exc)
+            return
+
+        # outside a transaction build them without blocking writes on a big table
+        concurrently = '' if db.in_atomic_block else 'CONCURRENTLY '
+        for name, column in TRIGRAM_INDEXES.items():
+            cursor.execute(
+                f"CREATE INDEX {concurrently}IF NOT EXISTS {name} "
+                f"ON listings_listing USING gin ((UPPER({column}::text)) gin_trgm_ops)"
+            )
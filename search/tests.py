@@ -1,3 +1,51 @@
-from django.test import TestCase
+from datetime import timedelta
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from listings.models import Listing
+from .engines import SimpleSearchEngine
+
+User = get_user_model()
+
+
+@override_settings(SIMILAR_LISTINGS={'MODE': 'queue'})
+class SimpleSearchEngineTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('seller', 'seller@example.com', 'parola-test-123')
+        self.engine = SimpleSearchEngine()
+        now = timezone.now()
+        self.in_title = self.create('Bicicleta de oras', 'Cadru de aluminiu.', now - timedelta(days=3))
+        self.in_description = self.create('Trotineta', 'Merge mai bine ca o bicicleta de oras.', now - timedelta(days=1))
+        self.words_apart = self.create('Oras nou, bicicleta veche', 'Cadru de otel.', now - timedelta(days=2))
+        self.other = self.create('Canapea', 'Trei locuri.', now)
+
+    def create(self, title, description, created_at):
+        listing = Listing.objects.create(title=title, description=description, price=100, city='Cluj-Napoca', owner=self.owner)
+        Listing.objects.filter(pk=listing.pk).update(created_at=created_at)
+        return listing
+
+    def search(self, query):
+        return list(self.engine.search(Listing.objects.all(), query))
+
+    def test_every_word_must_match_title_or_description(self):
+        self.assertEqual(set(self.search('aluminiu')), {self.in_title})
+        self.assertEqual(set(self.search('BICICLETA')), {self.in_title, self.in_description, self.words_apart})
+        self.assertEqual(set(self.search('bicicleta otel')), {self.words_apart})
+        self.assertEqual(self.search('bicicleta canapea'), [])
+
+    def test_title_matches_rank_first(self):
+        results = self.search('bicicleta de oras')
+        # the phrase in the title ranks 2, the rest 1, then newest first
+        self.assertEqual(results, [self.in_title, self.in_description, self.words_apart])
+        self.assertEqual([listing.rank for listing in results], [2, 1, 1])
+
+        results = self.search('bicicleta oras')
+        self.assertEqual(results, [self.in_description, self.words_apart, self.in_title])
+        self.assertEqual({listing.rank for listing in results}, {1})
+
+    def test_empty_query_matches_nothing(self):
+        for query in ('', '   ', '\t\n'):
+            with self.subTest(query=query):
+                self.assertEqual(self.search(query), [])
@@ -1,9 +1,23 @@
 from django.shortcuts import render
+from django.core.paginator import Paginator
+from listings.models import Listing
+from .engines import get_search_engine
 
 # Create your views here.
 
 def search_view(request):
-	context = {}
+	query = request.GET.get('q', '').strip()
+	page_obj = None
+	if query:
+		listings = Listing.objects.filter(status='active').select_related('category', 'owner')
+		results = get_search_engine().search(listings, query)
+		paginator = Paginator(results, 12)
+		page_obj = paginator.get_page(request.GET.get('page'))
+
+	context = {
+		'query': query,
+		'page_obj': page_obj,
+	}
 	return render(request, 'search/search.html', context)
 
 def advanced_search_view(request):
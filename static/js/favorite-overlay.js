@@ -0,0 +1,20 @@
+// Mark the current user's favorites on listing cards.
+// The cards themselves come from a shared cache, so this is the per-user part.
+document.addEventListener('DOMContentLoaded', function() {
+    const data = document.getElementById('favorite-listing-ids');
+    if (!data) {
+        return;
+    }
+    
+    const favoriteIds = new Set(JSON.parse(data.textContent));
+    document.querySelectorAll('.listing-card[data-listing-id]').forEach(card => {
+        if (!favoriteIds.has(Number(card.dataset.listingId))) {
+            return;
+        }
+        card.classList.add('favorited');
+        const image = card.querySelector('.listing-image');
+        if (image) {
+            image.insertAdjacentHTML('beforeend', '<span class="favorite-badge" title="În favorite"><i class="fas fa-heart"></i></span>');
+        }
+    });
+});